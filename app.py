@@ -1,15 +1,26 @@
 from flask import Flask, render_template, request, redirect, url_for, flash
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import os
 from werkzeug.security import generate_password_hash, check_password_hash
 
 from config import config
-from models import db, User, Domain, EmailTest
+from models import db, User, Domain, EmailTest, AnalysisCache, KeywordOverlay
 from utils.email_tester import EmailTester
 from utils.spam_checker import SpamChecker
+from utils.blocklist import DEFAULT_DOMAIN_BLOCKLISTS, DomainBlocklistChecker, parse_zones
 from utils.deliverability import DeliverabilityAnalyzer
+from utils.dns_resolver import AsyncDNSResolver
+from utils.classifier import NaiveBayesModel
+from utils.instrumentation import METRICS
+from utils.ip_reputation import DEFAULT_IP_BLOCKLISTS, IPBlocklistChecker, IPReputationChecker
+from utils.pipeline import AnalysisPipeline
+from utils.result_cache import ResultCache, DatabaseCacheBackend
+from utils.rule_pack import RulePackManager
+from utils.snapshot import load_or_build
+from utils.tenant_rules import TenantRulePacks
 
 app = Flask(__name__)
 config_name = os.getenv('FLASK_CONFIG') or 'development'
@@ -32,9 +43,56 @@ login_manager = LoginManager()
 login_manager.init_app(app)
 login_manager.login_view = 'login'
 
-email_tester = EmailTester()
-spam_checker = SpamChecker()
-deliverability_analyzer = DeliverabilityAnalyzer()
+# Compiled rules come from the prebuilt snapshot when it is current (python -m utils.snapshot build)
+compiled_rules, snapshot_info = load_or_build(
+    app.config['ANALYSIS_SNAPSHOT'], app.config['RULE_PACK_PATH'], app.config['SPAMASSASSIN_RULES']
+)
+rule_pack = RulePackManager(
+    app.config['RULE_PACK_PATH'], app.config['RULE_PACK_CHECK_INTERVAL'], pack=compiled_rules['rule_pack']
+)
+# Rule packs with enterprise keyword overlays, compiled once per (tenant, overlay version)
+tenant_rule_packs = TenantRulePacks(rule_pack, KeywordOverlay, max_size=app.config['TENANT_RULES_CACHE_SIZE'])
+email_tester = EmailTester(
+    instrument=app.config['ANALYSIS_INSTRUMENTATION'],
+    rules=rule_pack,
+    time_budget=app.config['SPAM_CHECK_TIME_BUDGET']
+)
+spam_checker = SpamChecker(
+    time_budget=app.config['SPAM_CHECK_TIME_BUDGET'],
+    instrument=app.config['ANALYSIS_INSTRUMENTATION'],
+    rules=rule_pack
+)
+# One resolver (and DNS cache) shared by every domain check
+dns_resolver = AsyncDNSResolver(app.config['DNS_NAMESERVERS'] or None, timeout=app.config['DNS_TIMEOUT'])
+domain_blocklists = DomainBlocklistChecker(dns_resolver, parse_zones(
+    app.config['DOMAIN_BLOCKLISTS'] or DEFAULT_DOMAIN_BLOCKLISTS, timeout=app.config['BLOCKLIST_TIMEOUT']
+))
+ip_blocklists = IPBlocklistChecker(dns_resolver, parse_zones(
+    app.config['IP_BLOCKLISTS'] or DEFAULT_IP_BLOCKLISTS, timeout=app.config['BLOCKLIST_TIMEOUT']
+))
+deliverability_analyzer = DeliverabilityAnalyzer(
+    dns_resolver, blocklists=domain_blocklists,
+    ip_reputation=IPReputationChecker(dns_resolver, ip_blocklists, app.config['IP_REPUTATION_CONCURRENCY'])
+)
+analysis_cache = ResultCache(
+    max_size=app.config['ANALYSIS_CACHE_SIZE'],
+    ttl=app.config['ANALYSIS_CACHE_TTL'],
+    backend=DatabaseCacheBackend(db, AnalysisCache)
+)
+spam_classifier = None
+if app.config['SPAM_CLASSIFIER_MODEL']:
+    try:
+        spam_classifier = NaiveBayesModel.load(app.config['SPAM_CLASSIFIER_MODEL'])
+    except (OSError, ValueError) as e:
+        print(f"Error loading spam classifier: {str(e)}")
+analysis_pipeline = AnalysisPipeline(
+    email_tester, spam_checker, deliverability_analyzer, cache=analysis_cache, classifier=spam_classifier,
+    spamassassin=compiled_rules['spamassassin'],
+    spamassassin_time_budget=app.config['SPAM_CHECK_TIME_BUDGET'],
+    classifier_time_budget=app.config['SPAM_CHECK_TIME_BUDGET'],
+    executor=ThreadPoolExecutor(max_workers=app.config['ANALYSIS_WORKERS'], thread_name_prefix='analysis'),
+    stage_timeout=app.config['ANALYSIS_STAGE_TIMEOUT']
+)
 
 @login_manager.user_loader
 def load_user(user_id):
@@ -154,16 +212,108 @@ def dashboard():
                            tests_this_month=tests_this_month,
                            tests_remaining=tests_remaining)
 
-@app.route('/spam-check')
+@app.route('/spam-check', methods=['GET', 'POST'])
 @login_required
 def spam_checker_page():
-    return render_template('spam_checker.html')
+    if request.method == 'GET':
+        return render_template('spam_checker.html')
+
+    max_tests = current_user.get_plan_limits()['max_tests_per_month']
+    if max_tests != -1 and current_user.tests_this_month() >= max_tests:
+        flash('You have used all of your tests for this month. Upgrade your plan to run more.')
+        return redirect(url_for('dashboard'))
+
+    subject = request.form.get('subject', '')
+    sender_email = request.form.get('sender_email', '')
+    html_content = request.form.get('html_content', '')
+    text_content = request.form.get('text_content', '')
+
+    # The user's plan and own keyword overlays apply to their checks
+    results = analysis_pipeline.run(
+        subject, sender_email, html_content, text_content, rules=tenant_rule_packs.for_user(current_user)
+    )
+    test_results = results['test_results']
+    spam_results = results['spam_results']
+    if test_results is None or spam_results is None:
+        flash('Analysis timed out, please try again')
+        return render_template('spam_checker.html'), 503
+
+    try:
+        email_test = EmailTest(
+            user_id=current_user.id,
+            subject=subject,
+            sender_email=sender_email,
+            html_content=html_content,
+            text_content=text_content,
+            overall_score=test_results['overall_score'],
+            spam_score=spam_results['spam_score'],
+            delivery_rate=test_results['delivery_rate'],
+            status='completed',
+            completed_at=datetime.utcnow()
+        )
+        email_test.set_provider_results(test_results['provider_results'])
+        email_test.set_spam_factors(test_results['spam_factors'])
+        db.session.add(email_test)
+        db.session.commit()
+        results['test_id'] = email_test.id
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error saving email test: {str(e)}")
+
+    return render_template('spam_checker.html', results=results)
 
 @app.route('/inbox-test')
 @login_required
 def inbox_test_page():
     return render_template('inbox_test.html')
 
+@app.route('/analysis-metrics')
+@login_required
+def analysis_metrics():
+    pack = rule_pack.current
+    return {
+        'instrumentation_enabled': app.config['ANALYSIS_INSTRUMENTATION'],
+        'rules': METRICS.snapshot(),
+        'rule_pack': {'name': pack.name, 'version': pack.version},
+        'cold_start': snapshot_info,
+        'cache': analysis_cache.stats(),
+        'dns': dns_resolver.stats(),
+        'spf': deliverability_analyzer.spf.stats(),
+        'blocklists': domain_blocklists.stats(),
+        'ip_blocklists': ip_blocklists.stats(),
+        'tenant_rules': tenant_rule_packs.stats()
+    }
+
+@app.route('/keyword-overlay', methods=['GET', 'POST'])
+@login_required
+def keyword_overlay():
+    if not current_user.get_plan_limits().get('custom_keywords'):
+        return {'status': 'error', 'message': 'Custom keywords are not available on your plan'}, 403
+
+    overlay = KeywordOverlay.query.filter_by(user_id=current_user.id).first()
+    if request.method == 'POST':
+        keywords = request.get_json(silent=True)
+        tiers = rule_pack.current.spam_keywords
+        if not isinstance(keywords, dict) or any(
+            tier not in tiers or not isinstance(phrases, list) for tier, phrases in keywords.items()
+        ):
+            return {'status': 'error', 'message': f"Send a JSON object mapping {', '.join(tiers)} to lists of phrases"}, 400
+
+        cleaned = {tier: [str(phrase).strip() for phrase in phrases if str(phrase).strip()]
+                   for tier, phrases in keywords.items()}
+        if overlay is None:
+            overlay = KeywordOverlay(user_id=current_user.id)
+            db.session.add(overlay)
+        overlay.set_keywords(cleaned)
+        db.session.commit()
+        tenant_rule_packs.invalidate(current_user.id)
+
+    return {
+        'status': 'success',
+        'keywords': overlay.get_keywords() if overlay else {},
+        'version': overlay.version if overlay else 0
+    }
+
 def init_db():
     with app.app_context():
         db.create_all()  # This will create all tables
@@ -186,9 +336,10 @@ def internal_error(e):
 def init_app():
     try:
         with app.app_context():
-            # Check if tables exist first
+            # Create any missing tables, including ones added since the
+            # database was first set up; existing tables are left alone
             inspector = db.inspect(db.engine)
-            if not inspector.get_table_names():
+            if set(db.metadata.tables) - set(inspector.get_table_names()):
                 db.create_all()
         return app
     except Exception as e:
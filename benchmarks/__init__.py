@@ -0,0 +1 @@
+# Email Deliverability Pro analyzer benchmarks
@@ -0,0 +1,44 @@
+"""
+Benchmark the analyzers on a seeded synthetic corpus.
+
+    python -m benchmarks --sizes 1K,100K,1M --output bench.json
+    python -m benchmarks --sizes 1K,100K,1M --compare bench.json
+"""
+import argparse
+
+from benchmarks.corpus import KINDS, CorpusGenerator, parse_size
+from benchmarks.runner import compare_reports, format_report, load_report, run_suite, save_report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the email analyzers')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--kinds', default=','.join(KINDS), help='comma-separated corpus kinds')
+    parser.add_argument('--sizes', default='1K,10K,100K,1M', help='comma-separated sizes, up to 10M')
+    parser.add_argument('--count', type=int, default=5, help='messages per kind and size')
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--output', help='write the JSON report to this path')
+    parser.add_argument('--compare', help='JSON report from an earlier run to compare against')
+    args = parser.parse_args(argv)
+
+    generator = CorpusGenerator(args.seed)
+    kinds = [kind.strip() for kind in args.kinds.split(',') if kind.strip()]
+    sizes = [parse_size(size) for size in args.sizes.split(',') if size.strip()]
+
+    report = run_suite(generator, kinds, sizes, count=args.count, repeat=args.repeat)
+    print(format_report(report))
+
+    if args.compare:
+        print()
+        print(f"{'analyzer':<38} {'kind':<14} {'size':>10} {'p50 x':>8} {'ops/s x':>8} {'mem x':>8}")
+        for row in compare_reports(load_report(args.compare), report):
+            print(f"{row['analyzer']:<38} {row['kind']:<14} {row['size']:>10} "
+                  f"{row['p50_ratio']!s:>8} {row['throughput_ratio']!s:>8} {row['peak_memory_ratio']!s:>8}")
+
+    if args.output:
+        save_report(report, args.output)
+        print(f"\nSaved report to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
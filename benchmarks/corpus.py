@@ -0,0 +1,108 @@
+import random
+
+KINDS = ('plain', 'link_heavy', 'image_heavy', 'keyword_dense', 'pathological')
+
+WORDS = [
+    'account', 'update', 'team', 'product', 'release', 'weekly', 'customer', 'thanks',
+    'report', 'meeting', 'schedule', 'details', 'support', 'feature', 'review', 'project',
+    'summary', 'invoice', 'shipping', 'order', 'welcome', 'newsletter', 'event', 'today'
+]
+
+SPAM_PHRASES = [
+    'FREE', 'ACT NOW', 'LIMITED TIME', 'GUARANTEED', 'WINNER', 'CLICK HERE', 'BUY NOW',
+    'DISCOUNT', 'free trial', 'risk free', 'no cost', '50% off', '$99'
+]
+
+SUBJECTS = [
+    'Your weekly update', 'Quarterly report is ready', 'Welcome to the team',
+    'FREE gift inside!!!', 'ACT NOW - LIMITED TIME OFFER', 'Invoice #4821',
+    'Meeting notes and next steps', 'CONGRATULATIONS WINNER'
+]
+
+
+def parse_size(value):
+    """Turn '1K', '250KB', '10M' or '4096' into a byte count."""
+    text = str(value).strip().upper().rstrip('B')
+    multiplier = 1
+    if text.endswith('K'):
+        multiplier, text = 1024, text[:-1]
+    elif text.endswith('M'):
+        multiplier, text = 1024 * 1024, text[:-1]
+    return int(float(text) * multiplier)
+
+
+class CorpusGenerator:
+    """Seeded generator of realistic and adversarial test emails.
+
+    The same seed always yields the same corpus, so benchmark runs from
+    different versions measure identical input.
+    """
+
+    def __init__(self, seed=0):
+        self.seed = seed
+        self.random = random.Random(seed)
+
+    def _sentence(self, spam_rate=0.0):
+        words = []
+        for _ in range(self.random.randint(6, 14)):
+            if spam_rate and self.random.random() < spam_rate:
+                words.append(self.random.choice(SPAM_PHRASES))
+            else:
+                words.append(self.random.choice(WORDS))
+        return ' '.join(words).capitalize() + '.'
+
+    def _fill(self, size, block):
+        parts = ['<html><body>']
+        length = len(parts[0])
+        while length < size:
+            piece = block()
+            parts.append(piece)
+            length += len(piece)
+        parts.append('</body></html>')
+        return ''.join(parts)
+
+    def _html(self, kind, size):
+        if kind == 'plain':
+            return self._fill(size, lambda: f'<p>{self._sentence()}</p>\n')
+        if kind == 'link_heavy':
+            return self._fill(size, lambda: (
+                f'<p>{self._sentence()} <a href="https://example.com/{self.random.randint(0, 99999)}">'
+                f'{self.random.choice(WORDS)}</a></p>\n'
+            ))
+        if kind == 'image_heavy':
+            return self._fill(size, lambda: (
+                f'<img src="https://cdn.example.com/{self.random.randint(0, 99999)}.png" width="600">'
+                f'<img src="data:image/png;base64,{"A" * self.random.randint(200, 2000)}">\n'
+            ))
+        if kind == 'keyword_dense':
+            return self._fill(size, lambda: f'<p>{self._sentence(spam_rate=0.4)}</p>\n')
+        if kind == 'pathological':
+            return self._fill(size, self._pathological_block)
+        raise ValueError(f"Unknown corpus kind: {kind}")
+
+    def _pathological_block(self):
+        choice = self.random.randint(0, 4)
+        if choice == 0:
+            return '9' * self.random.randint(500, 5000)
+        if choice == 1:
+            return '<div>' * 200 + 'x' + '</div>' * 50
+        if choice == 2:
+            return '<span style="' + 'color: white;' * 300 + '">'
+        if choice == 3:
+            return 'free' + ' ' * self.random.randint(500, 5000)
+        return '<a ' + 'x' * self.random.randint(500, 5000)
+
+    def message(self, kind='plain', size=1024):
+        html_content = self._html(kind, size)
+        return {
+            'subject': self.random.choice(SUBJECTS),
+            'sender_email': f'news@{self.random.choice(WORDS)}.example.com',
+            'html_content': html_content,
+            'text_content': self._sentence()
+        }
+
+    def messages(self, kind='plain', size=1024, count=10):
+        return [self.message(kind, size) for _ in range(count)]
+
+    def domains(self, count=10):
+        return [f'{self.random.choice(WORDS)}{index}.example.com' for index in range(count)]
@@ -0,0 +1,159 @@
+import json
+import platform
+import subprocess
+import time
+import tracemalloc
+from datetime import datetime
+
+from utils.deliverability import DeliverabilityAnalyzer
+from utils.dns_resolver import AsyncDNSResolver
+from utils.dns_stub import StubDNSServer
+from utils.email_tester import EmailTester
+from utils.pipeline import AnalysisPipeline
+from utils.spam_checker import SpamChecker
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def measure(function, inputs, repeat=1):
+    """Time ``function(item)`` over ``inputs`` and report latency, throughput and peak memory.
+
+    Latency and memory are measured in separate passes because tracemalloc
+    slows down every allocation and would distort the timings.
+    """
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for item in inputs:
+            call_started = time.perf_counter()
+            function(item)
+            latencies.append(time.perf_counter() - call_started)
+    elapsed = time.perf_counter() - started
+
+    tracemalloc.start()
+    peak = 0
+    for item in inputs:
+        tracemalloc.reset_peak()
+        function(item)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+    tracemalloc.stop()
+
+    return {
+        'calls': len(latencies),
+        'throughput_per_sec': round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+        'max_ms': round(max(latencies) * 1000, 3) if latencies else 0.0,
+        'peak_memory_kb': round(peak / 1024, 1)
+    }
+
+
+def content_analyzers():
+    spam_checker = SpamChecker()
+    email_tester = EmailTester()
+    # Both analyzers as stages over one parsed document, without a result cache
+    pipeline = AnalysisPipeline(email_tester, spam_checker)
+    return {
+        'spam_checker.check_content': lambda message: spam_checker.check_content(
+            message['subject'], message['html_content'], message['text_content']),
+        'email_tester.analyze_email': lambda message: email_tester.analyze_email(
+            message['subject'], message['sender_email'], message['html_content'], message['text_content']),
+        'pipeline.run': lambda message: pipeline.run(
+            message['subject'], message['sender_email'], message['html_content'], message['text_content']),
+    }
+
+
+def domain_zone(domains):
+    """Stub DNS records for the benchmark domains, so the run needs no network access."""
+    zone = {}
+    for domain in domains:
+        zone[domain] = {'TXT': ['v=spf1 mx -all'], 'MX': [f'10 mail.{domain}.']}
+        zone[f'default._domainkey.{domain}'] = {'TXT': ['v=DKIM1; k=rsa; p=MIGfMA0GCSqGSIb3DQEBAQUAA4GNADCBiQKBgQC']}
+        zone[f'_dmarc.{domain}'] = {'TXT': ['v=DMARC1; p=quarantine']}
+    return zone
+
+
+def run_suite(generator, kinds, sizes, count=5, repeat=1, domain_count=20):
+    """Run every analyzer over every (kind, size) corpus and return a report dict."""
+    report = {
+        'created_at': datetime.utcnow().isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'commit': current_commit(),
+        'seed': generator.seed,
+        'results': []
+    }
+
+    for kind in kinds:
+        for size in sizes:
+            messages = generator.messages(kind, size, count)
+            for name, function in content_analyzers().items():
+                stats = measure(function, messages, repeat)
+                stats.update({'analyzer': name, 'kind': kind, 'size': size})
+                report['results'].append(stats)
+
+    domains = generator.domains(domain_count)
+    with StubDNSServer(domain_zone(domains)) as server:
+        deliverability_analyzer = DeliverabilityAnalyzer(AsyncDNSResolver(['127.0.0.1'], port=server.port))
+        stats = measure(deliverability_analyzer.analyze_domain_health, domains, repeat)
+    stats.update({'analyzer': 'deliverability.analyze_domain_health', 'kind': 'domain', 'size': 0})
+    report['results'].append(stats)
+
+    return report
+
+
+def current_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def save_report(report, path):
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2)
+
+
+def load_report(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def compare_reports(baseline, current):
+    """Pair up results by (analyzer, kind, size) and return p50/throughput ratios."""
+    previous = {(r['analyzer'], r['kind'], r['size']): r for r in baseline['results']}
+    comparison = []
+    for result in current['results']:
+        before = previous.get((result['analyzer'], result['kind'], result['size']))
+        if before is None:
+            continue
+        comparison.append({
+            'analyzer': result['analyzer'],
+            'kind': result['kind'],
+            'size': result['size'],
+            'p50_ratio': round(result['p50_ms'] / before['p50_ms'], 3) if before['p50_ms'] else None,
+            'throughput_ratio': round(result['throughput_per_sec'] / before['throughput_per_sec'], 3)
+            if before['throughput_per_sec'] else None,
+            'peak_memory_ratio': round(result['peak_memory_kb'] / before['peak_memory_kb'], 3)
+            if before['peak_memory_kb'] else None
+        })
+    return comparison
+
+
+def format_report(report):
+    lines = [f"{'analyzer':<38} {'kind':<14} {'size':>10} {'ops/s':>10} {'p50 ms':>10} {'p99 ms':>10} {'peak KB':>10}"]
+    for r in report['results']:
+        lines.append(
+            f"{r['analyzer']:<38} {r['kind']:<14} {r['size']:>10} {r['throughput_per_sec']:>10} "
+            f"{r['p50_ms']:>10} {r['p99_ms']:>10} {r['peak_memory_kb']:>10}"
+        )
+    return '\n'.join(lines)
@@ -27,6 +27,53 @@ class Config:
     MAX_TESTS_PER_HOUR = 10
     MAX_TESTS_PER_DAY = 50
 
+    # CPU seconds a single spam check may spend before expensive rules are skipped
+    SPAM_CHECK_TIME_BUDGET = float(os.environ.get('SPAM_CHECK_TIME_BUDGET', 0.5))
+
+    # Per-rule timing instrumentation for SpamChecker and EmailTester
+    ANALYSIS_INSTRUMENTATION = os.environ.get('ANALYSIS_INSTRUMENTATION', '').lower() in ('1', 'true', 'yes')
+
+    # Rule pack with spam keywords, patterns and weights (defaults to utils/rules/default.json);
+    # the file is re-read when it changes, checked at most every RULE_PACK_CHECK_INTERVAL seconds
+    RULE_PACK_PATH = os.environ.get('RULE_PACK_PATH')
+    RULE_PACK_CHECK_INTERVAL = float(os.environ.get('RULE_PACK_CHECK_INTERVAL', 2))
+
+    # Precompiled rules built by `python -m utils.snapshot build`; rebuilt from source when missing or stale
+    ANALYSIS_SNAPSHOT = os.environ.get('ANALYSIS_SNAPSHOT', 'analysis.snapshot')
+
+    # Compiled rule packs with tenant keyword overlays kept in memory
+    TENANT_RULES_CACHE_SIZE = int(os.environ.get('TENANT_RULES_CACHE_SIZE', 256))
+
+    # Analysis stages run concurrently on a shared thread pool; a stage slower than
+    # ANALYSIS_STAGE_TIMEOUT seconds is reported as timed out instead of awaited
+    ANALYSIS_WORKERS = int(os.environ.get('ANALYSIS_WORKERS', 8))
+    ANALYSIS_STAGE_TIMEOUT = float(os.environ.get('ANALYSIS_STAGE_TIMEOUT', 5))
+
+    # DNS servers for domain health checks (comma-separated; defaults to the system resolver)
+    # and the seconds a single lookup may take
+    DNS_NAMESERVERS = [server.strip() for server in os.environ.get('DNS_NAMESERVERS', '').split(',') if server.strip()]
+    DNS_TIMEOUT = float(os.environ.get('DNS_TIMEOUT', 2))
+
+    # Domain blocklist zones ('zone' or 'zone:warning', comma-separated; defaults to
+    # utils.blocklist.DEFAULT_DOMAIN_BLOCKLISTS) and the seconds each zone may take to answer
+    DOMAIN_BLOCKLISTS = os.environ.get('DOMAIN_BLOCKLISTS')
+    BLOCKLIST_TIMEOUT = float(os.environ.get('BLOCKLIST_TIMEOUT', 1.5))
+
+    # IP blocklist zones for sending-IP reputation (same format; defaults to
+    # utils.ip_reputation.DEFAULT_IP_BLOCKLISTS) and how many IPs are checked at once
+    IP_BLOCKLISTS = os.environ.get('IP_BLOCKLISTS')
+    IP_REPUTATION_CONCURRENCY = int(os.environ.get('IP_REPUTATION_CONCURRENCY', 64))
+
+    # Analysis Result Cache
+    ANALYSIS_CACHE_SIZE = int(os.environ.get('ANALYSIS_CACHE_SIZE', 1024))
+    ANALYSIS_CACHE_TTL = int(os.environ.get('ANALYSIS_CACHE_TTL', 24 * 3600))
+
+    # Trained naive Bayes model (python -m utils.classifier train); unset disables the stage
+    SPAM_CLASSIFIER_MODEL = os.environ.get('SPAM_CLASSIFIER_MODEL')
+
+    # SpamAssassin .cf rule file or directory of .cf files; unset disables the stage
+    SPAMASSASSIN_RULES = os.environ.get('SPAMASSASSIN_RULES')
+
     # Subscription Plans
     PLANS = {
         'starter': {
@@ -34,6 +81,7 @@ class Config:
             'price': 49,
             'max_domains': 5,
             'max_tests_per_month': 100,
+            'custom_keywords': False,
             'features': ['Basic reporting', 'Email support']
         },
         'professional': {
@@ -41,6 +89,7 @@ class Config:
             'price': 149,
             'max_domains': 25,
             'max_tests_per_month': 500,
+            'custom_keywords': False,
             'features': ['Advanced analytics', 'API access', 'Priority support']
         },
         'enterprise': {
@@ -48,7 +97,8 @@ class Config:
             'price': 399,
             'max_domains': -1,  # Unlimited
             'max_tests_per_month': -1,  # Unlimited
-            'features': ['Custom integrations', 'Dedicated support', 'White-label option']
+            'custom_keywords': True,
+            'features': ['Custom integrations', 'Custom spam keywords', 'Dedicated support', 'White-label option']
         }
     }
 
@@ -116,3 +116,28 @@ class EmailTest(db.Model):
             return {"class": "info", "text": "Fair"}
         else:
             return {"class": "danger", "text": "Poor"}
+
+class AnalysisCache(db.Model):
+    key = db.Column(db.String(64), primary_key=True)  # SHA-256 of message + rule-set version
+    result = db.Column(db.Text, nullable=False)       # JSON string
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+class KeywordOverlay(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    # An overlay belongs to one user, or to every user on a plan
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), unique=True, index=True)
+    plan = db.Column(db.String(20), unique=True, index=True)
+    keywords = db.Column(db.Text, nullable=False, default='{}')  # JSON string: {risk tier: [phrases]}
+    version = db.Column(db.Integer, nullable=False, default=1)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def get_keywords(self):
+        if self.keywords:
+            return json.loads(self.keywords)
+        return {}
+
+    def set_keywords(self, keywords):
+        # Bumping the version moves the tenant onto a new compiled-matcher cache entry
+        self.keywords = json.dumps(keywords)
+        self.version = (self.version or 0) + 1
@@ -0,0 +1,70 @@
+from utils.blocklist import DomainBlocklistChecker, parse_zones, stub_records
+from utils.dns_resolver import AsyncDNSResolver
+from utils.dns_stub import StubDNSServer
+
+LISTINGS = {'bl1.stub': ['bad.test'], 'bl2.stub': ['meh.test']}
+ZONES = 'bl1.stub,bl2.stub:warning,bl3.stub'
+
+
+def checker_for(server, zones=ZONES, timeout=1):
+    resolver = AsyncDNSResolver(['127.0.0.1'], port=server.port, timeout=3)
+    return DomainBlocklistChecker(resolver, parse_zones(zones, timeout=timeout))
+
+
+def test_listings_and_severity():
+    records = stub_records(LISTINGS)
+    # 127.0.0.1 is a refused query, not a listing
+    records['refused.test.bl3.stub'] = {'A': ['127.0.0.1']}
+    with StubDNSServer(records) as server:
+        checker = checker_for(server)
+        results = checker.resolver.run(checker.check_many(['bad.test', 'meh.test', 'clean.test', 'refused.test']))
+
+    bad, meh, clean, refused = results
+    assert bad['status'] == 'blacklisted'
+    assert bad['listed'] == [{'zone': 'bl1.stub', 'severity': 'blacklisted', 'codes': ['127.0.1.2']}]
+    assert meh['status'] == 'warning'
+    assert [listing['zone'] for listing in meh['listed']] == ['bl2.stub']
+    assert clean['status'] == 'clean'
+    assert clean['errors'] == []
+    assert refused['status'] == 'clean'
+    assert refused['errors'] == ['bl3.stub']
+
+
+def test_results_cached_per_zone():
+    with StubDNSServer(stub_records(LISTINGS)) as server:
+        checker = checker_for(server)
+        checker.resolver.run(checker.check_many(['bad.test', 'clean.test']))
+        queries = server.queries
+        results = checker.resolver.run(checker.check_many(['bad.test', 'clean.test']))
+
+        assert server.queries == queries
+
+    assert [result['status'] for result in results] == ['blacklisted', 'clean']
+    assert checker.stats()['listed'] == 1
+    assert checker.stats()['not_listed'] == 5
+
+
+def test_silent_zone_times_out_on_its_own():
+    silent = ['bad.test.bl3.stub', 'clean.test.bl3.stub']
+    with StubDNSServer(stub_records(LISTINGS), silent=silent) as server:
+        checker = checker_for(server, timeout=0.3)
+        bad, clean = checker.resolver.run(checker.check_many(['bad.test', 'clean.test']), timeout=2)
+
+    # The other zones still answer
+    assert bad['status'] == 'blacklisted'
+    assert bad['errors'] == ['bl3.stub']
+    assert clean['status'] == 'clean'
+    assert clean['errors'] == ['bl3.stub']
+    assert checker.timeouts == 2
+    # Timeouts are not cached as non-listings
+    assert checker.stats()['not_listed'] == 3
+
+
+def test_every_zone_timing_out_is_unknown():
+    with StubDNSServer(stub_records(LISTINGS), delay=1) as server:
+        checker = checker_for(server, timeout=0.2)
+        result = checker.resolver.run(checker.check('bad.test'), timeout=2)
+
+    assert result['status'] == 'unknown'
+    assert sorted(result['errors']) == ['bl1.stub', 'bl2.stub', 'bl3.stub']
+    assert checker.stats()['timeouts'] == 3
@@ -0,0 +1,38 @@
+import mmap
+from array import array
+
+import pytest
+
+from utils import classifier
+from utils.classifier import FORMAT_VERSION, HEADER, MAGIC, NaiveBayesModel
+
+
+def test_saved_model_round_trips(tmp_path):
+    path = tmp_path / 'model.bin'
+    NaiveBayesModel(array('f', [0.5] * 16), -0.25, feature_bits=4, spam_messages=3, ham_messages=5).save(path)
+
+    model = NaiveBayesModel.load(path)
+    assert (model.feature_bits, model.spam_messages, model.ham_messages, model.prior) == (4, 3, 5, -0.25)
+    assert model.log_odds(['FREE', 'MONEY']) == pytest.approx(0.75)
+    model.close()
+
+
+@pytest.mark.parametrize('contents, message', [
+    (b'', 'truncated'),
+    (MAGIC + b'\x01', 'truncated'),
+    (HEADER.pack(b'NOTMODEL', FORMAT_VERSION, 4, 0, 0, 0.0) + bytes(64), 'not a spam classifier model'),
+    (HEADER.pack(MAGIC, FORMAT_VERSION, 4, 0, 0, 0.0) + bytes(60), 'truncated'),
+])
+def test_malformed_files_raise_value_error(tmp_path, monkeypatch, contents, message):
+    path = tmp_path / 'model.bin'
+    path.write_bytes(contents)
+    mapped = []
+
+    class RecordingMmap(mmap.mmap):
+        def __init__(self, *args, **kwargs):
+            mapped.append(self)
+
+    monkeypatch.setattr(classifier.mmap, 'mmap', RecordingMmap)
+    with pytest.raises(ValueError, match=message):
+        NaiveBayesModel.load(path)
+    assert all(view.closed for view in mapped)
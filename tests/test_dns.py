@@ -0,0 +1,101 @@
+import asyncio
+
+from utils.blocklist import DomainBlocklistChecker, parse_zones
+from utils.deliverability import DeliverabilityAnalyzer
+from utils.dns_resolver import AsyncDNSResolver
+from utils.dns_stub import StubDNSServer
+
+ZONE = {
+    'good.test': {'TXT': ['v=spf1 mx -all', 'site-verification=abc'], 'MX': ['10 mx1.good.test.', '5 mx0.good.test.']},
+    'google._domainkey.good.test': {'TXT': ['v=DKIM1; k=rsa; p=MIIBIjANBg' + 'A' * 300]},
+    '_dmarc.good.test': {'TXT': ['v=DMARC1; p=reject; rua=mailto:dmarc@good.test']},
+    'weak.test': {'TXT': ['v=spf1 +all'], 'MX': ['0 .']},
+    's1._domainkey.weak.test': {'TXT': ['v=DKIM1; p=']},
+    '_dmarc.weak.test': {'TXT': ['v=DMARC1; p=none']},
+}
+
+
+def analyzer_for(server, timeout=1):
+    resolver = AsyncDNSResolver(['127.0.0.1'], port=server.port, timeout=timeout)
+    blocklists = DomainBlocklistChecker(resolver, parse_zones('bl.stub', timeout=timeout))
+    return DeliverabilityAnalyzer(resolver, dkim_selectors=('google', 's1'), blocklists=blocklists)
+
+
+def test_domain_health_parses_records():
+    with StubDNSServer(ZONE) as server:
+        health = analyzer_for(server).analyze_domain_health('good.test')
+
+    assert 'error' not in health
+    assert health['spf_status'] == 'valid'
+    assert health['spf_record'] == 'v=spf1 mx -all'
+    assert health['dkim_status'] == 'valid'
+    assert health['dkim_selectors'] == ['google']
+    assert health['dmarc_status'] == 'strict'
+    assert health['mx_records'] == [
+        {'priority': 5, 'exchange': 'mx0.good.test'},
+        {'priority': 10, 'exchange': 'mx1.good.test'}
+    ]
+    assert health['blacklist_status'] == 'clean'
+
+
+def test_domain_health_weak_and_missing_records():
+    with StubDNSServer(ZONE) as server:
+        analyzer = analyzer_for(server)
+        weak = analyzer.analyze_domain_health('weak.test')
+        missing = analyzer.analyze_domain_health('missing.test')
+
+    assert weak['spf_status'] == 'basic'
+    assert weak['dkim_status'] == 'partial'
+    assert weak['dmarc_status'] == 'basic'
+    # A null MX means the domain takes no mail
+    assert weak['mx_records'] == []
+
+    assert missing['spf_status'] == 'missing'
+    assert missing['dkim_status'] == 'missing'
+    assert missing['dmarc_status'] == 'missing'
+    assert missing['mx_records'] == []
+
+
+def test_unanswered_lookups_are_unknown():
+    with StubDNSServer(ZONE, silent=['slow.test', '_dmarc.slow.test']) as server:
+        resolver = AsyncDNSResolver(['127.0.0.1'], port=server.port, timeout=0.3)
+        results = resolver.run(DeliverabilityAnalyzer(resolver, dkim_selectors=()).check_dns('slow.test'))
+
+    assert results['spf_status'] == 'unknown'
+    assert results['dmarc_status'] == 'unknown'
+    # Errors are not cached, so the next check asks again
+    assert resolver.cache.get(('slow.test', 'TXT')) is None
+
+
+def test_negative_answers_cached_for_soa_ttl():
+    with StubDNSServer(ZONE, negative_ttl=30) as server:
+        resolver = AsyncDNSResolver(['127.0.0.1'], port=server.port, timeout=1)
+        nxdomain = resolver.run(resolver.query('absent.test', 'TXT'))
+        nodata = resolver.run(resolver.query('good.test', 'A'))
+        queries = server.queries
+        again = resolver.run(resolver.query('absent.test', 'TXT'))
+
+        assert server.queries == queries
+
+    assert nxdomain.status == 'nxdomain'
+    assert nodata.status == 'nodata'
+    assert nxdomain.ttl == 30
+    assert nodata.ttl == 30
+    assert again == nxdomain
+
+
+def test_concurrent_lookups_share_one_query():
+    with StubDNSServer(ZONE, delay=0.1) as server:
+        resolver = AsyncDNSResolver(['127.0.0.1'], port=server.port, timeout=1)
+
+        async def lookups():
+            return await asyncio.gather(*(resolver.query('good.test', 'MX') for _ in range(20)))
+
+        answers = resolver.run(lookups())
+
+        assert server.queries == 1
+
+    assert resolver.queries == 1
+    assert resolver.shared == 19
+    assert all(answer == answers[0] for answer in answers)
+    assert sorted(answers[0].records) == [(5, 'mx0.good.test'), (10, 'mx1.good.test')]
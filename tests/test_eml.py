@@ -0,0 +1,116 @@
+import base64
+import io
+import tracemalloc
+
+from utils.eml import MAX_LINE, EmlReader, check_eml
+from utils.pipeline import ParsedDocument
+from utils.rule_pack import RulePack
+from utils.spam_checker import SpamChecker
+
+HTML = '<p>Caf\xe9 news: get FREE money today</p>'
+ATTACHMENT = base64.encodebytes(b'%PDF-1.4 <p>not the body</p>' * 4).decode('ascii')
+
+
+def message(attachment=ATTACHMENT, html=None):
+    html = html or base64.encodebytes(HTML.encode('latin-1')).decode('ascii')
+    return f'''From: "Offers" <offers@example.test>
+To: you@example.test
+Subject: =?utf-8?q?Caf=C3=A9_offer?=
+MIME-Version: 1.0
+Content-Type: multipart/mixed; boundary="outer"
+
+This is the preamble.
+--outer
+Content-Type: text/plain; charset=utf-8
+Content-Disposition: attachment; filename="notes.txt"
+
+attached notes, not the body
+--outer
+Content-Type: multipart/alternative; boundary="inner"
+
+--inner
+Content-Type: text/plain; charset=utf-8
+Content-Transfer-Encoding: quoted-printable
+
+Plain caf=C3=A9 text that is wrapped with a so=
+ft line break; --inner is not a boundary here
+
+--inner
+Content-Type: text/html; charset=iso-8859-1
+Content-Transfer-Encoding: base64
+
+{html}
+--inner--
+inner epilogue
+--outer
+Content-Type: application/pdf; name="offer.pdf"
+Content-Transfer-Encoding: base64
+
+{attachment}
+--outer--
+outer epilogue
+'''.replace('\n', '\r\n').encode('ascii')
+
+
+def test_nested_multipart_parts_in_order():
+    with EmlReader(message()) as reader:
+        parts = [(part.content_type, part.filename, part.is_attachment) for part in reader.parts()]
+
+    assert parts == [
+        ('text/plain', 'notes.txt', True),
+        ('text/plain', None, False),
+        ('text/html', None, False),
+        # A filename, even from the Content-Type name parameter, marks an attachment
+        ('application/pdf', 'offer.pdf', True),
+    ]
+
+
+def test_document_takes_the_first_inline_bodies():
+    document = ParsedDocument.from_eml(message())
+
+    assert document.subject == 'Caf\xe9 offer'
+    assert document.sender_email == 'offers@example.test'
+    assert document.html_content == HTML
+    # The line break before a boundary belongs to the boundary
+    assert document.text_content == (
+        'Plain caf\xe9 text that is wrapped with a soft line break; --inner is not a boundary here\r\n'
+    )
+
+
+def test_attachments_are_skipped_without_being_buffered():
+    attachment = base64.encodebytes(bytes(range(256)) * 20000).decode('ascii')
+    source = io.BytesIO(message(attachment))
+
+    tracemalloc.start()
+    try:
+        document = ParsedDocument.from_eml(source)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    assert document.html_content == HTML
+    assert peak < len(attachment) // 10
+    # The caller's file is left open and read to the end
+    assert not source.closed
+    assert source.read() == b''
+
+
+def test_base64_lines_longer_than_a_read_are_decoded_whole():
+    html = '<p>' + 'word ' * (MAX_LINE // 2) + '</p>'
+    encoded = base64.b64encode(html.encode('latin-1')).decode('ascii')
+    assert len(encoded) > 2 * MAX_LINE
+
+    assert ParsedDocument.from_eml(message(html=encoded)).html_content == html
+
+
+def test_check_eml_streams_the_inline_bodies():
+    checker = SpamChecker(rules=RulePack({
+        'name': 'eml',
+        'spam_checker': {'keywords': {'high_risk': ['FREE', 'WRAPPED', 'NOTES', 'BODY']},
+                         'keyword_weights': {'high_risk': 10}, 'patterns': []}
+    }))
+    results = check_eml(checker, message())
+
+    assert results['message'] == {'subject': 'Caf\xe9 offer', 'sender_email': 'offers@example.test'}
+    # Words from the attachments are never seen
+    assert results['keyword_analysis']['found_keywords'] == {'high_risk': ['FREE', 'WRAPPED']}
@@ -0,0 +1,23 @@
+from utils.blocklist import parse_zones
+from utils.dns_resolver import AsyncDNSResolver
+from utils.dns_stub import StubDNSServer
+from utils.ip_reputation import IPBlocklistChecker, IPReputationChecker
+
+ZONE = {
+    '1.113.0.203.in-addr.arpa': {'PTR': ['mta1.acme.test.']},
+    'mta1.acme.test': {'A': ['203.0.113.1']},
+    '2.113.0.203.in-addr.arpa': {'PTR': ['mta2.acme.test.']},
+    'mta2.acme.test': {'A': ['198.51.100.1']},
+    '3.113.0.203.in-addr.arpa': {'PTR': ['mta3.acme.test.']},
+}
+
+
+def test_fcrdns_unknown_when_forward_lookups_fail():
+    with StubDNSServer(ZONE, silent=['mta3.acme.test']) as server:
+        resolver = AsyncDNSResolver(['127.0.0.1'], port=server.port, timeout=0.3)
+        checker = IPReputationChecker(resolver, IPBlocklistChecker(resolver, parse_zones('zen.stub')))
+        report = resolver.run(checker.check_pools(['203.0.113.1', '203.0.113.2', '203.0.113.3']))
+
+    fcrdns = {result['ip']: result['fcrdns'] for result in report['ips']}
+    assert fcrdns == {'203.0.113.1': True, '203.0.113.2': False, '203.0.113.3': None}
+    assert report['without_fcrdns'] == ['203.0.113.2']
@@ -0,0 +1,112 @@
+import random
+import re
+
+from utils.matchers import KeywordMatcher, PatternSet, first_characters
+
+KEYWORDS = ['FREE', 'FREE MONEY', 'EE', 'ABAB', 'AA', 'A', 'BA', 'WIN', 'WINNER']
+
+PATTERNS = [
+    r'\$\d+', r'(?<!\d)\d+%\s*OFF', r'FREE\s*TRIAL', r'(A|B)B', r'AB*?', r'(?i:win)\w*', r'[^ ]E',
+    r'A*', r'\bB|', r'(A)\1', r'(?P<pair>EE)', r'N(?=O)', r'(?<=\d)%',
+]
+
+
+def random_text(rng, size, alphabet='ABEFRWIN M'):
+    return ''.join(rng.choice(alphabet) for _ in range(size))
+
+
+def find_offsets(text, keyword):
+    # Every occurrence, overlapping included, as a str.find loop reports them
+    offsets = []
+    start = text.find(keyword)
+    while start != -1:
+        offsets.append(start)
+        start = text.find(keyword, start + 1)
+    return offsets
+
+
+def feed_in_chunks(stream, text, rng):
+    position = 0
+    while position < len(text):
+        size = rng.randint(1, 40)
+        stream.feed(text[position:position + size])
+        position += size
+
+
+def test_keyword_matchers_agree_with_str_find():
+    rng = random.Random(7)
+    for automaton_min_keywords in (1, 1000):
+        matcher = KeywordMatcher(KEYWORDS, automaton_min_keywords=automaton_min_keywords)
+        for _ in range(50):
+            text = random_text(rng, rng.randint(0, 400))
+            expected = [find_offsets(text, keyword) for keyword in KEYWORDS]
+
+            assert matcher.count(text) == [len(offsets) for offsets in expected]
+            found = {}
+            for offset, keyword in matcher.find_all(text):
+                found.setdefault(keyword, []).append(offset)
+            assert found == {keyword: offsets for keyword, offsets in zip(KEYWORDS, expected) if offsets}
+
+            stream = matcher.stream(max_offsets=3)
+            feed_in_chunks(stream, text, rng)
+            assert stream.counts == [len(offsets) for offsets in expected]
+            assert stream.offsets == {keyword: offsets[:3] for keyword, offsets in zip(KEYWORDS, expected) if offsets}
+
+
+def test_keyword_stream_without_offsets_still_counts():
+    matcher = KeywordMatcher(['FREE', 'AA'])
+    stream = matcher.stream(max_offsets=0)
+    stream.feed('FREE AAA FR')
+    stream.feed('EE')
+
+    assert stream.counts == [2, 2]
+    assert stream.offsets == {}
+
+
+def finditer_matches(patterns, text, flags=0):
+    # Per rule, the non-empty matches re.finditer returns
+    return [[match.group() for match in re.finditer(pattern, text, flags) if match.end() > match.start()]
+            for pattern in patterns]
+
+
+def test_pattern_set_agrees_with_finditer():
+    rng = random.Random(11)
+    for patterns in (PATTERNS, PATTERNS[:4], PATTERNS[7:9]):
+        pattern_set = PatternSet(patterns)
+        for _ in range(50):
+            text = random_text(rng, rng.randint(0, 300), alphabet='ABEFNOW $%19')
+            expected = finditer_matches(patterns, text)
+            assert pattern_set.sweep(text) == expected
+
+            stream = pattern_set.stream(overlap=32, max_matches=5)
+            feed_in_chunks(stream, text, rng)
+            stream.close()
+            assert stream.counts == [len(matches) for matches in expected]
+            assert stream.matches == [matches[:5] for matches in expected]
+
+
+def test_pattern_set_hits_agree_with_search():
+    rng = random.Random(13)
+    for patterns in (PATTERNS, PATTERNS[:4], ['A', r'(?<=A)B', r'E$']):
+        pattern_set = PatternSet(patterns)
+        for size in (0, 5, 300, 2000):
+            text = random_text(rng, size, alphabet='ABEFNOW $%19')
+            assert pattern_set.hits(text) == ([re.search(pattern, text) is not None for pattern in patterns], False)
+
+    # Rules that keep matching hand the rest over to one search each, from where the sweep stopped
+    pattern_set = PatternSet(['A', r'(?<=A)B', r'E$'])
+    assert pattern_set.hits('A' * 1000 + 'B') == ([True, True, False], False)
+
+
+def test_pattern_set_with_ignorecase_flag():
+    patterns = ['free\\s*trial', 'sk[i-k]', 'no cost']
+    text = 'FREE TRIAL, Free trial, SKI, SKJ, sk\u0131, \u017fki, NO COST'
+    assert PatternSet(patterns, re.IGNORECASE).sweep(text) == finditer_matches(patterns, text, re.IGNORECASE)
+
+
+def test_first_characters():
+    assert first_characters([r'\$\d+', r'(?<!\d)\d+%', r'(?:FREE|NO)\s']) == r'\$\dFN'
+    assert first_characters([r'A?B']) == 'AB'
+    # Patterns that can match empty, or start with any character, have no prefix
+    assert first_characters([r'A*']) is None
+    assert first_characters([r'.A']) is None
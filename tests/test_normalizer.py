@@ -0,0 +1,57 @@
+import random
+
+from utils.normalizer import (
+    LEET_PATTERN, SPACED_LETTERS_PATTERN, NormalizerStream, OffsetMap, _leet_words, _spaced_letters, normalize
+)
+
+
+def test_normalize_rewrites_obfuscations():
+    assert normalize('F.R.E.E money').text == 'FREE MONEY'
+    assert normalize('FR33 V1AGRA 15% off').text == 'FREE VIAGRA 15% OFF'
+    assert normalize('&#70;R​EE &amp; more').text == 'FREE & MORE'
+    # Homoglyphs (Cyrillic Е) and fullwidth letters
+    assert normalize('FRЕЕ ｆｒｅｅ').text == 'FREE FREE'
+
+
+def test_spaced_letters_need_a_word_boundary():
+    assert normalize('Office365 a-b-c').text == 'OFFICEE6S ABC'
+    assert normalize('x1 a b c').text == 'X1 ABC'
+    assert normalize('a b c5').text == 'A B C5'
+    assert normalize('w.i.n big').text == 'WIN BIG'
+
+
+def test_anchored_searches_match_finditer():
+    # The digit and separator anchors only skip text the full patterns can't match
+    pieces = ['a', 'B', 'x', '1', '3', '9', '_', ' ', '.', '-', '*', 'é', 'FR33', 'V1AGRA', 'F.R.E.E', 'a b c ']
+    rng = random.Random(0)
+    for _ in range(3000):
+        text = ''.join(rng.choice(pieces) for _ in range(rng.randint(0, 30)))
+        assert [m.span() for m in _leet_words(text)] == [m.span() for m in LEET_PATTERN.finditer(text)]
+        assert [m.span() for m in _spaced_letters(text)] == [m.span() for m in SPACED_LETTERS_PATTERN.finditer(text)]
+
+
+def test_original_offsets_survive_every_rewrite():
+    original = '&amp; F.R.E.E &#x46;REE'
+    canonical = normalize(original)
+    assert canonical.text == '& FREE FREE'
+
+    first = canonical.text.index('FREE')
+    second = canonical.text.index('FREE', first + 1)
+    assert original[canonical.original_offset(first):].startswith('F.R.E.E')
+    assert original[canonical.original_offset(second):].startswith('&#x46;REE')
+    # Inside a rewritten span, offsets map to where the span started
+    assert canonical.original_offset(first + 2) == original.index('F.R.E.E')
+    assert canonical.original_offset(0) == 0
+
+
+def test_offset_map_segments():
+    # 'ab' copied, 'XYZ' replaced by 'Q', 'cd' copied: 'abXYZcd' -> 'abQcd'
+    offset_map = OffsetMap([0, 2, 3, 5], [0, 2, 5, 7], [True, False, True, True])
+    assert [offset_map.source_offset(offset) for offset in range(5)] == [0, 1, 2, 5, 6]
+    assert offset_map.source_offset(5) == 7
+
+
+def test_stream_normalizes_across_chunk_boundaries():
+    stream = NormalizerStream()
+    text = stream.feed('Get it F.R.') + stream.feed('E.E &am') + stream.feed('p; now\n') + stream.close()
+    assert text == normalize('Get it F.R.E.E &amp; now\n').text
@@ -0,0 +1,28 @@
+from utils.budget import TimeBudget
+from utils.pipeline import ParsedDocument
+
+HTML = '<p>Hello <b>there</b></p>\n<a href="https://example.test/offer">Offer</a>'
+
+
+def spent_budget():
+    budget = TimeBudget(1)
+    budget.deadline = 0
+    return budget
+
+
+def test_budgeted_views_are_not_cached_when_cut_short():
+    document = ParsedDocument('Subject', HTML, 'plain text')
+
+    text, truncated = document.extract_text(spent_budget())
+    assert truncated
+    assert 'Hello' not in text
+    tokens, truncated = document.tokenize(spent_budget())
+    assert truncated
+    assert 'HELLO' not in tokens
+
+    # Nothing partial was kept, so the complete views are computed afresh
+    assert document.tokens == ['SUBJECT', 'HELLO', 'THERE', 'OFFER', 'PLAIN', 'TEXT']
+    assert document.links == ['https://example.test/offer']
+    # ... and later budgeted calls reuse them
+    assert document.tokenize(spent_budget()) == (document.tokens, False)
+    assert document.extract_text(spent_budget()) == (document.visible_text, False)
@@ -0,0 +1,77 @@
+import shutil
+
+import pytest
+
+from utils import snapshot
+from utils.rule_pack import DEFAULT_RULE_PACK
+from utils.snapshot import build_snapshot, load_or_build, load_snapshot
+
+SPAMASSASSIN_RULES = 'body FREE_MONEY /free\\s+money/i\nscore FREE_MONEY 2\n'
+
+
+@pytest.fixture
+def sources(tmp_path):
+    rule_pack = tmp_path / 'rules.json'
+    shutil.copy(DEFAULT_RULE_PACK, rule_pack)
+    spamassassin = tmp_path / 'spamassassin'
+    spamassassin.mkdir()
+    (spamassassin / '10_money.cf').write_text(SPAMASSASSIN_RULES)
+    path = tmp_path / 'analysis.snapshot'
+    build_snapshot(str(path), str(rule_pack), str(spamassassin))
+    return str(path), rule_pack, spamassassin
+
+
+def test_current_snapshot_is_loaded(sources):
+    path, rule_pack, spamassassin = sources
+
+    state, info = load_or_build(path, str(rule_pack), str(spamassassin))
+    assert info['source'] == 'snapshot'
+    assert sorted(state['spamassassin'].rules) == ['FREE_MONEY']
+
+
+def test_snapshot_moved_with_its_rules_stays_current(sources, tmp_path):
+    path, rule_pack, spamassassin = sources
+    deployed = tmp_path / 'deployed'
+    shutil.copytree(spamassassin, deployed / 'spamassassin')
+    shutil.copy(rule_pack, deployed / 'rules.json')
+
+    assert load_snapshot(path, str(deployed / 'rules.json'), str(deployed / 'spamassassin')) is not None
+
+
+@pytest.mark.parametrize('change', [
+    lambda rule_pack, spamassassin: rule_pack.write_text(rule_pack.read_text() + '\n'),
+    lambda rule_pack, spamassassin: (spamassassin / '10_money.cf').write_text(SPAMASSASSIN_RULES + 'score FREE_MONEY 3\n'),
+    lambda rule_pack, spamassassin: (spamassassin / '20_more.cf').write_text(SPAMASSASSIN_RULES),
+    lambda rule_pack, spamassassin: (spamassassin / '10_money.cf').rename(spamassassin / '90_money.cf'),
+])
+def test_changed_rule_sources_invalidate_the_snapshot(sources, change):
+    path, rule_pack, spamassassin = sources
+    change(rule_pack, spamassassin)
+
+    state, info = load_or_build(path, str(rule_pack), str(spamassassin))
+    assert info['source'] == 'rebuilt'
+    assert state['spamassassin'] is not None
+
+
+@pytest.mark.parametrize('name, value', [
+    ('SNAPSHOT_FORMAT', snapshot.SNAPSHOT_FORMAT + 1),
+    ('NORMALIZER_VERSION', 'changed'),
+    ('code_fingerprint', lambda: 'changed'),
+])
+def test_other_format_normalizer_or_code_invalidates_the_snapshot(sources, monkeypatch, name, value):
+    path, rule_pack, spamassassin = sources
+    monkeypatch.setattr(snapshot, name, value)
+
+    assert load_snapshot(path, str(rule_pack), str(spamassassin)) is None
+
+
+def test_damaged_snapshot_is_rebuilt(sources):
+    path, rule_pack, spamassassin = sources
+    with open(path, 'r+b') as handle:
+        data = handle.read()
+        handle.seek(0)
+        handle.truncate()
+        handle.write(data[:len(data) // 2])
+
+    assert load_or_build(path, str(rule_pack), str(spamassassin))[1]['source'] == 'rebuilt'
+    assert load_or_build(str(rule_pack) + '.missing', str(rule_pack), str(spamassassin))[1]['source'] == 'rebuilt'
@@ -0,0 +1,58 @@
+from utils.rule_pack import RulePack
+from utils.spam_checker import SpamChecker
+
+
+def custom_tier_pack():
+    return RulePack({
+        'name': 'custom tiers',
+        'spam_checker': {
+            'keywords': {'brand': ['ACME'], 'high_risk': ['FREE']},
+            'keyword_weights': {'brand': 7, 'high_risk': 15},
+            'patterns': []
+        }
+    })
+
+
+def test_custom_keyword_tiers_in_check_content():
+    checker = SpamChecker(rules=custom_tier_pack())
+    results = checker.check_content('Hello there friend', '<p>Acme gives FREE stuff</p>')
+
+    keywords = results['keyword_analysis']
+    assert keywords['found_keywords'] == {'brand': ['ACME'], 'high_risk': ['FREE']}
+    assert keywords['score'] == 22
+
+
+def test_custom_keyword_tiers_in_check_stream():
+    checker = SpamChecker(rules=custom_tier_pack())
+    results = checker.check_stream('Hello there friend', '<p>Acme gives FREE stuff</p>', chunk_size=4)
+
+    keywords = results['keyword_analysis']
+    assert keywords['found_keywords'] == {'brand': ['ACME'], 'high_risk': ['FREE']}
+    assert keywords['score'] == 22
+
+
+def test_tier_without_weight_uses_default():
+    pack = RulePack({'spam_checker': {'keywords': {'brand': ['ACME']}}})
+    results = SpamChecker(rules=pack).check_content('Hello there friend', 'acme')
+
+    assert results['keyword_analysis']['score'] == 3
+
+
+def test_keywords_and_literal_patterns_match_normalized_text():
+    pack = RulePack({
+        'spam_checker': {
+            'keywords': {'high_risk': ['COVID19', 'Win10']},
+            'keyword_weights': {'high_risk': 15},
+            'patterns': ['covid19 cure', r'\$\d+']
+        }
+    })
+    checker = SpamChecker(rules=pack)
+    results = checker.check_content('Hello there friend', '<p>COVID19 cure for WIN10 users, $40</p>')
+
+    keywords = results['keyword_analysis']
+    assert keywords['found_keywords'] == {'high_risk': ['COVID19', 'WIN10']}
+    assert keywords['hit_counts'] == {'COVID19': 1, 'WIN10': 1}
+    assert results['pattern_analysis']['rule_hits'] == {'covid19 cure': 1, r'\$\d+': 1}
+
+    columns = checker.check_many([('Hello there friend', 'win10 win10', '')])
+    assert list(columns['keyword_hits']['WIN10']) == [2]
@@ -0,0 +1,60 @@
+from utils.budget import TimeBudget
+from utils.pipeline import ParsedDocument
+from utils.spamassassin import SpamAssassinCheck, SpamAssassinRules
+
+RULES = r'''
+body FREE_MONEY /free\s+money/i
+body ANY_X /x*/
+body REPEATED /(\w)\1\1\1/
+body NOT_THERE /lottery winner/i
+rawbody RAW_BOLD /<b>/
+uri URI_OFFER /^https:\/\/example\.test\//
+uri URI_IP /\d+\.\d+\.\d+\.\d+/
+meta FREE_OFFER FREE_MONEY && URI_OFFER
+score FREE_MONEY 2
+score ANY_X 0.5
+score REPEATED 1
+score RAW_BOLD 0.1
+score FREE_OFFER 3
+'''.splitlines()
+
+HTML = '<p>Get <b>free money</b> today, zzzz</p>\n<a href="https://example.test/offer">Offer</a>'
+
+
+def test_batched_rules_agree_with_one_search_per_rule():
+    rules = SpamAssassinRules(RULES)
+    check = SpamAssassinCheck(rules, ParsedDocument('Hello', HTML, 'plain text'), TimeBudget())
+
+    for name, rule in rules.rules.items():
+        if rule.meta is None:
+            assert check.value(name) == (1.0 if rule.regex.search(check._text(rule.rule_type)) else 0.0), name
+
+    result = rules.check_document(ParsedDocument('Hello', HTML, 'plain text'))
+    assert [hit['rule'] for hit in result['hits']] == [
+        'FREE_OFFER', 'FREE_MONEY', 'REPEATED', 'URI_OFFER', 'ANY_X', 'RAW_BOLD'
+    ]
+    assert result['partial'] is False
+
+
+def test_spent_budget_leaves_pattern_rules_unhit_and_partial():
+    budget = TimeBudget(1)
+    budget.deadline = 0
+    check = SpamAssassinCheck(SpamAssassinRules(RULES), ParsedDocument('Hello', HTML), budget)
+
+    result = check.run()
+    assert result['hits'] == []
+    assert result['partial'] is True
+
+
+def test_every_rule_on_a_meta_cycle_is_rejected():
+    rules = SpamAssassinRules([
+        'body FREE_MONEY /free money/i',
+        'meta CYC_A CYC_B && FREE_MONEY',
+        'meta CYC_B CYC_A || FREE_MONEY',
+        'meta ON_CYCLE CYC_B',
+        'meta SELF SELF',
+        'meta FINE FREE_MONEY',
+    ])
+
+    assert sorted(entry['rule'] for entry in rules.unsupported) == ['CYC_A', 'CYC_B', 'ON_CYCLE', 'SELF']
+    assert sorted(rules.rules) == ['FINE', 'FREE_MONEY']
@@ -0,0 +1,122 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from utils.spf import SPFAnalyzer, SPFError, parse_record
+
+
+class ZoneResolver:
+    def __init__(self, zone):
+        self.zone = zone
+
+    async def query(self, name, rdtype):
+        records = self.zone.get(name, {}).get(rdtype, [])
+        return SimpleNamespace(status='ok' if records else 'nodata', records=records, ttl=300)
+
+
+def authorize(zone, domain, ips):
+    return asyncio.run(SPFAnalyzer(ZoneResolver(zone)).authorize_many(domain, ips))
+
+
+def test_first_matching_term_wins_over_more_specific_networks():
+    zone = {
+        'broad.test': {'TXT': ['v=spf1 ip4:10.0.0.0/8 -ip4:10.0.0.1 -all']},
+        'narrow.test': {'TXT': ['v=spf1 -ip4:10.0.0.1 ip4:10.0.0.0/8 -all']},
+    }
+
+    assert authorize(zone, 'broad.test', ['10.0.0.1', '10.0.0.2', '11.0.0.1']) == {
+        '10.0.0.1': 'pass', '10.0.0.2': 'pass', '11.0.0.1': 'fail'
+    }
+    assert authorize(zone, 'narrow.test', ['10.0.0.1', '10.0.0.2']) == {'10.0.0.1': 'fail', '10.0.0.2': 'pass'}
+
+
+def test_include_matches_only_when_its_record_passes():
+    zone = {
+        'example.test': {'TXT': ['v=spf1 include:esp.test -ip4:192.0.2.0/24 ~all']},
+        'esp.test': {'TXT': ['v=spf1 ip4:192.0.2.10 ?ip4:198.51.100.0/24 -all']},
+    }
+
+    assert authorize(zone, 'example.test', ['192.0.2.10', '192.0.2.20', '198.51.100.7', '203.0.113.1']) == {
+        # esp.test passes, so the include matches
+        '192.0.2.10': 'pass',
+        # esp.test fails or is neutral; evaluation goes on after the include
+        '192.0.2.20': 'fail',
+        '198.51.100.7': 'softfail',
+        '203.0.113.1': 'softfail',
+    }
+
+
+def test_redirect_is_evaluated_after_every_mechanism_and_gives_the_result():
+    zone = {
+        'example.test': {'TXT': ['v=spf1 -ip4:192.0.2.1 include:esp.test redirect=_spf.example.test']},
+        'esp.test': {'TXT': ['v=spf1 ip4:192.0.2.2 -all']},
+        '_spf.example.test': {'TXT': ['v=spf1 ip4:192.0.2.0/24 include:esp.test ~all']},
+        'ignored.test': {'TXT': ['v=spf1 ?all redirect=_spf.example.test']},
+    }
+
+    assert authorize(zone, 'example.test', ['192.0.2.1', '192.0.2.2', '192.0.2.3', '203.0.113.1']) == {
+        '192.0.2.1': 'fail', '192.0.2.2': 'pass', '192.0.2.3': 'pass', '203.0.113.1': 'softfail'
+    }
+    # redirect= is ignored when the record has an 'all'
+    assert authorize(zone, 'ignored.test', ['192.0.2.3']) == {'192.0.2.3': 'neutral'}
+
+
+def test_no_matching_term_is_neutral():
+    zone = {'example.test': {'TXT': ['v=spf1 ip4:192.0.2.0/24 ip6:2001:db8::/32']}}
+
+    assert authorize(zone, 'example.test', ['203.0.113.1', '2001:db9::1']) == {
+        '203.0.113.1': 'neutral', '2001:db9::1': 'neutral'
+    }
+
+
+def test_cidr_boundaries():
+    zone = {
+        'example.test': {'TXT': [
+            'v=spf1 ip4:192.0.2.130/25 ip4:198.51.100.7/32 ip6:2001:db8::1/128 a:mail.example.test/31//127 -all'
+        ]},
+        'mail.example.test': {'A': ['203.0.113.4'], 'AAAA': ['2001:db8:1::2']},
+        'wide.test': {'TXT': ['v=spf1 ip4:0.0.0.0/0 -all']},
+    }
+
+    assert authorize(zone, 'example.test', [
+        '192.0.2.127', '192.0.2.128', '192.0.2.255', '198.51.100.7', '198.51.100.8',
+        '2001:db8::1', '2001:db8::2', '203.0.113.5', '203.0.113.6', '2001:db8:1::3', '2001:db8:1::4'
+    ]) == {
+        # host bits in ip4:192.0.2.130/25 are ignored
+        '192.0.2.127': 'fail', '192.0.2.128': 'pass', '192.0.2.255': 'pass',
+        '198.51.100.7': 'pass', '198.51.100.8': 'fail',
+        '2001:db8::1': 'pass', '2001:db8::2': 'fail',
+        # a/31//127 widens the host's addresses
+        '203.0.113.5': 'pass', '203.0.113.6': 'fail',
+        '2001:db8:1::3': 'pass', '2001:db8:1::4': 'fail',
+    }
+    # An IPv4 /0 covers every IPv4 address and no IPv6 address
+    assert authorize(zone, 'wide.test', ['0.0.0.0', '255.255.255.255', '::1']) == {
+        '0.0.0.0': 'pass', '255.255.255.255': 'pass', '::1': 'fail'
+    }
+
+
+@pytest.mark.parametrize('record', [
+    'v=spf1 ip4:192.0.2.0/33',
+    'v=spf1 ip6:2001:db8::/129',
+    'v=spf1 ip4:2001:db8::1',
+    'v=spf1 ip6:192.0.2.1',
+    'v=spf1 ip4:192.0.2.1//64',
+    'v=spf1 a/33',
+    'v=spf1 mx//129',
+])
+def test_invalid_prefixes_are_permanent_errors(record):
+    with pytest.raises(SPFError):
+        parse_record(record)
+
+
+def test_prefixes_at_the_limits_parse():
+    mechanisms, _ = parse_record('v=spf1 ip4:192.0.2.1/0 ip6:2001:db8::1/128 a/32//128 mx/0//0')
+
+    assert [(m.kind, m.value, m.cidr4, m.cidr6) for m in mechanisms] == [
+        ('ip4', '0.0.0.0', 0, None),
+        ('ip6', '2001:db8::1', None, 128),
+        ('a', None, 32, 128),
+        ('mx', None, 0, 0),
+    ]
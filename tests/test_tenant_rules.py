@@ -0,0 +1,26 @@
+from types import SimpleNamespace
+
+from utils.tenant_rules import TenantRulePacks
+
+
+class MissingTableQuery:
+    def __init__(self):
+        self.session = SimpleNamespace(rolled_back=False)
+        self.session.rollback = lambda: setattr(self.session, 'rolled_back', True)
+
+    def filter(self, condition):
+        raise RuntimeError('no such table: keyword_overlay')
+
+
+class OverlayModel:
+    plan = None
+    user_id = None
+    query = MissingTableQuery()
+
+
+def test_for_user_falls_back_to_base_rules_when_overlays_cannot_be_read():
+    base = SimpleNamespace(current=object())
+    packs = TenantRulePacks(base, OverlayModel)
+
+    assert packs.for_user(SimpleNamespace(id=1, plan='professional')) is base.current
+    assert OverlayModel.query.session.rolled_back
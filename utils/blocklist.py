@@ -0,0 +1,180 @@
+"""
+Domain blocklist (DNSBL/URIBL) checks.
+
+A name is listed on a zone when ``<name>.<zone>`` resolves to an address
+in 127.0.0.0/8; domains are queried as-is and IPs by reversed octets (see
+:mod:`utils.ip_reputation`). Every zone is queried at once with its own
+timeout, so a scan costs the slowest zone's timeout at most; zones that
+time out are reported as errors rather than holding up the result.
+Listings and non-listings are cached separately per zone.
+"""
+import asyncio
+import ipaddress
+
+from utils.dns_resolver import DNSAnswer, DNSCache
+
+# Zones queried when none are configured; append ':warning' to a zone for
+# listings that should lower the score without marking the domain blacklisted
+DEFAULT_DOMAIN_BLOCKLISTS = (
+    'dbl.spamhaus.org',
+    'multi.surbl.org',
+    'multi.uribl.com',
+    'dbl.nordspam.com',
+    'dbl.0spam.org',
+    'uribl.spameatingmonkey.net:warning',
+    'fresh.spameatingmonkey.net:warning',
+    'rhsbl.sorbs.net:warning',
+)
+
+LISTED_NETWORK = ipaddress.ip_network('127.0.0.0/8')
+# Answers that report a refused or rate-limited query rather than a listing
+# (127.0.0.1 from URIBL/SURBL, 127.255.255.x from Spamhaus)
+ERROR_CODES = ipaddress.ip_network('127.255.255.0/24')
+REFUSED_CODE = ipaddress.ip_address('127.0.0.1')
+
+# Queries in flight at once across a scan
+MAX_CONCURRENT_QUERIES = 256
+
+
+class BlocklistZone:
+    """A blocklist zone with its own timeout and cache lifetimes.
+
+    ``positive_ttl`` and ``negative_ttl`` override the TTLs from DNS for
+    listings and non-listings; None keeps the zone's own TTLs.
+    """
+
+    def __init__(self, name, severity='blacklisted', timeout=1.5, positive_ttl=None, negative_ttl=None):
+        self.name = name.strip('.').lower()
+        self.severity = severity
+        self.timeout = timeout
+        self.positive_ttl = positive_ttl
+        self.negative_ttl = negative_ttl
+
+    def __repr__(self):
+        return f"BlocklistZone({self.name!r}, {self.severity!r})"
+
+
+def parse_zones(spec, timeout=1.5, positive_ttl=None, negative_ttl=None):
+    """Build zones from ``'zone[:severity], ...'`` strings or an iterable of them."""
+    if isinstance(spec, str):
+        spec = spec.split(',')
+    zones = []
+    for item in spec:
+        name, _, severity = item.strip().partition(':')
+        if name:
+            zones.append(BlocklistZone(name, severity or 'blacklisted', timeout, positive_ttl, negative_ttl))
+    return zones
+
+
+def stub_records(listings, code='127.0.1.2'):
+    """Records for :class:`utils.dns_stub.StubDNSServer` listing domains on zones.
+
+    ``listings`` maps a zone to the domains listed on it.
+    """
+    return {f"{domain}.{zone}": {'A': [code]} for zone, domains in listings.items() for domain in domains}
+
+
+def _query_name(domain):
+    return domain.strip('.').lower().encode('idna').decode('ascii')
+
+
+def _listing_codes(answer):
+    codes = []
+    for record in answer.records:
+        try:
+            address = ipaddress.ip_address(record)
+        except ValueError:
+            continue
+        if address in LISTED_NETWORK and address not in ERROR_CODES and address != REFUSED_CODE:
+            codes.append(record)
+    return codes
+
+
+class BlocklistChecker:
+    """Checks names against blocklist zones through an :class:`~utils.dns_resolver.AsyncDNSResolver`."""
+
+    default_zones = ()
+
+    def __init__(self, resolver, zones=None, cache_size=10000, max_concurrent=MAX_CONCURRENT_QUERIES):
+        self.resolver = resolver
+        self.zones = zones if zones is not None else parse_zones(self.default_zones)
+        self.max_concurrent = max_concurrent
+        # Per zone: listings and non-listings, so a flood of clean domains never evicts a listing
+        self._caches = {zone.name: (DNSCache(cache_size), DNSCache(cache_size)) for zone in self.zones}
+        self._semaphore = None
+        self.timeouts = 0
+
+    async def check_label(self, name, subject):
+        """Return the blocklist status of query label ``name`` across every zone, reported as ``subject``."""
+        answers = await asyncio.gather(*(self._check_zone(zone, name) for zone in self.zones))
+
+        listed = []
+        errors = []
+        for zone, answer in zip(self.zones, answers):
+            if answer.status == 'ok' and answer.records:
+                listed.append({'zone': zone.name, 'severity': zone.severity, 'codes': answer.records})
+            elif answer.status == 'error':
+                errors.append(zone.name)
+
+        if any(listing['severity'] == 'blacklisted' for listing in listed):
+            status = 'blacklisted'
+        elif listed:
+            status = 'warning'
+        elif self.zones and len(errors) == len(self.zones):
+            status = 'unknown'
+        else:
+            status = 'clean'
+        return {'subject': subject, 'status': status, 'listed': listed, 'errors': errors, 'zones': len(self.zones)}
+
+    async def _check_zone(self, zone, name):
+        positive, negative = self._caches[zone.name]
+        key = (name, zone.name)
+        answer = positive.get(key) or negative.get(key)
+        if answer is not None:
+            return answer
+
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrent)
+        try:
+            async with self._semaphore:
+                answer = await asyncio.wait_for(
+                    self.resolver.query(f"{name}.{zone.name}", 'A', cached=False), zone.timeout
+                )
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            return DNSAnswer('error', [], 0)
+        if answer.status == 'error':
+            return answer
+
+        codes = _listing_codes(answer) if answer.status == 'ok' else []
+        if answer.records and not codes:
+            # The zone refused the query (e.g. from a public resolver); not a verdict
+            return DNSAnswer('error', [], 0)
+        if codes:
+            answer = DNSAnswer('ok', codes, answer.ttl if zone.positive_ttl is None else zone.positive_ttl)
+            positive.set(key, answer)
+        else:
+            answer = DNSAnswer('nxdomain', [], answer.ttl if zone.negative_ttl is None else zone.negative_ttl)
+            negative.set(key, answer)
+        return answer
+
+    def stats(self):
+        stats = {'zones': len(self.zones), 'timeouts': self.timeouts, 'listed': 0, 'not_listed': 0}
+        for positive, negative in self._caches.values():
+            stats['listed'] += positive.stats()['size']
+            stats['not_listed'] += negative.stats()['size']
+        return stats
+
+
+class DomainBlocklistChecker(BlocklistChecker):
+    """Domain (RHSBL/URIBL) listings."""
+
+    default_zones = DEFAULT_DOMAIN_BLOCKLISTS
+
+    async def check(self, domain):
+        result = await self.check_label(_query_name(domain), domain)
+        result['domain'] = result.pop('subject')
+        return result
+
+    async def check_many(self, domains):
+        return await asyncio.gather(*(self.check(domain) for domain in domains))
@@ -0,0 +1,20 @@
+import time
+
+
+class TimeBudget:
+    """CPU-time allowance for one check, measured on the calling thread.
+
+    Thread CPU time is used rather than wall time so that a worker thread
+    waiting on the GIL or I/O is not charged for it. ``seconds=None`` or ``0``
+    means unlimited, and ``exhausted()`` then costs a single attribute test.
+    """
+
+    def __init__(self, seconds=None):
+        self.seconds = seconds
+        self.deadline = time.thread_time() + seconds if seconds else None
+
+    def exhausted(self):
+        return self.deadline is not None and time.thread_time() > self.deadline
+
+
+UNLIMITED = TimeBudget()
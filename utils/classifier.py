@@ -0,0 +1,224 @@
+"""
+Multinomial naive Bayes spam classifier over hashed message tokens.
+
+Train offline and point SPAM_CLASSIFIER_MODEL at the result:
+
+    python -m utils.classifier train --corpus ./corpus --output spam_model.bin
+    python -m utils.classifier train --database --threshold 50 --output spam_model.bin
+    python -m utils.classifier score spam_model.bin message.eml
+
+A corpus directory holds ``spam/`` and ``ham/`` subdirectories of .eml or
+plain-text files. Database training labels stored EmailTest rows as spam
+when their spam_score is at or above ``--threshold``.
+"""
+import argparse
+import hashlib
+import math
+import mmap
+import os
+import struct
+from array import array
+from zlib import crc32
+
+from utils.budget import TimeBudget
+from utils.pipeline import ParsedDocument
+
+# Tokens are hashed into 2 ** FEATURE_BITS buckets
+FEATURE_BITS = 18
+
+# magic, format version, feature bits, spam messages, ham messages, log prior odds
+HEADER = struct.Struct('<8sIIQQd')
+MAGIC = b'EDPNBAYS'
+FORMAT_VERSION = 1
+
+
+def token_features(tokens, feature_bits=FEATURE_BITS):
+    """Map tokens to bucket indexes; the whole chain runs in C via map()."""
+    mask = (1 << feature_bits) - 1
+    return map(mask.__and__, map(crc32, map(str.encode, tokens)))
+
+
+class NaiveBayesModel:
+    """Per-bucket log-likelihood ratios in one float32 table.
+
+    A message's log odds of being spam is the prior log odds plus the sum of
+    the table entries for its tokens, so scoring is one pass of lookups with
+    no per-class work. Loaded models map the table straight from the file.
+    """
+
+    def __init__(self, weights, prior, feature_bits=FEATURE_BITS, spam_messages=0, ham_messages=0,
+                 version=None):
+        self.weights = weights
+        self.prior = prior
+        self.feature_bits = feature_bits
+        self.spam_messages = spam_messages
+        self.ham_messages = ham_messages
+        self.version = version or hashlib.sha256(self._header() + memoryview(weights).cast('B')).hexdigest()[:16]
+        self._mmap = None
+
+    def _header(self):
+        return HEADER.pack(MAGIC, FORMAT_VERSION, self.feature_bits, self.spam_messages, self.ham_messages,
+                           self.prior)
+
+    def save(self, path):
+        with open(path, 'wb') as handle:
+            handle.write(self._header())
+            handle.write(memoryview(self.weights).cast('B'))
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as handle:
+            # Too short for a header (an empty file cannot even be mapped)
+            if os.fstat(handle.fileno()).st_size < HEADER.size:
+                raise ValueError(f"{path} is truncated")
+            mapped = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            magic, format_version, feature_bits, spam_messages, ham_messages, prior = HEADER.unpack_from(mapped)
+            if magic != MAGIC or format_version != FORMAT_VERSION:
+                raise ValueError(f"{path} is not a spam classifier model")
+            if len(mapped) != HEADER.size + 4 * (1 << feature_bits):
+                raise ValueError(f"{path} is truncated")
+            weights = memoryview(mapped)[HEADER.size:].cast('f')
+        except Exception:
+            mapped.close()
+            raise
+
+        model = cls(weights, prior, feature_bits, spam_messages, ham_messages,
+                    version=hashlib.sha256(mapped).hexdigest()[:16])
+        model._mmap = mapped
+        return model
+
+    def log_odds(self, tokens):
+        return self.prior + sum(map(self.weights.__getitem__, token_features(tokens, self.feature_bits)))
+
+    def classify_document(self, document, threshold=0.5, time_budget=None):
+        # A message scanned only in part within the budget is scored on the
+        # tokens found so far and marked partial
+        tokens, truncated = document.tokenize(TimeBudget(time_budget))
+        log_odds = self.log_odds(tokens)
+        # Clamp so very long messages do not overflow exp()
+        probability = 1 / (1 + math.exp(-max(-50.0, min(50.0, log_odds))))
+        return {
+            'spam_probability': round(probability, 4),
+            'label': 'spam' if probability >= threshold else 'ham',
+            'log_odds': round(log_odds, 3),
+            'tokens': len(tokens),
+            'partial': truncated,
+            'model_version': self.version
+        }
+
+    def classify(self, subject, html_content, text_content="", threshold=0.5):
+        return self.classify_document(ParsedDocument(subject, html_content, text_content), threshold)
+
+    def close(self):
+        if self._mmap is not None:
+            self.weights.release()
+            self._mmap.close()
+            self._mmap = None
+
+
+class NaiveBayesTrainer:
+    """Accumulates hashed token counts per class and builds a NaiveBayesModel."""
+
+    def __init__(self, feature_bits=FEATURE_BITS):
+        self.feature_bits = feature_bits
+        self.spam_counts = array('d', bytes(8 << feature_bits))
+        self.ham_counts = array('d', bytes(8 << feature_bits))
+        self.spam_messages = 0
+        self.ham_messages = 0
+
+    def add(self, document, is_spam):
+        counts = self.spam_counts if is_spam else self.ham_counts
+        for feature in token_features(document.tokens, self.feature_bits):
+            counts[feature] += 1
+        if is_spam:
+            self.spam_messages += 1
+        else:
+            self.ham_messages += 1
+
+    def add_many(self, labeled_documents):
+        for document, is_spam in labeled_documents:
+            self.add(document, is_spam)
+
+    def build(self, alpha=1.0):
+        """Return a model with Laplace smoothing ``alpha``."""
+        if not self.spam_messages or not self.ham_messages:
+            raise ValueError("Training needs at least one spam and one ham message")
+
+        buckets = len(self.spam_counts)
+        spam_total = math.log(sum(self.spam_counts) + alpha * buckets)
+        ham_total = math.log(sum(self.ham_counts) + alpha * buckets)
+        weights = array('f', (
+            math.log(spam + alpha) - spam_total - math.log(ham + alpha) + ham_total
+            for spam, ham in zip(self.spam_counts, self.ham_counts)
+        ))
+        prior = math.log(self.spam_messages / self.ham_messages)
+        return NaiveBayesModel(weights, prior, self.feature_bits, self.spam_messages, self.ham_messages)
+
+
+def load_document(path):
+    """Read a training message: .eml files are parsed, anything else is plain text."""
+    if path.endswith('.eml'):
+        return ParsedDocument.from_eml(path)
+    with open(path, encoding='utf-8', errors='replace') as handle:
+        return ParsedDocument('', '', handle.read())
+
+
+def iter_corpus(directory):
+    """Yield ``(document, is_spam)`` from the spam/ and ham/ subdirectories."""
+    for label, is_spam in (('spam', True), ('ham', False)):
+        root = os.path.join(directory, label)
+        for dirpath, _, filenames in os.walk(root):
+            for filename in sorted(filenames):
+                yield load_document(os.path.join(dirpath, filename)), is_spam
+
+
+def iter_email_tests(query, threshold=50, batch_size=500):
+    """Yield ``(document, is_spam)`` from completed EmailTest rows."""
+    for test in query.filter_by(status='completed').yield_per(batch_size):
+        document = ParsedDocument(test.subject, test.html_content, test.text_content, test.sender_email)
+        yield document, (test.spam_score or 0) >= threshold
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Train or run the naive Bayes spam classifier')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    train = commands.add_parser('train')
+    source = train.add_mutually_exclusive_group(required=True)
+    source.add_argument('--corpus', help='directory with spam/ and ham/ subdirectories')
+    source.add_argument('--database', action='store_true', help='train from stored EmailTest rows')
+    train.add_argument('--threshold', type=float, default=50, help='EmailTest spam_score counted as spam')
+    train.add_argument('--feature-bits', type=int, default=FEATURE_BITS)
+    train.add_argument('--alpha', type=float, default=1.0)
+    train.add_argument('--output', required=True)
+
+    score = commands.add_parser('score')
+    score.add_argument('model')
+    score.add_argument('messages', nargs='+')
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'train':
+        trainer = NaiveBayesTrainer(args.feature_bits)
+        if args.database:
+            from app import app
+            from models import EmailTest
+            with app.app_context():
+                trainer.add_many(iter_email_tests(EmailTest.query, args.threshold))
+        else:
+            trainer.add_many(iter_corpus(args.corpus))
+        model = trainer.build(args.alpha)
+        model.save(args.output)
+        print(f"Trained on {model.spam_messages} spam and {model.ham_messages} ham messages; "
+              f"saved model {model.version} to {args.output}")
+    else:
+        model = NaiveBayesModel.load(args.model)
+        for path in args.messages:
+            result = model.classify_document(load_document(path))
+            print(f"{result['spam_probability']:.4f} {result['label']:<4} {path}")
+        model.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,36 @@
-import random
+import asyncio
+import re
 from datetime import datetime
 
+from utils.blocklist import DomainBlocklistChecker
+from utils.dns_resolver import AsyncDNSResolver
+from utils.ip_reputation import IPReputationChecker
+from utils.spf import SPFAnalyzer
+
+# Selectors tried when looking for DKIM keys; the real one is only known from a signed message
+DKIM_SELECTORS = ('default', 'google', 'selector1', 'selector2', 'k1', 'k2', 's1', 's2', 'dkim', 'mail', 'smtp')
+
+DMARC_VERSION = re.compile(r'v\s*=\s*DMARC1\s*(;|$)', re.IGNORECASE)
+
+
+def _record_tags(record):
+    """Parse a ``tag=value; tag=value`` record (DKIM, DMARC) into a dict."""
+    tags = {}
+    for part in record.split(';'):
+        tag, _, value = part.partition('=')
+        if tag.strip():
+            tags[tag.strip().lower()] = ''.join(value.split())
+    return tags
+
+
 class DeliverabilityAnalyzer:
-    def __init__(self):
+    def __init__(self, resolver=None, dkim_selectors=DKIM_SELECTORS, spf=None, blocklists=None, ip_reputation=None):
+        self.resolver = resolver or AsyncDNSResolver()
+        # Shared by every domain checked, so common include subtrees are resolved once per TTL
+        self.spf = spf or SPFAnalyzer(self.resolver)
+        self.blocklists = blocklists or DomainBlocklistChecker(self.resolver)
+        self.ip_reputation = ip_reputation or IPReputationChecker(self.resolver)
+        self.dkim_selectors = dkim_selectors
         self.major_providers = {
             'gmail.com': {'reputation_weight': 0.3, 'auth_weight': 0.4, 'content_weight': 0.3},
             'yahoo.com': {'reputation_weight': 0.4, 'auth_weight': 0.3, 'content_weight': 0.3},
@@ -10,7 +38,8 @@ class DeliverabilityAnalyzer:
             'apple.com': {'reputation_weight': 0.2, 'auth_weight': 0.5, 'content_weight': 0.3}
         }
 
-    def analyze_domain_health(self, domain):
+    def analyze_domain_health(self, domain, sending_ips=None):
+        """Domain health for ``domain``; ``sending_ips`` (addresses or CIDR pools) adds IP reputation."""
         health_data = {
             'domain': domain,
             'reputation_score': 0,
@@ -26,12 +55,8 @@ class DeliverabilityAnalyzer:
         }
 
         try:
-            # Simulate checks
-            health_data['spf_status'] = self._simulate_spf_check(domain)
-            health_data['dkim_status'] = self._simulate_dkim_check(domain)
-            health_data['dmarc_status'] = self._simulate_dmarc_check(domain)
-            health_data['mx_records'] = self._simulate_mx_records(domain)
-            health_data['blacklist_status'] = self._simulate_blacklist_check(domain)
+            # SPF, DKIM, DMARC, MX and blocklist lookups run concurrently: one round-trip, not one each
+            health_data.update(self.resolver.run(self.check_dns(domain, sending_ips)))
             health_data['reputation_score'] = self._calculate_reputation_score(health_data)
             health_data['overall_health'] = self._determine_overall_health(health_data)
             health_data['recommendations'] = self._generate_domain_recommendations(health_data)
@@ -41,56 +66,134 @@ class DeliverabilityAnalyzer:
 
         return health_data
 
-    def _simulate_spf_check(self, domain):
-        # Simulate SPF record check
-        chance = random.random()
-        if chance < 0.7:
-            return 'valid'
-        elif chance < 0.85:
-            return 'basic'
-        else:
-            return 'missing'
-
-    def _simulate_dkim_check(self, domain):
-        # Simulate DKIM check
-        chance = random.random()
-        if chance < 0.6:
-            return 'valid'
-        elif chance < 0.8:
-            return 'partial'
+    def analyze_document(self, document):
+        if not document.sender_domain:
+            return None
+        return self.analyze_domain_health(document.sender_domain)
+
+    def authorize_sending_ips(self, domain, ips):
+        """Which of ``ips`` the domain's SPF record authorizes, using its compiled prefix trie."""
+        authorizer = self.resolver.run(self.spf.compile(domain))
+        results = {}
+        for ip in ips:
+            try:
+                results[str(ip)] = authorizer.check(ip)
+            except ValueError:
+                results[str(ip)] = 'invalid'
+        return {
+            'domain': domain,
+            'spf_status': authorizer.status,
+            'spf_error': authorizer.error,
+            'results': results,
+            'authorized': [ip for ip, result in results.items() if result == 'pass'],
+            'unauthorized': [ip for ip, result in results.items() if result in ('fail', 'softfail', 'neutral')],
+            'unresolved_terms': authorizer.unresolved
+        }
+
+    def check_blocklists(self, domains):
+        """Blocklist status for a portfolio of domains, all zones and domains queried concurrently."""
+        return self.resolver.run(self.blocklists.check_many(domains))
+
+    def check_sending_ips(self, pools):
+        """Blocklist listings and reverse DNS for every IP in ``pools``."""
+        return self.resolver.run(self.ip_reputation.check_pools(pools))
+
+    async def check_dns(self, domain, sending_ips=None):
+        """Look up SPF, DKIM, DMARC, MX, blocklist listings and sending-IP reputation concurrently."""
+        checks = [
+            self._check_spf(domain), self._check_dkim(domain), self._check_dmarc(domain), self._check_mx(domain),
+            self._check_blacklist(domain)
+        ]
+        if sending_ips:
+            checks.append(self._check_sending_ips(sending_ips))
+        results = {}
+        for checked in await asyncio.gather(*checks):
+            results.update(checked)
+        return results
+
+    async def _check_spf(self, domain):
+        node = await self.spf.resolve(domain)
+        if node.status == 'temperror':
+            status = 'unknown'
+        elif node.status == 'none':
+            status = 'missing'
+        elif node.status == 'permerror':
+            # Receivers treat a broken record (syntax, loops, over 10 lookups) as a failure
+            status = 'invalid'
+        elif node.all_qualifier in ('-', '~'):
+            status = 'valid'
         else:
-            return 'missing'
-
-    def _simulate_dmarc_check(self, domain):
-        # Simulate DMARC check
-        chance = random.random()
-        if chance < 0.3:
-            return 'strict'
-        elif chance < 0.5:
-            return 'moderate'
-        elif chance < 0.7:
-            return 'monitor'
-        elif chance < 0.85:
-            return 'basic'
+            status = 'basic'
+        return {
+            'spf_status': status,
+            'spf_record': node.record,
+            'spf_lookups': node.lookups,
+            'spf_error': node.error
+        }
+
+    async def _check_dkim(self, domain):
+        answers = await asyncio.gather(*(
+            self.resolver.query(f'{selector}._domainkey.{domain}', 'TXT') for selector in self.dkim_selectors
+        ))
+        selectors = []
+        revoked = False
+        for selector, answer in zip(self.dkim_selectors, answers):
+            for record in answer.records:
+                tags = _record_tags(record)
+                if 'p' not in tags:
+                    continue
+                if tags['p']:
+                    selectors.append(selector)
+                else:
+                    revoked = True
+        if selectors:
+            status = 'valid'
+        elif revoked:
+            # Key records exist but every key has been revoked (empty p=)
+            status = 'partial'
+        elif all(answer.status == 'error' for answer in answers):
+            status = 'unknown'
         else:
-            return 'missing'
+            status = 'missing'
+        return {'dkim_status': status, 'dkim_selectors': selectors}
 
-    def _simulate_mx_records(self, domain):
-        # Simulate MX records
-        return [
-            {'priority': 10, 'exchange': f'mail.{domain}'},
-            {'priority': 20, 'exchange': f'mail2.{domain}'}
-        ]
+    async def _check_dmarc(self, domain):
+        answer = await self.resolver.query(f'_dmarc.{domain}', 'TXT')
+        records = [record for record in answer.records if DMARC_VERSION.match(record)]
+        if answer.status == 'error':
+            return {'dmarc_status': 'unknown', 'dmarc_record': None}
+        if len(records) != 1:
+            # Zero or several records both mean no policy applies (RFC 7489 section 6.6.3)
+            return {'dmarc_status': 'missing', 'dmarc_record': None}
 
-    def _simulate_blacklist_check(self, domain):
-        # Simulate blacklist check
-        chance = random.random()
-        if chance < 0.05:
-            return 'blacklisted'
-        elif chance < 0.15:
-            return 'warning'
+        tags = _record_tags(records[0])
+        policy = tags.get('p', '').lower()
+        if policy == 'reject' and tags.get('pct', '100') == '100':
+            status = 'strict'
+        elif policy in ('reject', 'quarantine'):
+            status = 'moderate'
+        elif policy == 'none' and tags.get('rua'):
+            status = 'monitor'
         else:
-            return 'clean'
+            status = 'basic'
+        return {'dmarc_status': status, 'dmarc_record': records[0]}
+
+    async def _check_mx(self, domain):
+        answer = await self.resolver.query(domain, 'MX')
+        # A null MX (RFC 7505) has an empty exchange and means the domain takes no mail
+        records = sorted(record for record in answer.records if record[1] not in ('', '.', '@'))
+        return {'mx_records': [{'priority': priority, 'exchange': exchange} for priority, exchange in records]}
+
+    async def _check_blacklist(self, domain):
+        result = await self.blocklists.check(domain)
+        return {
+            'blacklist_status': result['status'],
+            'blacklist_listings': result['listed'],
+            'blacklist_errors': result['errors']
+        }
+
+    async def _check_sending_ips(self, sending_ips):
+        return {'ip_reputation': await self.ip_reputation.check_pools(sending_ips)}
 
     def _calculate_reputation_score(self, health_data):
         score = 50  # Base score
@@ -131,6 +234,14 @@ class DeliverabilityAnalyzer:
         if len(health_data['mx_records']) > 0:
             score += 5
 
+        # Sending IP penalty, scaled by the share of the pool affected
+        ip_reputation = health_data.get('ip_reputation')
+        if ip_reputation and ip_reputation['checked']:
+            checked = ip_reputation['checked']
+            score -= round(30 * len(ip_reputation['blacklisted']) / checked)
+            score -= round(10 * len(ip_reputation['warning']) / checked)
+            score -= round(10 * len(ip_reputation['without_fcrdns']) / checked)
+
         return max(0, min(100, score))
 
     def _determine_overall_health(self, health_data):
@@ -157,6 +268,15 @@ class DeliverabilityAnalyzer:
                 'action': f'Add TXT record: "v=spf1 include:_spf.google.com ~all" for {health_data["domain"]}'
             })
 
+        if health_data['spf_status'] == 'invalid':
+            recommendations.append({
+                'priority': 'high',
+                'category': 'Authentication',
+                'title': 'Fix SPF Record',
+                'description': f'Receivers will reject your SPF record: {health_data.get("spf_error")}',
+                'action': 'Remove unused include: terms or replace them with ip4:/ip6: ranges so the record needs at most 10 DNS lookups'
+            })
+
         if health_data['dkim_status'] == 'missing':
             recommendations.append({
                 'priority': 'high',
@@ -184,4 +304,23 @@ class DeliverabilityAnalyzer:
                 'action': 'Contact blacklist operators for removal and improve sending practices'
             })
 
+        ip_reputation = health_data.get('ip_reputation')
+        if ip_reputation and ip_reputation['blacklisted']:
+            recommendations.append({
+                'priority': 'critical',
+                'category': 'Reputation',
+                'title': 'Delist Sending IPs',
+                'description': f'{len(ip_reputation["blacklisted"])} of your {ip_reputation["checked"]} sending IPs are on IP blocklists',
+                'action': f'Request removal for {", ".join(ip_reputation["blacklisted"][:5])} and move mail off those IPs until delisted'
+            })
+
+        if ip_reputation and ip_reputation['without_fcrdns']:
+            recommendations.append({
+                'priority': 'medium',
+                'category': 'Infrastructure',
+                'title': 'Configure Reverse DNS',
+                'description': f'{len(ip_reputation["without_fcrdns"])} sending IPs lack forward-confirmed reverse DNS',
+                'action': 'Set a PTR record for each sending IP to a hostname whose A/AAAA record points back to it'
+            })
+
         return recommendations
@@ -0,0 +1,210 @@
+"""
+Asynchronous DNS lookups with a TTL-aware answer cache.
+
+Every lookup goes through :class:`AsyncDNSResolver`, which runs
+``dns.asyncresolver`` on one background event loop shared by all request
+threads. Answers are cached for their record TTL; NXDOMAIN and empty
+answers are cached for the negative TTL from the zone's SOA record
+(RFC 2308). Concurrent lookups of the same name share a single query.
+"""
+import asyncio
+import threading
+import time
+import weakref
+from collections import OrderedDict, namedtuple
+
+import dns.asyncresolver
+import dns.exception
+import dns.rdatatype
+import dns.resolver
+
+# ``status`` is 'ok', 'nxdomain', 'nodata' or 'error'; ``records`` are
+# strings, except MX records which are (preference, exchange) pairs
+DNSAnswer = namedtuple('DNSAnswer', ['status', 'records', 'ttl'])
+
+# Negative TTL used when a negative answer carries no SOA record
+DEFAULT_NEGATIVE_TTL = 300
+
+
+class DNSCache:
+    """LRU of DNS answers keyed by (name, record type), each kept for its TTL."""
+
+    def __init__(self, max_size=10000, min_ttl=0, max_ttl=24 * 3600):
+        self.max_size = max_size
+        self.min_ttl = min_ttl
+        self.max_ttl = max_ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, answer = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return answer
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def set(self, key, answer):
+        ttl = max(self.min_ttl, min(self.max_ttl, answer.ttl))
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, answer)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'size': len(self._entries),
+                'max_size': self.max_size
+            }
+
+
+def negative_ttl(response, default=DEFAULT_NEGATIVE_TTL):
+    """The RFC 2308 negative-caching TTL: min(SOA TTL, SOA minimum) from the authority section."""
+    if response is not None:
+        for rrset in response.authority:
+            if rrset.rdtype == dns.rdatatype.SOA:
+                return min(rrset.ttl, rrset[0].minimum)
+    return default
+
+
+def _record_values(rrset):
+    values = []
+    for rdata in rrset:
+        if rrset.rdtype == dns.rdatatype.TXT:
+            values.append(b''.join(rdata.strings).decode('utf-8', 'replace'))
+        elif rrset.rdtype == dns.rdatatype.MX:
+            values.append((rdata.preference, rdata.exchange.to_text(omit_final_dot=True).lower()))
+        elif rrset.rdtype in (dns.rdatatype.PTR, dns.rdatatype.CNAME, dns.rdatatype.NS):
+            values.append(rdata.target.to_text(omit_final_dot=True).lower())
+        else:
+            values.append(rdata.to_text())
+    return values
+
+
+class AsyncDNSResolver:
+    """
+    Cached, de-duplicated DNS lookups on a shared event loop.
+
+    ``nameservers`` and ``port`` override the system resolver configuration
+    (for example to point at :class:`utils.dns_stub.StubDNSServer`).
+    Coroutines such as :meth:`query` are awaited on the resolver's loop;
+    synchronous callers hand them to :meth:`run`.
+    """
+
+    def __init__(self, nameservers=None, port=53, timeout=2.0, cache=None, negative_ttl=DEFAULT_NEGATIVE_TTL):
+        self.nameservers = nameservers
+        self.port = port
+        self.timeout = timeout
+        self.cache = cache if cache is not None else DNSCache()
+        self.negative_ttl = negative_ttl
+        self._resolver = None
+        self._loop = None
+        self._lock = threading.Lock()
+        # In-flight lookups per event loop, keyed by (name, record type)
+        self._inflight = weakref.WeakKeyDictionary()
+        self.queries = 0
+        self.shared = 0
+
+    @property
+    def resolver(self):
+        if self._resolver is None:
+            if self.nameservers:
+                resolver = dns.asyncresolver.Resolver(configure=False)
+                resolver.nameservers = list(self.nameservers)
+            else:
+                resolver = dns.asyncresolver.Resolver()
+            resolver.port = self.port
+            resolver.lifetime = self.timeout
+            self._resolver = resolver
+        return self._resolver
+
+    @property
+    def loop(self):
+        """The background event loop, started on first use."""
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=loop.run_forever, name='dns-resolver', daemon=True)
+                thread.start()
+                self._loop = loop
+            return self._loop
+
+    def run(self, coroutine, timeout=None):
+        """Run ``coroutine`` on the resolver's loop and wait for its result."""
+        loop = self.loop
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            coroutine.close()
+            raise RuntimeError('AsyncDNSResolver.run() called from its own event loop; await the coroutine instead')
+        return asyncio.run_coroutine_threadsafe(coroutine, loop).result(timeout)
+
+    async def query(self, name, rdtype, cached=True):
+        """
+        Return a :data:`DNSAnswer` for ``name``, from the cache when it is still fresh.
+
+        ``cached=False`` skips the answer cache (callers with their own caching
+        policy) but still shares in-flight lookups.
+        """
+        key = (name.rstrip('.').lower(), rdtype.upper())
+        answer = self.cache.get(key) if cached else None
+        if answer is not None:
+            return answer
+
+        inflight = self._inflight.setdefault(asyncio.get_running_loop(), {})
+        task = inflight.get(key)
+        if task is None:
+            self.queries += 1
+            task = asyncio.ensure_future(self._lookup(*key, store=cached))
+            inflight[key] = task
+            task.add_done_callback(lambda _: inflight.pop(key, None))
+        else:
+            self.shared += 1
+        # Shielded so one caller timing out does not cancel the lookup for the others
+        return await asyncio.shield(task)
+
+    async def _lookup(self, name, rdtype, store=True):
+        try:
+            answer = await self.resolver.resolve(name, rdtype, raise_on_no_answer=False)
+        except dns.resolver.NXDOMAIN as e:
+            response = next(iter(e.responses().values()), None)
+            result = DNSAnswer('nxdomain', [], negative_ttl(response, self.negative_ttl))
+        except dns.exception.DNSException:
+            # Timeouts and server failures are not cached
+            return DNSAnswer('error', [], 0)
+        else:
+            if answer.rrset is None:
+                result = DNSAnswer('nodata', [], negative_ttl(answer.response, self.negative_ttl))
+            else:
+                ttl = max(0, int(answer.expiration - time.time()))
+                result = DNSAnswer('ok', _record_values(answer.rrset), ttl)
+        if store:
+            self.cache.set((name, rdtype), result)
+        return result
+
+    def stats(self):
+        stats = self.cache.stats()
+        stats.update({'queries': self.queries, 'shared_inflight': self.shared})
+        return stats
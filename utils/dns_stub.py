@@ -0,0 +1,194 @@
+"""
+A small authoritative DNS server for exercising lookups without network access.
+
+    python -m utils.dns_stub zone.json --port 5353
+
+The zone maps names to record types and zone-file style values::
+
+    {"example.com": {"TXT": ["v=spf1 mx -all"], "MX": ["10 mail.example.com."]},
+     "*.dbl.test": {"A": ["127.0.1.2"]}}
+
+``*.`` names match any name below them that has no records of its own.
+Names without records get NXDOMAIN, and names without the requested type
+an empty answer, both with an SOA record carrying ``negative_ttl``.
+"""
+import argparse
+import asyncio
+import json
+import threading
+
+import dns.exception
+import dns.flags
+import dns.message
+import dns.name
+import dns.rcode
+import dns.rdataclass
+import dns.rdatatype
+import dns.rrset
+
+
+def _txt_value(value):
+    if value.startswith('"'):
+        return value
+    # TXT character-strings hold at most 255 bytes each
+    return ' '.join('"' + value[index:index + 255].replace('\\', '\\\\').replace('"', '\\"') + '"'
+                    for index in range(0, max(len(value), 1), 255))
+
+
+class _StubProtocol(asyncio.DatagramProtocol):
+    def __init__(self, server):
+        self.server = server
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, address):
+        response = self.server.respond(data)
+        if response is None:
+            return
+        if self.server.delay:
+            asyncio.get_running_loop().call_later(self.server.delay, self.transport.sendto, response, address)
+        else:
+            self.transport.sendto(response, address)
+
+
+class StubDNSServer:
+    """
+    UDP DNS server on a background thread, answering from an in-memory zone.
+
+    Use as a context manager; ``port=0`` picks a free port, available as
+    :attr:`port` once started. ``delay`` holds every answer back by that many
+    seconds to simulate network latency, and names in ``silent`` are never
+    answered, so lookups for them time out. :attr:`queries` counts requests.
+    """
+
+    def __init__(self, records=None, host='127.0.0.1', port=0, ttl=300, negative_ttl=60, delay=0, silent=()):
+        self.host = host
+        self.port = port
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.delay = delay
+        self.silent = {name.rstrip('.').lower() for name in silent}
+        self.zone = {}
+        self.queries = 0
+        self._loop = None
+        self._thread = None
+        for name, types in (records or {}).items():
+            for rdtype, values in types.items():
+                self.add(name, rdtype, *values)
+
+    def add(self, name, rdtype, *values, ttl=None):
+        """Add records, e.g. ``add('example.com', 'MX', '10 mail.example.com.')``."""
+        owner = dns.name.from_text(name)
+        rdtype = dns.rdatatype.from_text(rdtype.upper())
+        texts = [_txt_value(value) if rdtype == dns.rdatatype.TXT else value for value in values]
+        rrset = dns.rrset.from_text_list(owner, self.ttl if ttl is None else ttl, dns.rdataclass.IN, rdtype, texts)
+        types = self.zone.setdefault(name.rstrip('.').lower(), {})
+        if rdtype in types:
+            types[rdtype].union_update(rrset)
+        else:
+            types[rdtype] = rrset
+
+    def _lookup_name(self, name):
+        if name in self.zone:
+            return name
+        labels = name.split('.')
+        for index in range(1, len(labels)):
+            wildcard = '*.' + '.'.join(labels[index:])
+            if wildcard in self.zone:
+                return wildcard
+        return None
+
+    def _soa(self, qname):
+        # The parent of the queried name stands in for the zone apex
+        apex = qname.parent() if len(qname.labels) > 3 else qname
+        return dns.rrset.from_text(
+            apex, self.negative_ttl, dns.rdataclass.IN, dns.rdatatype.SOA,
+            f"ns.{apex.to_text()} hostmaster.{apex.to_text()} 1 3600 600 86400 {self.negative_ttl}"
+        )
+
+    def respond(self, wire):
+        """Build the wire-format answer to a wire-format query, or None to stay silent."""
+        self.queries += 1
+        try:
+            query = dns.message.from_wire(wire)
+        except dns.exception.DNSException:
+            return None
+        response = dns.message.make_response(query)
+        response.flags |= dns.flags.AA
+        if not query.question:
+            response.set_rcode(dns.rcode.FORMERR)
+            return response.to_wire()
+
+        question = query.question[0]
+        name = question.name.to_text(omit_final_dot=True).lower()
+        if name in self.silent:
+            return None
+        match = self._lookup_name(name)
+        if match is None:
+            response.set_rcode(dns.rcode.NXDOMAIN)
+            response.authority.append(self._soa(question.name))
+        elif question.rdtype in self.zone[match]:
+            records = self.zone[match][question.rdtype]
+            response.answer.append(dns.rrset.from_rdata_list(question.name, records.ttl, list(records)))
+        else:
+            response.authority.append(self._soa(question.name))
+        return response.to_wire()
+
+    def start(self):
+        ready = threading.Event()
+
+        def serve():
+            self._loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self._loop)
+            transport, _ = self._loop.run_until_complete(self._loop.create_datagram_endpoint(
+                lambda: _StubProtocol(self), local_addr=(self.host, self.port)
+            ))
+            self.port = transport.get_extra_info('sockname')[1]
+            ready.set()
+            try:
+                self._loop.run_forever()
+            finally:
+                transport.close()
+                self._loop.run_until_complete(asyncio.sleep(0))
+                self._loop.close()
+
+        self._thread = threading.Thread(target=serve, name='dns-stub', daemon=True)
+        self._thread.start()
+        ready.wait()
+        return self
+
+    def stop(self):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._loop = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve a JSON zone over UDP for local DNS testing')
+    parser.add_argument('zone', help='JSON file mapping names to {type: [values]}')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5353)
+    parser.add_argument('--delay', type=float, default=0, help='seconds to hold back each answer')
+    args = parser.parse_args(argv)
+
+    with open(args.zone) as f:
+        records = json.load(f)
+    server = StubDNSServer(records, args.host, args.port, delay=args.delay).start()
+    print(f"Serving {len(server.zone)} names on {args.host}:{server.port} (Ctrl+C to stop)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
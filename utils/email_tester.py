@@ -1,25 +1,54 @@
-import re
 import random
 
+from utils.budget import TimeBudget
+from utils.instrumentation import NULL_RECORDER, RuleRecorder
+from utils.pipeline import ParsedDocument
+from utils.rule_pack import default_rule_pack
+
 class EmailTester:
-    def __init__(self):
+    def __init__(self, instrument=False, rules=None, time_budget=None):
+        # Record per-stage timings in results and in METRICS
+        self.instrument = instrument
+        # Default per-message CPU seconds for scanning the HTML
+        self.time_budget = time_budget
         self.providers = ['gmail', 'yahoo', 'outlook', 'apple']
+        # RulePack or RulePackManager supplying the spam word list
+        self.rule_source = rules or default_rule_pack()
+
+    @property
+    def spam_words(self):
+        return self.rule_source.current.spam_words
 
-    def analyze_email(self, subject, sender_email, html_content, text_content=""):
+    @property
+    def ruleset_version(self):
+        return self.rule_source.current.version
+
+    def analyze_email(self, subject, sender_email, html_content, text_content="", instrument=None):
         """
         Comprehensive email analysis including spam score, deliverability prediction
         """
+        return self.analyze_document(ParsedDocument(subject, html_content, text_content, sender_email), instrument)
+
+    def analyze_document(self, document, instrument=None, time_budget=None):
+        instrument = self.instrument if instrument is None else instrument
+        budget = TimeBudget(self.time_budget if time_budget is None else time_budget)
+        recorder = RuleRecorder('email_tester') if instrument else NULL_RECORDER
+        sender_email = document.sender_email
+        # The simulated checks are seeded by the message, so a message always
+        # gets the same results and cached results match fresh ones
+        rng = random.Random(document.content_hash)
         results = {
             'overall_score': 0,
             'spam_score': 0,
             'delivery_rate': 0,
             'provider_results': [],
             'spam_factors': [],
-            'recommendations': []
+            'recommendations': [],
+            'partial': False
         }
 
         # Analyze spam factors
-        spam_factors = self._analyze_spam_factors(subject, sender_email, html_content, text_content)
+        spam_factors = self._analyze_spam_factors(document, recorder, rng, budget, results)
         results['spam_factors'] = spam_factors
 
         # Calculate spam score (0-100, lower is better)
@@ -27,8 +56,10 @@ class EmailTester:
         results['spam_score'] = spam_score
 
         # Predict provider-specific results
-        provider_results = self._predict_provider_results(spam_score, sender_email)
+        started = recorder.start()
+        provider_results = self._predict_provider_results(spam_score, sender_email, rng)
         results['provider_results'] = provider_results
+        recorder.stop('provider_prediction', started, len(provider_results))
 
         # Calculate overall delivery rate
         delivery_rate = sum([p['inbox_rate'] for p in provider_results]) / len(provider_results)
@@ -40,10 +71,15 @@ class EmailTester:
         # Generate recommendations
         results['recommendations'] = self._generate_recommendations(spam_factors)
 
+        if recorder.enabled:
+            results['instrumentation'] = recorder.report()
+
         return results
 
-    def _analyze_spam_factors(self, subject, sender_email, html_content, text_content):
+    def _analyze_spam_factors(self, document, recorder=NULL_RECORDER, rng=random, budget=None, results=None):
         factors = []
+        subject = document.subject
+        started = recorder.start()
 
         # Subject line analysis
         if len(subject) > 60:
@@ -63,9 +99,11 @@ class EmailTester:
                 'score': 5
             })
 
+        recorder.stop('subject', started)
+
         # Check for spam words
-        spam_words = ['FREE', 'URGENT', 'ACT NOW', 'LIMITED TIME', 'GUARANTEE', 'CLICK HERE']
-        found_spam_words = [word for word in spam_words if word.lower() in subject.lower()]
+        started = recorder.start()
+        found_spam_words = [word for word in self.spam_words if word in document.subject_upper]
 
         if found_spam_words:
             factors.append({
@@ -84,12 +122,16 @@ class EmailTester:
                 'score': 10
             })
 
-        # HTML analysis
-        if html_content:
-            img_count = html_content.lower().count('<img')
-            text_length = len(re.sub(r'<[^>]+>', '', html_content))
+        recorder.stop('spam_keywords', started, len(found_spam_words))
 
-            if img_count > 0 and text_length < 100:
+        # HTML analysis
+        started = recorder.start()
+        # Scanned within the budget; a complete scan is shared with the other stages
+        html = document.scan_html(budget)
+        if html is not None and html.truncated and results is not None:
+            results['partial'] = True
+        if html is not None:
+            if html.image_count > 0 and html.text_length < 100:
                 factors.append({
                     'factor': 'Image to Text Ratio',
                     'status': 'Warning',
@@ -106,18 +148,22 @@ class EmailTester:
                     'score': 5
                 })
 
-        domain = sender_email.split('@')[1] if '@' in sender_email else 'unknown'
+        recorder.stop('html', started, html.image_count if html is not None else 0)
+
+        domain = document.sender_domain or 'unknown'
 
-        auth_factors = self._check_authentication(domain)
+        started = recorder.start()
+        auth_factors = self._check_authentication(domain, rng)
         factors.extend(auth_factors)
+        recorder.stop('authentication', started, len(auth_factors))
 
         return factors
 
-    def _check_authentication(self, domain):
+    def _check_authentication(self, domain, rng=random):
         factors = []
 
         # Simulate SPF check (75% chance valid)
-        spf_valid = random.choice([True, True, True, False])
+        spf_valid = rng.choice([True, True, True, False])
         if spf_valid:
             factors.append({
                 'factor': 'SPF Authentication',
@@ -136,7 +182,7 @@ class EmailTester:
             })
 
         # Simulate DKIM check (67% chance valid)
-        dkim_valid = random.choice([True, True, False])
+        dkim_valid = rng.choice([True, True, False])
         if dkim_valid:
             factors.append({
                 'factor': 'DKIM Signature',
@@ -155,7 +201,7 @@ class EmailTester:
             })
 
         # Simulate DMARC check (50% chance valid)
-        dmarc_valid = random.choice([True, False])
+        dmarc_valid = rng.choice([True, False])
         if dmarc_valid:
             factors.append({
                 'factor': 'DMARC Policy',
@@ -181,7 +227,7 @@ class EmailTester:
             base_score -= factor.get('score', 0)
         return max(0, min(100, base_score))
 
-    def _predict_provider_results(self, spam_score, sender_email):
+    def _predict_provider_results(self, spam_score, sender_email, rng=random):
         results = []
         provider_configs = {
             'Gmail': {'base_inbox': 85, 'spam_sensitivity': 1.2},
@@ -193,9 +239,9 @@ class EmailTester:
         for provider, config in provider_configs.items():
             penalty = (spam_score * config['spam_sensitivity']) / 2
             inbox_rate = max(10, config['base_inbox'] - penalty)
-            inbox_rate += random.uniform(-3, 3)
+            inbox_rate += rng.uniform(-3, 3)
             inbox_rate = max(0, min(100, inbox_rate))
-            spam_rate = min(90, 100 - inbox_rate + random.uniform(-2, 2))
+            spam_rate = min(90, 100 - inbox_rate + rng.uniform(-2, 2))
             missing_rate = max(0, 100 - inbox_rate - spam_rate)
 
             results.append({
@@ -0,0 +1,328 @@
+import binascii
+import codecs
+import io
+from email.parser import BytesHeaderParser
+from email.policy import default as default_policy
+from email.utils import parseaddr
+from tempfile import SpooledTemporaryFile
+
+from utils.streaming import CHUNK_SIZE
+
+# Longest physical line read at once; longer lines are read in pieces
+MAX_LINE = 64 * 1024
+# Header blocks larger than this are cut off rather than buffered
+MAX_HEADER_SIZE = 256 * 1024
+# Plain-text bodies that must be held back are kept in memory up to this size
+SPOOL_SIZE = 1024 * 1024
+
+
+def _header_block(reader):
+    lines = []
+    size = 0
+    while True:
+        line, _ = reader.readline()
+        if not line or line in (b'\r\n', b'\n'):
+            break
+        if size < MAX_HEADER_SIZE:
+            lines.append(line)
+            size += len(line)
+    return BytesHeaderParser(policy=default_policy).parsebytes(b''.join(lines))
+
+
+def _text_decoder(charset):
+    try:
+        return codecs.getincrementaldecoder(charset or 'utf-8')(errors='replace')
+    except LookupError:
+        return codecs.getincrementaldecoder('utf-8')(errors='replace')
+
+
+class _Base64Decoder:
+    def __init__(self):
+        self._pending = b''
+
+    def decode(self, data):
+        data = self._pending + b''.join(data.split())
+        usable = len(data) - len(data) % 4
+        self._pending = data[usable:]
+        try:
+            return binascii.a2b_base64(data[:usable])
+        except binascii.Error:
+            return b''
+
+    def flush(self):
+        pending, self._pending = self._pending, b''
+        if not pending:
+            return b''
+        try:
+            return binascii.a2b_base64(pending + b'=' * (-len(pending) % 4))
+        except binascii.Error:
+            return b''
+
+
+class _QuotedPrintableDecoder:
+    def __init__(self):
+        self._pending = b''
+
+    def decode(self, data):
+        # A soft line break or escape may be split across reads; hold back an
+        # incomplete trailing "=" sequence until the next piece arrives
+        data = self._pending + data
+        cut = data.rfind(b'=', max(0, len(data) - 2))
+        if cut >= 0 and not data.endswith((b'=\n', b'=\r\n')):
+            self._pending = data[cut:]
+            data = data[:cut]
+        else:
+            self._pending = b''
+        return binascii.a2b_qp(data)
+
+    def flush(self):
+        pending, self._pending = self._pending, b''
+        return binascii.a2b_qp(pending)
+
+
+class _IdentityDecoder:
+    def decode(self, data):
+        return data
+
+    def flush(self):
+        return b''
+
+
+DECODERS = {
+    'base64': _Base64Decoder,
+    'quoted-printable': _QuotedPrintableDecoder,
+}
+
+
+class MimePart:
+    """A leaf MIME part whose body is decoded only when it is read.
+
+    The body can be read once, as it streams past; parts that are never read
+    are skipped line by line without decoding or buffering.
+    """
+
+    def __init__(self, reader, headers, boundaries):
+        self.reader = reader
+        self.headers = headers
+        self.boundaries = boundaries
+        self.content_type = headers.get_content_type()
+        self.charset = headers.get_content_charset()
+        self.filename = headers.get_filename()
+        self.transfer_encoding = str(headers.get('Content-Transfer-Encoding', '7bit')).strip().lower()
+        self.is_attachment = headers.get_content_disposition() == 'attachment' or bool(self.filename)
+        self._lines = None
+
+    def _raw_lines(self):
+        # The line break before a boundary belongs to the boundary, so each
+        # line is held back until we know whether the next one is a boundary
+        previous = None
+        while True:
+            line, at_line_start = self.reader.readline()
+            if not line:
+                self.reader.marker = None
+                break
+            if at_line_start:
+                marker = self.reader.match_boundary(line, self.boundaries)
+                if marker is not None:
+                    self.reader.marker = marker
+                    if previous is not None:
+                        previous = previous.rstrip(b'\r\n')
+                    break
+            if previous is not None:
+                yield previous
+            previous = line
+        if previous:
+            yield previous
+
+    def _line_iterator(self):
+        if self._lines is None:
+            self._lines = self._raw_lines()
+        return self._lines
+
+    def iter_bytes(self):
+        """Yield the decoded body as byte chunks."""
+        decoder = DECODERS.get(self.transfer_encoding, _IdentityDecoder)()
+        for line in self._line_iterator():
+            data = decoder.decode(line)
+            if data:
+                yield data
+        tail = decoder.flush()
+        if tail:
+            yield tail
+
+    def iter_text(self, chunk_size=CHUNK_SIZE):
+        """Yield the decoded body as text, using the part's charset."""
+        decoder = _text_decoder(self.charset)
+        pending = []
+        size = 0
+        for data in self.iter_bytes():
+            pending.append(data)
+            size += len(data)
+            if size >= chunk_size:
+                yield decoder.decode(b''.join(pending))
+                pending = []
+                size = 0
+        yield decoder.decode(b''.join(pending), final=True)
+
+    def read_text(self, limit=None):
+        """Return the decoded body as one string, optionally cut at ``limit`` characters."""
+        parts = []
+        size = 0
+        for text in self.iter_text():
+            parts.append(text)
+            size += len(text)
+            if limit is not None and size >= limit:
+                break
+        self.skip()
+        text = ''.join(parts)
+        return text[:limit] if limit is not None else text
+
+    def skip(self):
+        for _ in self._line_iterator():
+            pass
+
+
+class EmlReader:
+    """Reads a raw RFC 822 message (.eml) as a stream of lazily decoded parts.
+
+    ``source`` may be bytes, a path or a binary file object. Only the top
+    level headers are parsed up front; :meth:`parts` then walks the multipart
+    tree as the input is read, so attachments are never held in memory.
+    """
+
+    def __init__(self, source):
+        self._owns_file = isinstance(source, str)
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            self._file = io.BytesIO(source)
+        elif isinstance(source, str):
+            self._file = open(source, 'rb')
+        else:
+            self._file = source
+        self._at_line_start = True
+        self.marker = None
+        self.headers = _header_block(self)
+
+    @property
+    def subject(self):
+        return str(self.headers.get('Subject', ''))
+
+    @property
+    def sender_email(self):
+        return parseaddr(str(self.headers.get('From', '')))[1]
+
+    def readline(self):
+        """Return ``(line, at_line_start)``; lines over MAX_LINE arrive in pieces."""
+        line = self._file.readline(MAX_LINE)
+        at_line_start = self._at_line_start
+        self._at_line_start = line.endswith(b'\n')
+        return line, at_line_start
+
+    @staticmethod
+    def match_boundary(line, boundaries):
+        if not line.startswith(b'--'):
+            return None
+        stripped = line.rstrip(b' \t\r\n')
+        for boundary in reversed(boundaries):
+            if stripped == b'--' + boundary:
+                return boundary, False
+            if stripped == b'--' + boundary + b'--':
+                return boundary, True
+        return None
+
+    def _skip_to_boundary(self, boundaries):
+        while True:
+            line, at_line_start = self.readline()
+            if not line:
+                self.marker = None
+                return None
+            if at_line_start:
+                marker = self.match_boundary(line, boundaries)
+                if marker is not None:
+                    self.marker = marker
+                    return marker
+
+    def parts(self):
+        """Yield every leaf :class:`MimePart` in document order."""
+        return self._walk(self.headers, [])
+
+    def _walk(self, headers, boundaries):
+        boundary = headers.get_param('boundary') if headers.get_content_maintype() == 'multipart' else None
+        if not boundary:
+            part = MimePart(self, headers, boundaries)
+            yield part
+            part.skip()
+            return
+
+        inner = boundaries + [str(boundary).encode('ascii', 'replace')]
+        marker = self._skip_to_boundary(inner)
+        while marker is not None and marker[0] == inner[-1] and not marker[1]:
+            yield from self._walk(_header_block(self), inner)
+            marker = self.marker
+        if marker is not None and marker[0] == inner[-1]:
+            # Skip the epilogue up to the enclosing boundary
+            self._skip_to_boundary(boundaries)
+
+    def close(self):
+        # Only close files we opened; callers own the file objects they pass in
+        if self._owns_file:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _spooled_text(spool):
+    reader = io.TextIOWrapper(spool, encoding='utf-8')
+    while True:
+        chunk = reader.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        yield chunk
+    reader.close()
+
+
+def _first_plain_text(parts):
+    for part in parts:
+        if part.content_type == 'text/plain' and not part.is_attachment:
+            yield from part.iter_text()
+            return
+
+
+def check_eml(spam_checker, source, time_budget=None):
+    """
+    Stream a raw .eml message through SpamChecker.check_stream.
+
+    The first text/html part is streamed as the HTML body and the first
+    text/plain part as the text body. When the plain part comes first, as in
+    most multipart/alternative messages, it is held in a spooled temporary
+    file that moves to disk beyond SPOOL_SIZE.
+    """
+    with EmlReader(source) as reader:
+        parts = reader.parts()
+        html_part = None
+        spool = None
+
+        for part in parts:
+            if part.is_attachment:
+                continue
+            if part.content_type == 'text/html':
+                html_part = part
+                break
+            if part.content_type == 'text/plain' and spool is None:
+                spool = SpooledTemporaryFile(max_size=SPOOL_SIZE)
+                for text in part.iter_text():
+                    spool.write(text.encode('utf-8'))
+                spool.seek(0)
+
+        html_source = html_part.iter_text() if html_part is not None else None
+        text_source = _spooled_text(spool) if spool is not None else _first_plain_text(parts)
+
+        results = spam_checker.check_stream(reader.subject, html_source, text_source, time_budget=time_budget)
+        results['message'] = {
+            'subject': reader.subject,
+            'sender_email': reader.sender_email
+        }
+        return results
@@ -0,0 +1,456 @@
+import re
+from html import unescape
+
+CHUNK_SIZE = 64 * 1024
+
+# Unparsed input the scanner may hold while waiting for a tag to close
+MAX_PENDING = 256 * 1024
+
+INVISIBLE_TAGS = {'script', 'style', 'head', 'title'}
+
+# Attribute text of a tag; quoted values may contain '>'
+TAG_ATTRIBUTES = r'''[^>"']*(?:(?:"[^"]*"|'[^']*')[^>"']*)*'''
+
+# A quoted attribute value with '>' in it, or a quote left open
+QUOTED_CLOSE = r'''[^>"']*(?:(?:"[^">]*"|'[^'>]*')[^>"']*)*["'][^"']*>'''
+
+# Tags the scanner acts on: comments, the invisible and raw text elements,
+# links and images (their end tags do nothing), and any tag with a style attribute
+TAG_PATTERN = re.compile(
+    r'<(?:(?P<comment>!--.*?--\s*>)'
+    r'|(?P<end>/?)(?P<name>script|style|head|title)(?=[\s/>])(?P<attrs>' + TAG_ATTRIBUTES + r')>'
+    r'|(?P<link>a|area|img)(?=[\s/>])(?P<link_attrs>' + TAG_ATTRIBUTES + r')>'
+    # A quote holding '>' hides where the tag ends, so such tags are checked too
+    r'|(?P<styled>[a-z][^\s/>]*)(?=[^>]*?\bstyle\s*=|' + QUOTED_CLOSE + r')(?P<styled_attrs>' + TAG_ATTRIBUTES + r')>)',
+    re.IGNORECASE | re.DOTALL
+)
+COMMENT_END_PATTERN = re.compile(r'--\s*>')
+# Joins stretches of text and tags; dropped with the tags
+TEXT_SEPARATOR = '</>'
+
+# Any other markup, dropped from the text
+MARKUP_PATTERN = re.compile(r'<(?:[A-Za-z/]' + TAG_ATTRIBUTES + r'|[!?][^>]*)>')
+# Where a tag starts
+TAG_OPEN_PATTERN = re.compile(r'<[A-Za-z/!?]')
+# Text and whole tags, up to the first tag that is still open, checked over
+# the last OPEN_TAG_WINDOW characters of the input
+OPEN_TAG_WINDOW = 4096
+COMPLETE_PATTERN = re.compile(r'(?:[^<]+|<(?![A-Za-z/!?])|' + MARKUP_PATTERN.pattern + r')*')
+RAW_END_PATTERNS = {
+    'script': re.compile(r'</script(?=[\s/>])', re.IGNORECASE),
+    'style': re.compile(r'</style(?=[\s/>])', re.IGNORECASE),
+}
+ATTRIBUTE_PATTERN = re.compile(r'''([^\s/>=][^\s/=>]*)(?:\s*(=)+\s*('[^']*'|"[^"]*"|(?!['"])[^>\s]*))?''')
+
+ASCII_UPPER = bytes(range(ord('A'), ord('Z') + 1))
+ASCII_LOWER = bytes(range(ord('a'), ord('z') + 1))
+
+IMPORTANT = re.compile(r'!\s*important\s*$')
+LENGTH = re.compile(r'([+-]?(?:\d+\.?\d*|\.\d+))([a-z%]*)')
+
+
+def css_value(value):
+    """Lowercase a declaration value, drop ``!important`` and collapse whitespace."""
+    return ' '.join(IMPORTANT.sub('', value.lower()).split())
+
+
+def parse_style(style):
+    """Split an inline ``style`` attribute into a ``{property: value}`` dict of normalized values."""
+    return {name: css_value(value) for name, value in _declarations(style).items()}
+
+
+def _declarations(style):
+    # {property: raw value}, the last declaration of a property winning. Walking
+    # the distinct declarations backwards keeps that rule while repeats of the
+    # same declaration are only split once.
+    declarations = {}
+    for declaration in dict.fromkeys(reversed(style.lower().split(';'))):
+        name, sep, value = declaration.partition(':')
+        if sep:
+            declarations.setdefault(name.strip(), value)
+    return declarations
+
+
+NAMED_COLORS = {'white': '#ffffff', 'black': '#000000'}
+
+
+def _normalize_color(value):
+    value = NAMED_COLORS.get(value, value)
+    if len(value) == 4 and value.startswith('#'):
+        value = '#' + ''.join(ch * 2 for ch in value[1:])
+    return value
+
+
+def _is_zero_size(value):
+    # Any unit, since zero is zero in all of them
+    match = LENGTH.fullmatch(value)
+    return match is not None and float(match.group(1)) == 0
+
+
+def hidden_text_signals(style):
+    """Return the reasons an inline style would hide its text, if any."""
+    return _declaration_signals(_declarations(style))
+
+
+def stylesheet_signals(css):
+    """Hidden-text signals from every rule block of a ``<style>`` sheet.
+
+    Blocks are found with plain string splitting, so the cost is linear in the
+    size of the sheet whatever its contents.
+    """
+    signals = []
+    for block in css.split('}'):
+        _, sep, declarations = block.rpartition('{')
+        if sep:
+            signals.extend(_declaration_signals(_declarations(declarations)))
+    return signals
+
+
+def _declaration_signals(declarations):
+    signals = []
+
+    def value(name, default=None):
+        raw = declarations.get(name)
+        return default if raw is None else css_value(raw)
+
+    color = _normalize_color(value('color', ''))
+    background = value('background-color') or value('background', '').split(' ')[0]
+    if color and color == _normalize_color(background):
+        signals.append('color matches background')
+
+    font_size = value('font-size')
+    if font_size is not None and _is_zero_size(font_size):
+        signals.append('zero font size')
+
+    if value('display') == 'none':
+        signals.append('display none')
+
+    if value('visibility') in ('hidden', 'collapse'):
+        signals.append('visibility hidden')
+
+    return signals
+
+
+class HTMLScanner:
+    """Collects the HTML signals the analyzers need in one tokenizer pass.
+
+    Tokenizing is done with compiled regexes rather than ``html.parser``:
+    one search finds the next tag the scanner acts on (links, images, tags
+    with a ``style`` attribute, comments and the invisible elements), and
+    the text before it is stripped of the remaining tags in a single
+    ``sub``. Script and style contents are raw text, as in ``html.parser``.
+
+    ``max_items`` caps how many link and image URLs are kept (counts stay
+    exact). A tag left open for more than ``MAX_PENDING`` characters, such as
+    an image with a huge inline data URI, is counted from its opening and
+    then skipped rather than buffered, so memory stays bounded.
+    """
+
+    def __init__(self, keep_text=False, max_items=None):
+        self.keep_text = keep_text
+        self.max_items = max_items
+        self.text_parts = []
+        self.links = []
+        self.images = []
+        self.link_count = 0
+        self.image_count = 0
+        self.skipped_characters = 0
+        self._skipping_tag = False
+        self.hidden_text = []
+        self.upper_count = 0
+        self.lower_count = 0
+        self._text_length = 0
+        self._leading_whitespace = 0
+        self._trailing_whitespace = 0
+        self._seen_text = False
+        self._invisible_depth = 0
+        self._stylesheet = None
+        # Unparsed input: an incomplete tag, entity or raw-text end tag
+        self._pending = ''
+        # 'script' or 'style' while inside one
+        self._raw_tag = None
+        self.truncated = False
+
+    @property
+    def text_length(self):
+        """Length of the visible text with surrounding whitespace stripped."""
+        if not self._seen_text:
+            return 0
+        return self._text_length - self._leading_whitespace - self._trailing_whitespace
+
+    @property
+    def visible_text(self):
+        """The visible text, only collected when ``keep_text`` is set."""
+        return ''.join(self.text_parts)
+
+    @property
+    def caps_ratio(self):
+        letters = self.upper_count + self.lower_count
+        return self.upper_count / letters if letters else 0.0
+
+    def feed(self, data):
+        if self._skipping_tag:
+            end = data.find('>')
+            if end < 0:
+                self.skipped_characters += len(data)
+                return
+            self.skipped_characters += end + 1
+            data = data[end + 1:]
+            self._skipping_tag = False
+
+        self._parse(self._pending + data, final=False)
+
+        if len(self._pending) > MAX_PENDING:
+            self._skip_pending()
+
+    def close(self):
+        self._parse(self._pending, final=True)
+
+    def _skip_pending(self):
+        pending = self._pending
+        self._pending = ''
+        self.skipped_characters += len(pending)
+        if not pending.startswith('<'):
+            return
+        # Count the oversized tag from its opening, then drop input up to its '>'
+        tag = pending[1:32].split(None, 1)[0].lower() if len(pending) > 1 else ''
+        head = pending[:1024].lower()
+        if tag in ('a', 'area') and 'href' in head:
+            self._add_link('')
+        elif tag == 'img':
+            self._add_image('')
+        self._skipping_tag = True
+
+    def _parse(self, data, final):
+        pos = 0
+        length = len(data)
+        # Visible stretches of text and other tags, handled in one go at the end
+        visible = []
+        tail = ''
+        open_comment = -1
+        while pos < length:
+            if self._raw_tag is not None:
+                pos = self._parse_raw(data, pos, final)
+                if self._raw_tag is not None:
+                    break
+                continue
+
+            if open_comment < pos:
+                open_comment = _open_comment(data, pos)
+            match = TAG_PATTERN.search(data, pos)
+            # Skip matches inside another tag, e.g. '<a ...>' in a quoted attribute value
+            while match is not None and match.start() < open_comment and _inside_tag(data, pos, match.start()):
+                match = TAG_PATTERN.search(data, match.start() + 1)
+            if match is None or match.start() > open_comment:
+                end = min(open_comment, _text_end(data, pos))
+                if not self._invisible_depth:
+                    visible.append(data[pos:end])
+                    if final:
+                        # Markup left incomplete at the end is text, as in html.parser
+                        tail = data[end:]
+                pos = length if final else end
+                break
+
+            start = match.start()
+            if start > pos and not self._invisible_depth:
+                visible.append(data[pos:start])
+            pos = match.end()
+            comment, closing, name, attrs, link, link_attrs, styled, styled_attrs = match.groups()
+            if link is not None:
+                # Never closing, raw or invisible, so a trailing '/' changes nothing
+                self._start_tag(link.lower(), link_attrs)
+            elif comment is None:
+                if name is None:
+                    name, attrs = styled, styled_attrs
+                self._handle_tag(closing, name.lower(), attrs)
+
+        if visible:
+            # The separator is dropped like any tag, and keeps entities from
+            # being joined across the stretches
+            self._add_text(TEXT_SEPARATOR.join(visible))
+        if tail:
+            self._add_text(tail, markup=False)
+        self._pending = data[pos:]
+
+    def _parse_raw(self, data, pos, final):
+        # Script and style contents run to the matching end tag
+        end = RAW_END_PATTERNS[self._raw_tag].search(data, pos)
+        if end is None:
+            # Hold back what may be the start of a split end tag
+            stop = len(data) if final else max(pos, len(data) - 9)
+            self._add_raw(data[pos:stop])
+            if final:
+                self._raw_tag = None
+            return stop
+        close = data.find('>', end.end())
+        if close < 0 and not final:
+            self._add_raw(data[pos:end.start()])
+            return end.start()
+        self._add_raw(data[pos:end.start()])
+        self._end_tag(self._raw_tag)
+        self._raw_tag = None
+        return len(data) if close < 0 else close + 1
+
+    def _handle_tag(self, closing, name, attrs):
+        if closing:
+            self._end_tag(name)
+            return
+        self._start_tag(name, attrs)
+        if attrs.endswith('/'):
+            # Self-closing, as html.parser's handle_startendtag
+            if name in INVISIBLE_TAGS:
+                self._invisible_depth -= 1
+            if name == 'style':
+                self._stylesheet = None
+        elif name in RAW_END_PATTERNS:
+            self._raw_tag = name
+
+    def _start_tag(self, tag, attrs):
+        if tag in INVISIBLE_TAGS:
+            self._invisible_depth += 1
+        if tag == 'style':
+            self._stylesheet = []
+
+        attributes = parse_attributes(attrs)
+        if tag in ('a', 'area') and 'href' in attributes:
+            self._add_link(attributes['href'] or '')
+        elif tag == 'img':
+            self._add_image(attributes.get('src') or '')
+
+        style = attributes.get('style')
+        if style:
+            self._add_hidden_text(hidden_text_signals(style))
+
+    def _end_tag(self, tag):
+        if tag in INVISIBLE_TAGS and self._invisible_depth:
+            self._invisible_depth -= 1
+        if tag == 'style' and self._stylesheet is not None:
+            self._add_hidden_text(stylesheet_signals(''.join(self._stylesheet)))
+            self._stylesheet = None
+
+    def _add_hidden_text(self, signals):
+        if len(self.hidden_text) < 100:
+            self.hidden_text.extend(signals)
+
+    def _add_link(self, href):
+        self.link_count += 1
+        if self.max_items is None or len(self.links) < self.max_items:
+            self.links.append(href)
+
+    def _add_image(self, src):
+        self.image_count += 1
+        if self.max_items is None or len(self.images) < self.max_items:
+            self.images.append(src)
+
+    def _flush_stylesheet(self):
+        # Check the complete rule blocks seen so far and keep only the open one
+        css = ''.join(self._stylesheet)
+        cut = css.rfind('}') + 1
+        self._add_hidden_text(stylesheet_signals(css[:cut]))
+        self._stylesheet = [css[cut:]]
+
+    def _add_raw(self, data):
+        if self._stylesheet is not None and data:
+            self._stylesheet.append(data)
+            if len(self._stylesheet) > 64:
+                self._flush_stylesheet()
+
+    def _add_text(self, data, markup=True):
+        # With ``markup``, ``data`` is text with whole tags in it, which are dropped
+        if markup and '<' in data:
+            if '&' in data:
+                data = ''.join(unescape(piece) if '&' in piece else piece for piece in MARKUP_PATTERN.split(data))
+            else:
+                data = MARKUP_PATTERN.sub('', data)
+        elif '&' in data:
+            data = unescape(data)
+        if not data:
+            return
+
+        stripped = data.strip()
+        if stripped:
+            if not self._seen_text:
+                self._leading_whitespace = self._text_length + len(data) - len(data.lstrip())
+                self._seen_text = True
+            self._trailing_whitespace = len(data) - len(data.rstrip())
+        else:
+            self._trailing_whitespace += len(data)
+        self._text_length += len(data)
+        if self.keep_text:
+            self.text_parts.append(data)
+
+        if data.isascii():
+            encoded = data.encode('ascii')
+            self.upper_count += len(encoded) - len(encoded.translate(None, ASCII_UPPER))
+            self.lower_count += len(encoded) - len(encoded.translate(None, ASCII_LOWER))
+        else:
+            self.upper_count += sum(map(str.isupper, data))
+            self.lower_count += sum(map(str.islower, data))
+
+
+def parse_attributes(attrs):
+    """``{name: value}`` for a tag's attribute text; names are lower-cased and
+    values unescaped, a bare name maps to None and the last duplicate wins."""
+    attributes = {}
+    for name, equals, value in ATTRIBUTE_PATTERN.findall(attrs):
+        if not equals:
+            value = None
+        else:
+            if value[:1] in ('"', "'") and value[-1:] == value[:1] and len(value) > 1:
+                value = value[1:-1]
+            if '&' in value:
+                value = unescape(value)
+        attributes[name.lower()] = value
+    return attributes
+
+
+def _inside_tag(data, pos, start):
+    # Whether ``start`` is within a tag opened after ``pos``
+    after = data.rfind('>', pos, start) + 1 or pos
+    return data.find('<', after, start) >= 0 and TAG_OPEN_PATTERN.search(data, after, start) is not None
+
+
+def _open_comment(data, pos):
+    # Where the first comment from ``pos`` that never ends starts; everything
+    # after it is part of it. The end of ``data`` when there is none
+    comment = data.find('<!--', pos)
+    while comment >= 0:
+        close = COMMENT_END_PATTERN.search(data, comment + 4)
+        if close is None:
+            return comment
+        comment = data.find('<!--', close.end())
+    return len(data)
+
+
+def _text_end(data, pos):
+    # How far text from ``pos`` can be handled before more input arrives: up
+    # to a tag that is still open, or an entity split by the end
+    end = len(data)
+    # Start from a tag end shortly before the end; a tag still open there
+    # does not reach further back unless it is thousands of characters long
+    start = data.rfind('>', pos, max(pos, end - OPEN_TAG_WINDOW)) + 1 or pos
+    complete = COMPLETE_PATTERN.match(data, start).end()
+    if complete < end:
+        return complete
+    if data.endswith('<'):
+        return end - 1
+    entity = data.rfind('&', max(pos, end - 32))
+    if entity >= 0 and ';' not in data[entity:]:
+        return entity
+    return end
+
+
+def scan_html(html_content, chunk_size=CHUNK_SIZE, keep_text=False, budget=None):
+    """Feed ``html_content`` to an :class:`HTMLScanner` in fixed-size chunks.
+
+    If a :class:`~utils.budget.TimeBudget` runs out between chunks the scan
+    stops and the scanner is returned with ``truncated`` set.
+    """
+    scanner = HTMLScanner(keep_text=keep_text)
+    for start in range(0, len(html_content), chunk_size):
+        if budget is not None and budget.exhausted():
+            scanner.truncated = True
+            return scanner
+        scanner.feed(html_content[start:start + chunk_size])
+    scanner.close()
+    return scanner
@@ -0,0 +1,106 @@
+import threading
+from time import perf_counter
+
+# Upper bounds in milliseconds; the last bucket catches everything slower
+BUCKET_BOUNDS_MS = (0.1, 0.5, 1, 5, 10, 50, 100, 500, 1000, 5000, float('inf'))
+
+
+class Histogram:
+    def __init__(self, bounds=BUCKET_BOUNDS_MS):
+        self.bounds = bounds
+        self.buckets = [0] * len(bounds)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.hits = 0
+
+    def observe(self, value_ms, hits=0):
+        for index, bound in enumerate(self.bounds):
+            if value_ms <= bound:
+                self.buckets[index] += 1
+                break
+        self.count += 1
+        self.total += value_ms
+        self.hits += hits
+        if value_ms > self.max:
+            self.max = value_ms
+
+    def snapshot(self):
+        return {
+            'count': self.count,
+            'total_ms': round(self.total, 3),
+            'mean_ms': round(self.total / self.count, 3) if self.count else 0.0,
+            'max_ms': round(self.max, 3),
+            'hits': self.hits,
+            'buckets': {
+                ('+Inf' if bound == float('inf') else str(bound)): count
+                for bound, count in zip(self.bounds, self.buckets)
+            }
+        }
+
+
+class MetricsRegistry:
+    """Process-wide per-rule latency histograms, keyed like ``spam_checker.patterns``."""
+
+    def __init__(self):
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name, value_ms, hits=0):
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = Histogram()
+            histogram.observe(value_ms, hits)
+
+    def snapshot(self):
+        with self._lock:
+            return {name: histogram.snapshot() for name, histogram in sorted(self._histograms.items())}
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+
+
+METRICS = MetricsRegistry()
+
+
+class RuleRecorder:
+    """Records wall time and hit counts per rule for one check."""
+
+    enabled = True
+
+    def __init__(self, component, registry=METRICS):
+        self.component = component
+        self.registry = registry
+        self.rules = {}
+
+    def start(self):
+        return perf_counter()
+
+    def stop(self, rule, started, hits=0):
+        elapsed_ms = (perf_counter() - started) * 1000
+        self.rules[rule] = {'time_ms': round(elapsed_ms, 3), 'hits': hits}
+        if self.registry is not None:
+            self.registry.observe(f'{self.component}.{rule}', elapsed_ms, hits)
+
+    def report(self):
+        return {
+            'rules': self.rules,
+            'total_ms': round(sum(rule['time_ms'] for rule in self.rules.values()), 3)
+        }
+
+
+class NullRecorder:
+    """Stand-in used when instrumentation is off; every call is a no-op."""
+
+    enabled = False
+
+    def start(self):
+        return 0.0
+
+    def stop(self, rule, started, hits=0):
+        pass
+
+
+NULL_RECORDER = NullRecorder()
@@ -0,0 +1,117 @@
+"""
+Sending-IP reputation: IP blocklists, reverse DNS and forward-confirmed reverse DNS.
+
+Pools are given as addresses and CIDR ranges. Every IP in a pool is checked
+at once, bounded by ``max_concurrent``. Blocklists are queried by reversed
+octets (``4.3.2.1.zen.spamhaus.org`` for 1.2.3.4), or nibbles for IPv6.
+FCrDNS holds when a name from the IP's PTR record resolves back to the IP.
+All lookups go through the shared :class:`~utils.dns_resolver.AsyncDNSResolver`
+and its cache.
+"""
+import asyncio
+import ipaddress
+
+from utils.blocklist import BlocklistChecker
+
+DEFAULT_IP_BLOCKLISTS = (
+    'zen.spamhaus.org',
+    'b.barracudacentral.org',
+    'bl.spamcop.net',
+    'dnsbl.sorbs.net:warning',
+    'psbl.surriel.com:warning',
+    'bl.mailspike.net:warning',
+)
+
+# Largest pool accepted in one check (a /20)
+MAX_POOL_SIZE = 4096
+# IPs checked at once
+MAX_CONCURRENT_IPS = 64
+# PTR names followed when confirming reverse DNS
+MAX_PTR_NAMES = 5
+
+
+def expand_pools(pools, limit=MAX_POOL_SIZE):
+    """Expand addresses and CIDR ranges into unique IPs; raises ValueError past ``limit``."""
+    if isinstance(pools, str):
+        pools = [pools]
+    ips = {}
+    for pool in pools:
+        network = ipaddress.ip_network(str(pool).strip(), strict=False)
+        if network.num_addresses > limit:
+            raise ValueError(f"{pool} has {network.num_addresses} addresses, more than {limit}")
+        # Network and broadcast addresses never send mail
+        for ip in (network.hosts() if network.num_addresses > 2 else network):
+            ips[ip] = None
+            if len(ips) > limit:
+                raise ValueError(f"IP pools have more than {limit} addresses")
+    return list(ips)
+
+
+def dnsbl_label(ip):
+    """The blocklist query label for ``ip``: reversed octets, or reversed nibbles for IPv6."""
+    # reverse_pointer is the same label under in-addr.arpa / ip6.arpa
+    return ip.reverse_pointer.rsplit('.', 2)[0]
+
+
+class IPBlocklistChecker(BlocklistChecker):
+    """IP (DNSBL) listings."""
+
+    default_zones = DEFAULT_IP_BLOCKLISTS
+
+    async def check(self, ip):
+        result = await self.check_label(dnsbl_label(ip), str(ip))
+        result['ip'] = result.pop('subject')
+        return result
+
+
+class IPReputationChecker:
+    """Checks sending IPs against IP blocklists and for forward-confirmed reverse DNS."""
+
+    def __init__(self, resolver, blocklists=None, max_concurrent=MAX_CONCURRENT_IPS, max_pool_size=MAX_POOL_SIZE):
+        self.resolver = resolver
+        self.blocklists = blocklists or IPBlocklistChecker(resolver)
+        self.max_concurrent = max_concurrent
+        self.max_pool_size = max_pool_size
+        self._semaphore = None
+
+    async def check_pools(self, pools):
+        """Check every IP in ``pools`` and summarize the results."""
+        ips = expand_pools(pools, self.max_pool_size)
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrent)
+        results = await asyncio.gather(*(self._check_bounded(ip) for ip in ips))
+        return {
+            'checked': len(results),
+            'blacklisted': [result['ip'] for result in results if result['status'] == 'blacklisted'],
+            'warning': [result['ip'] for result in results if result['status'] == 'warning'],
+            'without_fcrdns': [result['ip'] for result in results if result['fcrdns'] is False],
+            'unknown': [result['ip'] for result in results if result['status'] == 'unknown'],
+            'ips': results
+        }
+
+    async def _check_bounded(self, ip):
+        async with self._semaphore:
+            return await self.check_ip(ip)
+
+    async def check_ip(self, ip):
+        """Blocklist listings, PTR names and FCrDNS for one IP."""
+        ip = ipaddress.ip_address(ip)
+        listing, (ptr_names, fcrdns) = await asyncio.gather(self.blocklists.check(ip), self._check_reverse_dns(ip))
+        listing.update({'ptr': ptr_names, 'fcrdns': fcrdns})
+        return listing
+
+    async def _check_reverse_dns(self, ip):
+        answer = await self.resolver.query(ip.reverse_pointer, 'PTR')
+        if answer.status == 'error':
+            # Unknown, not a failure
+            return [], None
+        names = answer.records[:MAX_PTR_NAMES]
+        rdtype = 'A' if ip.version == 4 else 'AAAA'
+        forward = await asyncio.gather(*(self.resolver.query(name, rdtype) for name in names))
+        confirmed = any(
+            ipaddress.ip_address(address) == ip for answer in forward for address in answer.records
+        )
+        if not confirmed and forward and all(answer.status == 'error' for answer in forward):
+            # No forward lookup answered, so nothing was disproved
+            return names, None
+        return names, confirmed
@@ -0,0 +1,517 @@
+import re
+from collections import deque
+from operator import itemgetter
+
+try:
+    from re import _parser as sre_parse
+except ImportError:
+    import sre_parse
+
+# Keyword count from which one automaton pass beats a substring scan per keyword
+AUTOMATON_MIN_KEYWORDS = 200
+
+# Characters matched between time-budget checks
+BUDGET_CHECK_INTERVAL = 32 * 1024
+
+# Matches in a row without a new rule hit before PatternSet.hits stops the
+# fused sweep and searches for the remaining rules one by one
+MAX_STALE_MATCHES = 256
+
+# Rules that cannot share one pattern with others: group references, named
+# groups, conditionals and inline global flags
+UNFUSIBLE_PATTERN = re.compile(r'\\[1-9]|\(\?P[<=]|\(\?\(|\(\?[aiLmsux]+\)')
+
+_CATEGORY_CLASSES = {
+    sre_parse.CATEGORY_DIGIT: r'\d', sre_parse.CATEGORY_NOT_DIGIT: r'\D',
+    sre_parse.CATEGORY_SPACE: r'\s', sre_parse.CATEGORY_NOT_SPACE: r'\S',
+    sre_parse.CATEGORY_WORD: r'\w', sre_parse.CATEGORY_NOT_WORD: r'\W',
+}
+# Non-ASCII characters that match an ASCII letter case-insensitively
+_IGNORECASE_EXTRAS = {'i': '\u0130\u0131', 'k': '\u212a', 's': '\u017f'}
+
+
+class KeywordMatcher:
+    """Finds every keyword in a text, overlapping matches included.
+
+    Sets of ``automaton_min_keywords`` keywords or more are compiled into an
+    Aho-Corasick automaton and matched in a single pass; smaller sets are
+    cheaper to match with one ``str.find`` scan per keyword.
+    """
+
+    def __init__(self, keywords, automaton_min_keywords=AUTOMATON_MIN_KEYWORDS):
+        self.keywords = []
+        seen = set()
+        for keyword in keywords:
+            if not keyword or keyword in seen:
+                continue
+            seen.add(keyword)
+            self.keywords.append(keyword)
+        self.longest = max(map(len, self.keywords), default=0)
+        # Keywords that can overlap themselves (e.g. 'ABAB') need one find per
+        # occurrence; the rest are counted with str.count
+        self._self_overlapping = [
+            any(keyword[:size] == keyword[-size:] for size in range(1, len(keyword))) for keyword in self.keywords
+        ]
+
+        self.uses_automaton = len(self.keywords) >= automaton_min_keywords
+        if self.uses_automaton:
+            self._goto = [{}]
+            self._fail = [0]
+            self._output = [()]
+            for index, keyword in enumerate(self.keywords):
+                self._add(keyword, index)
+            self._build_failure_links()
+
+    def _add(self, keyword, index):
+        state = 0
+        for ch in keyword:
+            next_state = self._goto[state].get(ch)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][ch] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append(())
+            state = next_state
+        self._output[state] = self._output[state] + (index,)
+
+    def _build_failure_links(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and ch not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[next_state] = self._goto[fallback].get(ch, 0)
+                # Merge the suffix outputs so matching never walks the fail chain
+                self._output[next_state] = self._output[next_state] + self._output[self._fail[next_state]]
+
+    def _advance(self, text, state, hits):
+        # Automaton only: appends (end offset, keyword index) for every hit in
+        # ``text`` and returns the state to resume from with the next chunk
+        goto = self._goto
+        fail = self._fail
+        output = self._output
+
+        state = state or 0
+        for position, ch in enumerate(text):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if output[state]:
+                for index in output[state]:
+                    hits.append((position, index))
+        return state
+
+    def _scan(self, text, tail, position, counts, offsets, max_offsets):
+        # Substring scan of one chunk: adds to ``counts`` and records up to
+        # ``max_offsets`` offsets per keyword (None for all), finding only the
+        # occurrences it records and counting the rest with str.count. The
+        # state is the end of the previous chunk, one character shorter than
+        # the longest keyword, so keywords crossing the boundary are found.
+        buffer = tail + text if tail else text
+        skip = len(buffer) - len(text)
+        base = position - skip
+        for index, keyword in enumerate(self.keywords):
+            length = len(keyword)
+            # Matches ending inside the tail were reported with the previous chunk
+            start = max(0, skip - length + 1)
+            step = 1 if self._self_overlapping[index] else length
+            kept = offsets.get(keyword)
+            room = None if max_offsets is None else max_offsets - (len(kept) if kept else 0)
+            found = 0
+            while room is None or room > 0:
+                start = buffer.find(keyword, start)
+                if start == -1:
+                    break
+                if kept is None:
+                    kept = offsets[keyword] = []
+                kept.append(base + start)
+                found += 1
+                if room is not None:
+                    room -= 1
+                start += step
+            if start != -1:
+                if step == length:
+                    found += buffer.count(keyword, start)
+                else:
+                    start = buffer.find(keyword, start)
+                    while start != -1:
+                        found += 1
+                        start = buffer.find(keyword, start + 1)
+            counts[index] += found
+        keep = self.longest - 1
+        return buffer[-keep:] if keep > 0 else ''
+
+    def find_all(self, text, max_offsets=None):
+        """Yield ``(offset, keyword)`` for every occurrence, overlapping included.
+
+        With ``max_offsets`` only the first ``max_offsets`` occurrences of each
+        keyword are yielded.
+        """
+        stream = self.stream(max_offsets)
+        stream.feed(text)
+        order = {keyword: index for index, keyword in enumerate(self.keywords)}
+        # In order of where each occurrence ends, as the automaton reports them
+        yield from sorted(
+            ((offset, keyword) for keyword, offsets in stream.offsets.items() for offset in offsets),
+            key=lambda hit: (hit[0] + len(hit[1]), order[hit[1]])
+        )
+
+    def count(self, text):
+        """Return a list of hit counts aligned with ``self.keywords``."""
+        stream = self.stream(0)
+        stream.feed(text)
+        return stream.counts
+
+    def search(self, text, max_offsets=100):
+        """Return ``{keyword: [offsets]}`` for every keyword found in ``text``.
+
+        Only the first ``max_offsets`` offsets per keyword are kept; use
+        :meth:`stream` when exact counts are needed as well.
+        """
+        stream = self.stream(max_offsets)
+        stream.feed(text)
+        return stream.offsets
+
+    def stream(self, max_offsets=100):
+        return KeywordStream(self, max_offsets)
+
+
+class KeywordStream:
+    """Feeds text to a :class:`KeywordMatcher` chunk by chunk.
+
+    Matcher state carries over between chunks, so keywords split across a
+    chunk boundary are still found. Hit counts are exact; only the first
+    ``max_offsets`` offsets per keyword are kept so memory stays bounded.
+    With a :class:`~utils.budget.TimeBudget`, matching stops once it is
+    exhausted and ``truncated`` is set; later text is ignored.
+    """
+
+    def __init__(self, matcher, max_offsets=100):
+        self.matcher = matcher
+        self.max_offsets = max_offsets
+        self.counts = [0] * len(matcher.keywords)
+        self.offsets = {}
+        self._state = None
+        self._position = 0
+        self.truncated = False
+
+    def feed(self, text, budget=None):
+        if budget is None:
+            self._feed(text)
+            return
+        for start in range(0, len(text), BUDGET_CHECK_INTERVAL):
+            if self.truncated or budget.exhausted():
+                self.truncated = True
+                return
+            self._feed(text[start:start + BUDGET_CHECK_INTERVAL])
+
+    def _feed(self, text):
+        matcher = self.matcher
+        if not matcher.uses_automaton:
+            self._state = matcher._scan(text, self._state, self._position, self.counts, self.offsets,
+                                        self.max_offsets)
+            self._position += len(text)
+            return
+
+        hits = []
+        self._state = matcher._advance(text, self._state, hits)
+        keywords = matcher.keywords
+        for position, index in hits:
+            self.counts[index] += 1
+            keyword = keywords[index]
+            offsets = self.offsets.setdefault(keyword, [])
+            if self.max_offsets is None or len(offsets) < self.max_offsets:
+                offsets.append(self._position + position - len(keyword) + 1)
+        self._position += len(text)
+
+
+def first_characters(patterns, flags=0):
+    """Return a character class body matching every character a match of
+    ``patterns`` can start with, or None when that is unknown or a pattern
+    can match empty."""
+    parts = []
+    for pattern in patterns:
+        try:
+            parsed = sre_parse.parse(pattern, flags)
+        except (re.error, RecursionError, OverflowError):
+            return None
+        if _first_characters(list(parsed), parsed.state.flags, parts):
+            return None
+    return ''.join(parts) if parts else None
+
+
+def _first_characters(items, flags, parts):
+    # Appends the first characters of ``items`` to ``parts``; returns True
+    # when the sequence can match without consuming a character (or when the
+    # first character can't be known, which callers treat the same way)
+    for op, av in items:
+        if op is sre_parse.LITERAL:
+            if _class_literal(av, flags) is None:
+                return True
+            parts.append(_class_literal(av, flags))
+            return False
+        if op is sre_parse.IN:
+            for item_op, item in av:
+                if item_op is sre_parse.LITERAL and _class_literal(item, flags) is not None:
+                    parts.append(_class_literal(item, flags))
+                elif item_op is sre_parse.RANGE and not flags & re.IGNORECASE:
+                    parts.append(f'{re.escape(chr(item[0]))}-{re.escape(chr(item[1]))}')
+                elif item_op is sre_parse.CATEGORY and item in _CATEGORY_CLASSES:
+                    parts.append(_CATEGORY_CLASSES[item])
+                else:
+                    return True
+            return False
+        if op is sre_parse.SUBPATTERN:
+            group, add_flags, del_flags, pattern = av
+            if (add_flags | del_flags) & (re.ASCII | re.LOCALE | re.UNICODE):
+                # Character classes would mean something else inside
+                return True
+            if not _first_characters(list(pattern), (flags | add_flags) & ~del_flags, parts):
+                return False
+        elif op is sre_parse.BRANCH:
+            if any(_first_characters(list(branch), flags, parts) for branch in av[1]):
+                return True
+            return False
+        elif op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT, getattr(sre_parse, 'POSSESSIVE_REPEAT', None)):
+            low, high, item = av
+            if not _first_characters(list(item), flags, parts) and low > 0:
+                return False
+        elif op is getattr(sre_parse, 'ATOMIC_GROUP', None):
+            if not _first_characters(list(av), flags, parts):
+                return False
+        elif op not in (sre_parse.AT, sre_parse.ASSERT, sre_parse.ASSERT_NOT):
+            # ANY, NOT_LITERAL, group references and the like
+            return True
+    return True
+
+
+def _class_literal(code, flags):
+    # None when the characters matching ``code`` case-insensitively aren't known
+    ch = chr(code)
+    if not flags & re.IGNORECASE or ch.lower() == ch.upper():
+        return re.escape(ch)
+    if not ch.isascii():
+        return None
+    lower = ch.lower()
+    return re.escape(lower + ch.upper() + _IGNORECASE_EXTRAS.get(lower, ''))
+
+
+class PatternSet:
+    """A list of regex rules compiled once and swept over a text in one pass.
+
+    Per rule, matches are leftmost and non-overlapping, as ``re.finditer``
+    returns them; empty matches are ignored. The rules are fused into one
+    pattern of lookaheads, one per rule with an empty named group marking
+    where that rule's match ends, so a single ``finditer`` visits every
+    position where any rule matches and reports all of them at once. When
+    the characters a match can start with are known, the pattern leads
+    with them as a character class so the regex engine skips ahead to the
+    candidates. Rules that cannot be fused (backreferences, named groups,
+    conditionals, inline global flags) are swept with their own pattern.
+    """
+
+    def __init__(self, patterns, flags=0):
+        self.patterns = list(patterns)
+        self._regexes = [re.compile(pattern, flags) for pattern in self.patterns]
+
+        fused = [] if flags & re.VERBOSE else [
+            rule for rule, pattern in enumerate(self.patterns) if not UNFUSIBLE_PATTERN.search(pattern)
+        ]
+        self._fused = None
+        if len(fused) > 1:
+            self._fused, self._marks = self._fuse(fused, flags)
+        if self._fused is None:
+            fused = []
+        self._fused_rules = fused
+        self._individual_rules = [rule for rule in range(len(self.patterns)) if rule not in fused]
+
+    def _fuse(self, rules, flags):
+        guard = '|'.join(f'(?:{self.patterns[rule]})' for rule in rules)
+        marks = ''.join(f'(?:(?=(?:{self.patterns[rule]})(?P<_m{rule}>)))?' for rule in rules)
+        first = first_characters((self.patterns[rule] for rule in rules), flags)
+        if first is None:
+            # Every position is a candidate; each match is empty
+            fused = f'(?={guard}){marks}'
+        else:
+            # Consumes the first character, then looks at the match from its start
+            fused = f'[{first}](?<=(?={guard}){marks}[\\s\\S])'
+        try:
+            regex = re.compile(fused, flags)
+        except (re.error, RecursionError, OverflowError):
+            return None, None
+        return regex, itemgetter(*(regex.groupindex[f'_m{rule}'] for rule in rules))
+
+    def _spans(self, text, next_start, pos=0, limit=None, budget=None):
+        # Yields (rule, start, end) per accepted match, and a final None if the
+        # budget ran out first; next_start is updated in place so callers can
+        # resume a sweep over the following text
+        individual = list(self._individual_rules)
+        if self._fused is not None:
+            rules = self._fused_rules
+            marks = self._marks
+            active = [True] * len(rules)
+            count = 0
+            # Starting mid-text keeps the earlier text visible to lookbehinds
+            for match in self._fused.finditer(text, max(pos, min(next_start[rule] for rule in rules))):
+                start = match.start()
+                if limit is not None and start >= limit:
+                    break
+                count += 1
+                if budget is not None and count % 256 == 0 and budget.exhausted():
+                    yield None
+                    return
+                for index, (_, end) in enumerate(marks(match.regs)):
+                    if end < 0:
+                        continue
+                    rule = rules[index]
+                    if not active[index] or start < next_start[rule]:
+                        continue
+                    if end == start:
+                        # A rule matching empty here may still match non-empty
+                        # from here on; finditer sorts that out for it
+                        active[index] = False
+                        next_start[rule] = start
+                        individual.append(rule)
+                        continue
+                    next_start[rule] = end
+                    yield rule, start, end
+
+        count = 0
+        for rule in individual:
+            if budget is not None and budget.exhausted():
+                yield None
+                return
+            for match in self._regexes[rule].finditer(text, max(pos, next_start[rule])):
+                start, end = match.span()
+                if limit is not None and start >= limit:
+                    break
+                count += 1
+                if budget is not None and count % 256 == 0 and budget.exhausted():
+                    yield None
+                    return
+                if end > start:
+                    next_start[rule] = end
+                    yield rule, start, end
+
+    def sweep(self, text, budget=None):
+        """Return one list of matched strings per rule, in rule order.
+
+        With a :class:`~utils.budget.TimeBudget` the sweep stops early once it
+        is exhausted, returning the matches found so far.
+        """
+        matches = [[] for _ in self.patterns]
+        next_start = [0] * len(self.patterns)
+        for span in self._spans(text, next_start, budget=budget):
+            if span is None:
+                break
+            rule, start, end = span
+            matches[rule].append(text[start:end])
+        return matches
+
+    def hits(self, text, budget=None):
+        """Return whether each rule matches anywhere in ``text``, as
+        ``re.search`` would (empty matches count), and whether the budget ran
+        out first.
+
+        The sweep ends once every rule has hit. Rules that already hit may
+        keep matching at most positions; once ``MAX_STALE_MATCHES`` matches in
+        a row find nothing new, the rules still unmatched are searched one by
+        one from there instead. Rules not reached before the budget ran out
+        are reported as not hit.
+        """
+        hit = [False] * len(self.patterns)
+        searches = [(rule, 0) for rule in self._individual_rules]
+        if self._fused is not None:
+            rules = self._fused_rules
+            marks = self._marks
+            left = len(rules)
+            stale = 0
+            for count, match in enumerate(self._fused.finditer(text)):
+                if budget is not None and count % 256 == 255 and budget.exhausted():
+                    return hit, True
+                stale += 1
+                for index, (_, end) in enumerate(marks(match.regs)):
+                    if end >= 0 and not hit[rules[index]]:
+                        hit[rules[index]] = True
+                        left -= 1
+                        stale = 0
+                if not left:
+                    break
+                if stale == MAX_STALE_MATCHES:
+                    # No rule matched before this position without being seen
+                    searches.extend((rule, match.start() + 1) for rule in rules if not hit[rule])
+                    break
+
+        for rule, pos in searches:
+            if budget is not None and budget.exhausted():
+                return hit, True
+            hit[rule] = self._regexes[rule].search(text, pos) is not None
+        return hit, False
+
+    def stream(self, overlap=1024, max_matches=100):
+        return PatternStream(self, overlap, max_matches)
+
+
+class PatternStream:
+    """Sweeps a :class:`PatternSet` over text that arrives in chunks.
+
+    The last ``overlap`` characters of each window are held back and swept
+    with the next chunk, so any match up to ``overlap`` characters long is
+    found exactly once even when it crosses a chunk boundary. A few characters
+    before the window are kept as context for lookbehind assertions. Counts
+    are exact; only the first ``max_matches`` strings per rule are kept.
+    """
+
+    CONTEXT = 16
+
+    def __init__(self, pattern_set, overlap=1024, max_matches=100):
+        self.pattern_set = pattern_set
+        self.overlap = overlap
+        self.max_matches = max_matches
+        self.counts = [0] * len(pattern_set.patterns)
+        self.matches = [[] for _ in pattern_set.patterns]
+        self._buffer = ''
+        self._pos = 0
+        self._base = 0
+        self._next_start = [0] * len(pattern_set.patterns)
+        self.truncated = False
+
+    def feed(self, text, budget=None):
+        if self.truncated:
+            return
+        self._buffer += text
+        limit = len(self._buffer) - self.overlap
+        if limit > self._pos:
+            self._sweep(limit, budget)
+
+    def close(self, budget=None):
+        if not self.truncated:
+            self._sweep(None, budget)
+        self._buffer = ''
+
+    def _sweep(self, limit, budget):
+        buffer = self._buffer
+        base = self._base
+        # _spans works in buffer coordinates; keep next_start in them too
+        next_start = [max(0, start - base) for start in self._next_start]
+        for span in self.pattern_set._spans(buffer, next_start, self._pos, limit, budget):
+            if span is None:
+                # Later windows would miss matches in this one, so the sweep ends here
+                self.truncated = True
+                break
+            rule, start, end = span
+            self.counts[rule] += 1
+            if len(self.matches[rule]) < self.max_matches:
+                self.matches[rule].append(buffer[start:end])
+        self._next_start = [base + start for start in next_start]
+
+        if limit is None:
+            return
+        keep_from = max(0, limit - self.CONTEXT)
+        self._buffer = buffer[keep_from:]
+        self._base = base + keep_from
+        self._pos = limit - keep_from
@@ -0,0 +1,247 @@
+import re
+import string
+from bisect import bisect_right
+from html import unescape
+
+# Bump when the rewriting rules change, so cached results are not reused
+NORMALIZER_VERSION = 2
+
+# Invisible characters used to split trigger words (ZWSP, ZWNJ, ZWJ, word joiner, BOM, soft hyphen)
+ZERO_WIDTH = '\u200b\u200c\u200d\u2060\ufeff\u00ad'
+
+# Greek and Cyrillic letters that render like Latin ones
+HOMOGLYPHS = {
+    'Α': 'A', 'Β': 'B', 'Ε': 'E', 'Ζ': 'Z', 'Η': 'H', 'Ι': 'I', 'Κ': 'K', 'Μ': 'M',
+    'Ν': 'N', 'Ο': 'O', 'Ρ': 'P', 'Τ': 'T', 'Υ': 'Y', 'Χ': 'X',
+    'α': 'a', 'ε': 'e', 'ι': 'i', 'κ': 'k', 'ν': 'v', 'ο': 'o', 'ρ': 'p', 'τ': 't', 'υ': 'u', 'χ': 'x',
+    'А': 'A', 'В': 'B', 'Е': 'E', 'З': '3', 'К': 'K', 'М': 'M', 'Н': 'H', 'О': 'O',
+    'Р': 'P', 'С': 'C', 'Т': 'T', 'У': 'Y', 'Х': 'X', 'Ѕ': 'S', 'І': 'I', 'Ј': 'J',
+    'а': 'a', 'в': 'b', 'е': 'e', 'к': 'k', 'м': 'm', 'н': 'h', 'о': 'o', 'р': 'p',
+    'с': 'c', 'т': 't', 'у': 'y', 'х': 'x', 'ѕ': 's', 'і': 'i', 'ј': 'j',
+}
+
+# One-to-one table: homoglyphs and fullwidth forms to ASCII, so offsets are unchanged
+CANONICAL_TABLE = str.maketrans({
+    **HOMOGLYPHS,
+    **{chr(code): chr(code - 0xFEE0) for code in range(0xFF01, 0xFF5F)},
+})
+
+# Digits standing in for letters inside otherwise alphabetic words
+LEET_TABLE = str.maketrans('013457', 'OIEAST')
+
+# Runs of zero-width characters and entities. Starting with a character class
+# lets the regex engine skip ahead to the next '&' or zero-width character
+REMOVALS_PATTERN = re.compile(
+    '[' + ZERO_WIDTH + '&]'
+    r'(?:(?<=&)(?:#[0-9]{1,7}|#[xX][0-9a-fA-F]{1,6}|[A-Za-z][A-Za-z0-9]{1,31});'
+    '|(?<!&)[' + ZERO_WIDTH + ']*)'
+)
+# Words that start with a letter and mix letters with leet digits, e.g. FR33 or V1AGRA;
+# amounts such as 15OFF start with a digit and are left alone
+LEET_PATTERN = re.compile(r'\b[A-Za-z](?=[A-Za-z0-9]*[A-Za-z])(?=[A-Za-z0-9]*[013457])[A-Za-z0-9]*\b')
+# Three or more single letters joined by one separator each, e.g. F.R.E.E or F R E E;
+# a letter that ends a word with digits in it (the S of OFFICE365 after leet) doesn't count
+SPACED_LETTERS_PATTERN = re.compile(r'(?<![A-Za-z0-9])[A-Za-z](?:[.\-_* ][A-Za-z]){2,}(?![A-Za-z0-9])')
+SEPARATORS_TABLE = str.maketrans('', '', '.-_* ')
+
+# Both patterns above start with an assertion, which makes the regex engine try
+# them at every position. These cheap anchors find the few places they can match
+LEET_DIGIT_PATTERN = re.compile('[013457]')
+SPACED_ANCHOR_PATTERN = re.compile(r'[.\-_* ][A-Za-z][.\-_* ][A-Za-z]')
+WORD_CHARACTERS = frozenset(string.ascii_letters + string.digits)
+
+
+class OffsetMap:
+    """Maps offsets in rewritten text back to the text it was rewritten from.
+
+    Built from segments that were either copied unchanged or replaced; an
+    offset inside a replaced segment maps to the start of what it replaced.
+    """
+
+    def __init__(self, starts, sources, copied):
+        self._starts = starts
+        self._sources = sources
+        self._copied = copied
+
+    def source_offset(self, offset):
+        index = bisect_right(self._starts, offset) - 1
+        if index < 0:
+            return offset
+        if self._copied[index]:
+            return self._sources[index] + offset - self._starts[index]
+        return self._sources[index]
+
+
+def _leet_words(text):
+    # LEET_PATTERN.finditer(text), only tried from the start of words with a leet digit
+    pos = 0
+    while True:
+        digit = LEET_DIGIT_PATTERN.search(text, pos)
+        if digit is None:
+            return
+        start = digit.start()
+        while start > pos and text[start - 1] in WORD_CHARACTERS:
+            start -= 1
+        match = LEET_PATTERN.match(text, start)
+        if match is None:
+            pos = digit.end()
+        else:
+            yield match
+            pos = match.end()
+
+
+def _spaced_letters(text):
+    # SPACED_LETTERS_PATTERN.finditer(text); a match starts with a letter, a
+    # separator and another letter and separator, so only the letter before
+    # each anchor is tried
+    end = 0
+    pos = 0
+    while True:
+        anchor = SPACED_ANCHOR_PATTERN.search(text, pos)
+        if anchor is None:
+            return
+        start = anchor.start() - 1
+        match = SPACED_LETTERS_PATTERN.match(text, start) if start >= end else None
+        if match is None:
+            pos = anchor.start() + 1
+        else:
+            yield match
+            end = pos = match.end()
+
+
+def _substitute(matches, text, replace, budget=None):
+    # Like pattern.sub over the ``matches`` found in ``text``, but also returns
+    # an OffsetMap (or None if nothing changed) and whether the budget ran out;
+    # text after that point is copied unchanged
+    pieces = []
+    starts, sources, copied = [], [], []
+    last = 0
+    length = 0
+    truncated = False
+    for count, match in enumerate(matches):
+        if budget is not None and count % 256 == 255 and budget.exhausted():
+            truncated = True
+            break
+        start, end = match.span()
+        if start > last:
+            starts.append(length)
+            sources.append(last)
+            copied.append(True)
+            pieces.append(text[last:start])
+            length += start - last
+        replacement = replace(match)
+        starts.append(length)
+        sources.append(start)
+        copied.append(False)
+        pieces.append(replacement)
+        length += len(replacement)
+        last = end
+
+    if not starts:
+        return text, None, truncated
+    starts.append(length)
+    sources.append(last)
+    copied.append(True)
+    pieces.append(text[last:])
+    return ''.join(pieces), OffsetMap(starts, sources, copied), truncated
+
+
+def _removal(match):
+    value = match.group()
+    if value[0] != '&':
+        return ''
+    decoded = unescape(value)
+    return '' if decoded in ZERO_WIDTH else decoded
+
+
+def _leet(match):
+    return match.group().translate(LEET_TABLE)
+
+
+def _upper(text):
+    upper = text.upper()
+    if len(upper) == len(text):
+        return upper
+    # A few characters (e.g. 'ß' -> 'SS') grow when upper-cased; keep those as is
+    return ''.join(ch.upper() if len(ch.upper()) == 1 else ch for ch in text)
+
+
+class NormalizedText:
+    """Canonical upper-case text plus the way back to original offsets.
+
+    ``truncated`` is set when a time budget ran out part way through, leaving
+    the rest of the text upper-cased but otherwise unrewritten.
+    """
+
+    def __init__(self, text, maps, truncated=False):
+        self.text = text
+        self._maps = maps
+        self.truncated = truncated
+
+    def original_offset(self, offset):
+        for offset_map in reversed(self._maps):
+            offset = offset_map.source_offset(offset)
+        return offset
+
+
+def normalize(text, budget=None):
+    """
+    Rewrite obfuscated spam terms into a canonical, upper-cased form.
+
+    Entities are decoded and zero-width characters dropped, homoglyphs and
+    fullwidth letters are mapped to ASCII through a precomputed table, leet
+    digits inside words become letters, and spaced-out letters are joined.
+    With a :class:`~utils.budget.TimeBudget` rewriting stops once it is
+    exhausted and the result is marked ``truncated``.
+    """
+    maps = []
+
+    text, offset_map, truncated = _substitute(REMOVALS_PATTERN.finditer(text), text, _removal, budget)
+    if offset_map is not None:
+        maps.append(offset_map)
+
+    if not truncated:
+        # Both tables are one character to one character, so no map is needed
+        text = text.translate(CANONICAL_TABLE)
+        text, _, truncated = _substitute(_leet_words(text), text, _leet, budget)
+
+    if not truncated:
+        text, offset_map, truncated = _substitute(
+            _spaced_letters(text), text, lambda match: match.group().translate(SEPARATORS_TABLE), budget
+        )
+        if offset_map is not None:
+            maps.append(offset_map)
+
+    return NormalizedText(_upper(text), maps, truncated)
+
+
+class NormalizerStream:
+    """Normalizes text that arrives in chunks.
+
+    The tail of each chunk after its last line break or tag end is held back
+    (when it is short) so an entity or obfuscated word split by a chunk
+    boundary is normalized as a whole.
+    """
+
+    HOLD_BACK = 256
+
+    def __init__(self):
+        self._pending = ''
+        self.truncated = False
+
+    def feed(self, chunk, budget=None):
+        text = self._pending + chunk
+        cut = max(text.rfind('\n'), text.rfind('>')) + 1
+        if len(text) - cut > self.HOLD_BACK:
+            cut = len(text)
+        self._pending = text[cut:]
+        return self._normalize(text[:cut], budget)
+
+    def close(self, budget=None):
+        text, self._pending = self._pending, ''
+        return self._normalize(text, budget)
+
+    def _normalize(self, text, budget):
+        canonical = normalize(text, budget)
+        self.truncated = self.truncated or canonical.truncated
+        return canonical.text
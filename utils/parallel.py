@@ -0,0 +1,122 @@
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from utils.email_tester import EmailTester
+from utils.pipeline import ParsedDocument
+from utils.spam_checker import SpamChecker
+
+# Per-process analyzer state, set once by _init_worker
+_spam_checker = None
+_email_tester = None
+
+
+def _init_worker(spam_checker, email_tester):
+    global _spam_checker, _email_tester
+    _spam_checker = spam_checker
+    _email_tester = email_tester
+
+
+def _check_chunk(messages, details, short_circuit):
+    return _spam_checker.check_many(messages, details, short_circuit)
+
+
+def _analyze_chunk(messages):
+    return [_email_tester.analyze_document(ParsedDocument.from_message(message)) for message in messages]
+
+
+def _plain_message(message):
+    # Documents carry cached parse state; only ship the raw fields to workers
+    if isinstance(message, ParsedDocument):
+        return (message.subject, message.html_content, message.text_content, message.sender_email)
+    return message
+
+
+def merge_columns(chunks):
+    """Concatenate columnar results from SpamChecker.check_many into one."""
+    merged = None
+    for chunk in chunks:
+        if merged is None:
+            merged = chunk
+            continue
+        merged['count'] += chunk['count']
+        merged['spam_score'].extend(chunk['spam_score'])
+        merged['risk_level'].extend(chunk['risk_level'])
+        for name in ('keyword_hits', 'pattern_hits'):
+            for key, column in chunk[name].items():
+                merged[name][key].extend(column)
+        if merged['details'] is not None:
+            merged['details'].extend(chunk['details'])
+    return merged
+
+
+class ParallelAnalyzer:
+    """Runs bulk SpamChecker/EmailTester work across a process pool.
+
+    Each worker receives the analyzers once, through the pool initializer, so
+    keyword matchers and compiled patterns are not rebuilt per task. Messages are
+    sent in chunks of ``chunk_size`` and results are yielded in submission
+    order, with at most ``max_pending`` chunks in flight so huge inputs are
+    never fully materialized.
+    """
+
+    def __init__(self, spam_checker=None, email_tester=None, workers=None, chunk_size=256, max_pending=None):
+        self.spam_checker = spam_checker or SpamChecker()
+        self.email_tester = email_tester or EmailTester()
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        self.max_pending = max_pending or self.workers * 2
+        self._executor = None
+
+    def _pool(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                initializer=_init_worker,
+                initargs=(self.spam_checker, self.email_tester)
+            )
+        return self._executor
+
+    def _chunks(self, messages):
+        iterator = iter(messages)
+        while True:
+            chunk = [_plain_message(message) for message in islice(iterator, self.chunk_size)]
+            if not chunk:
+                return
+            yield chunk
+
+    def _run(self, function, messages, *args):
+        pool = self._pool()
+        pending = deque()
+        for chunk in self._chunks(messages):
+            pending.append(pool.submit(function, chunk, *args))
+            if len(pending) >= self.max_pending:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+    def iter_spam_checks(self, messages, details=False, short_circuit=False):
+        """Yield one check_many columnar result per chunk, in input order."""
+        return self._run(_check_chunk, messages, details, short_circuit)
+
+    def check_many(self, messages, details=False, short_circuit=False):
+        """Parallel equivalent of SpamChecker.check_many."""
+        merged = merge_columns(self.iter_spam_checks(messages, details, short_circuit))
+        return merged if merged is not None else self.spam_checker.check_many([], details)
+
+    def iter_email_analyses(self, messages):
+        """Yield EmailTester results one message at a time, in input order."""
+        for chunk_results in self._run(_analyze_chunk, messages):
+            yield from chunk_results
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,344 @@
+import re
+import threading
+from concurrent.futures import TimeoutError as StageTimeout
+from functools import partial, wraps
+from time import monotonic
+
+from utils.eml import EmlReader
+from utils.html_scanner import scan_html
+from utils.normalizer import normalize
+from utils.result_cache import ResultCache
+
+# Largest HTML or text body read from an .eml into a document
+MAX_BODY_SIZE = 10 * 1024 * 1024
+
+TOKEN_PATTERN = re.compile(r"[\w$%']+")
+
+
+def shared_view(method):
+    """Like ``cached_property``, but computed under the document's own lock.
+
+    Stages running concurrently on one document wait for the first caller
+    instead of each computing the view, and unrelated documents never wait
+    on each other.
+    """
+    name = method.__name__
+
+    @wraps(method)
+    def get(self):
+        try:
+            return self.__dict__[name]
+        except KeyError:
+            pass
+        with self._lock:
+            if name not in self.__dict__:
+                self.__dict__[name] = method(self)
+            return self.__dict__[name]
+
+    return property(get)
+
+
+class ParsedDocument:
+    """A message parsed once and shared by every analysis stage.
+
+    Expensive views (canonical content, HTML scan, text, tokens) are computed
+    on first access, so a stage that never asks for one does not pay for it.
+    Each view is computed once even when stages run concurrently. Stages
+    with a time budget use the methods that take one (``canonicalize``,
+    ``scan_html``, ``extract_text``, ``tokenize``), which report whether the
+    view was cut short; the properties compute the complete view.
+    """
+
+    def __init__(self, subject, html_content, text_content="", sender_email="", headers=None):
+        self.subject = subject or ""
+        self.html_content = html_content or ""
+        self.text_content = text_content or ""
+        self.sender_email = sender_email or ""
+        # Parsed message headers when the document came from a raw message
+        self.headers = headers
+        # Reentrant: views such as ``tokens`` build on other views
+        self._lock = threading.RLock()
+
+    @classmethod
+    def from_message(cls, message):
+        """Build a document from a document, a dict of form fields or a tuple.
+
+        Tuples are ``(subject, html_content[, text_content[, sender_email]])``.
+        """
+        if isinstance(message, cls):
+            return message
+        if isinstance(message, dict):
+            return cls(
+                message.get('subject', ''),
+                message.get('html_content', ''),
+                message.get('text_content', ''),
+                message.get('sender_email', '')
+            )
+        return cls(*message)
+
+    @classmethod
+    def from_eml(cls, source, max_body_size=MAX_BODY_SIZE):
+        """Build a document from raw .eml bytes, a path or a binary file.
+
+        Only the first text/html and text/plain bodies are decoded; every
+        other part, attachments included, is skipped without being read into
+        memory.
+        """
+        html_content = None
+        text_content = None
+        with EmlReader(source) as reader:
+            for part in reader.parts():
+                if part.is_attachment:
+                    continue
+                if part.content_type == 'text/html' and html_content is None:
+                    html_content = part.read_text(max_body_size)
+                elif part.content_type == 'text/plain' and text_content is None:
+                    text_content = part.read_text(max_body_size)
+            return cls(reader.subject, html_content, text_content, reader.sender_email, reader.headers)
+
+    @property
+    def sender_domain(self):
+        if '@' not in self.sender_email:
+            return None
+        return self.sender_email.split('@')[1]
+
+    @shared_view
+    def content_hash(self):
+        """SHA-256 of the subject, sender and bodies."""
+        return ResultCache.make_key(self.subject, self.sender_email, self.html_content, self.text_content, '')
+
+    @shared_view
+    def subject_upper(self):
+        return self.subject.upper()
+
+    @shared_view
+    def canonical(self):
+        """Subject, HTML and text joined and normalized (see :func:`utils.normalizer.normalize`)."""
+        return self.canonicalize()
+
+    def canonicalize(self, budget=None):
+        """Normalize the content within ``budget``; only a complete result is cached."""
+        with self._lock:
+            if 'canonical' in self.__dict__:
+                return self.__dict__['canonical']
+            canonical = normalize(f"{self.subject} {self.html_content} {self.text_content}", budget)
+            if not canonical.truncated:
+                self.__dict__['canonical'] = canonical
+            return canonical
+
+    @property
+    def normalized(self):
+        """Canonical upper-cased content for keyword and pattern rules."""
+        return self.canonical.text
+
+    @shared_view
+    def html(self):
+        """The :class:`~utils.html_scanner.HTMLScanner` result, or ``None`` without HTML."""
+        return self.scan_html()
+
+    def scan_html(self, budget=None):
+        """Scan the HTML within ``budget``; only a complete scan is cached."""
+        if not self.html_content:
+            return None
+        with self._lock:
+            if 'html' in self.__dict__:
+                return self.__dict__['html']
+            scanner = scan_html(self.html_content, keep_text=True, budget=budget)
+            if not scanner.truncated:
+                self.__dict__['html'] = scanner
+            return scanner
+
+    @property
+    def links(self):
+        return self.html.links if self.html else []
+
+    @property
+    def images(self):
+        return self.html.images if self.html else []
+
+    @property
+    def visible_text(self):
+        """Subject, visible HTML text and plain text."""
+        return self.extract_text()[0]
+
+    def extract_text(self, budget=None):
+        """``(text, truncated)`` for :attr:`visible_text`, with the HTML scanned
+        within ``budget``; only a complete result is cached."""
+        with self._lock:
+            if 'visible_text' in self.__dict__:
+                return self.__dict__['visible_text'], False
+            html = self.scan_html(budget)
+            truncated = html is not None and html.truncated
+            parts = [self.subject]
+            if html:
+                parts.append(html.visible_text)
+            parts.append(self.text_content)
+            text = ' '.join(parts)
+            if not truncated:
+                self.__dict__['visible_text'] = text
+            return text, truncated
+
+    @property
+    def tokens(self):
+        """Upper-cased word tokens from the subject, visible HTML text and plain text."""
+        return self.tokenize()[0]
+
+    def tokenize(self, budget=None):
+        """``(tokens, truncated)`` for :attr:`tokens` within ``budget``; only a
+        complete result is cached."""
+        with self._lock:
+            if 'tokens' in self.__dict__:
+                return self.__dict__['tokens'], False
+            text, truncated = self.extract_text(budget)
+            tokens = TOKEN_PATTERN.findall(text.upper())
+            if not truncated:
+                self.__dict__['tokens'] = tokens
+            return tokens, truncated
+
+
+class AnalysisPipeline:
+    """Runs the analyzers as stages over a single :class:`ParsedDocument`.
+
+    With a ``cache`` (:class:`~utils.result_cache.ResultCache`), content
+    stages are memoized by message hash and rule-set version, without their
+    per-run instrumentation, and results carry ``cached``. Domain health
+    depends on live DNS state and is never cached.
+
+    A trained ``classifier`` (:class:`~utils.classifier.NaiveBayesModel`)
+    adds a ``classifier`` stage next to the rule scores without changing them,
+    scanning the message within ``classifier_time_budget`` CPU seconds, and a
+    SpamAssassin rule set (:class:`~utils.spamassassin.SpamAssassinRules`)
+    adds a ``spamassassin`` stage, limited to ``spamassassin_time_budget``
+    CPU seconds per message.
+
+    With an ``executor`` (e.g. a shared ``ThreadPoolExecutor``) the stages
+    are independent tasks run concurrently, so a request takes about as long
+    as its slowest stage. Each stage gets ``stage_timeouts[name]`` seconds,
+    or ``stage_timeout`` by default, counted from when the stages were
+    submitted; a stage still running then is left to finish in the
+    background, its result is ``None`` and its name is listed under
+    ``timed_out_stages``.
+    """
+
+    def __init__(self, email_tester, spam_checker, deliverability_analyzer=None, cache=None, classifier=None,
+                 spamassassin=None, executor=None, stage_timeout=None, stage_timeouts=None,
+                 spamassassin_time_budget=None, classifier_time_budget=None):
+        self.email_tester = email_tester
+        self.spam_checker = spam_checker
+        self.deliverability_analyzer = deliverability_analyzer
+        self.cache = cache
+        self.classifier = classifier
+        self.classifier_time_budget = classifier_time_budget
+        self.spamassassin = spamassassin
+        self.spamassassin_time_budget = spamassassin_time_budget
+        self.executor = executor
+        self.stage_timeout = stage_timeout
+        self.stage_timeouts = stage_timeouts or {}
+
+    @property
+    def ruleset_version(self):
+        version = f"{self.email_tester.ruleset_version}:{self.spam_checker.ruleset_version}"
+        if self.classifier is not None:
+            version += f":{self.classifier.version}"
+        if self.spamassassin is not None:
+            version += f":{self.spamassassin.version}"
+        return version
+
+    def parse(self, subject, sender_email, html_content, text_content=""):
+        return ParsedDocument(subject, html_content, text_content, sender_email)
+
+    def stages(self, domain_health=False, rules=None):
+        # ``rules`` swaps in a tenant's RulePack (see utils.tenant_rules) for the spam check
+        spam_check = self.spam_checker.check_document
+        if rules is not None:
+            spam_check = partial(spam_check, rules=rules)
+        stages = [
+            ('test_results', self.email_tester.analyze_document),
+            ('spam_results', spam_check),
+        ]
+        if self.classifier is not None:
+            stages.append((
+                'classifier', partial(self.classifier.classify_document, time_budget=self.classifier_time_budget)
+            ))
+        if self.spamassassin is not None:
+            stages.append((
+                'spamassassin', partial(self.spamassassin.check_document, time_budget=self.spamassassin_time_budget)
+            ))
+        if domain_health and self.deliverability_analyzer is not None:
+            stages.append(('domain_health', self.deliverability_analyzer.analyze_document))
+        return stages
+
+    def run_document(self, document, domain_health=False, rules=None):
+        stages = self.stages(domain_health, rules)
+        if self.executor is None:
+            return {name: stage(document) for name, stage in stages}
+        return self._fan_out(document, stages)
+
+    def _fan_out(self, document, stages):
+        started = monotonic()
+        futures = [(name, self.executor.submit(stage, document)) for name, stage in stages]
+        results = {}
+        for name, future in futures:
+            timeout = self.stage_timeouts.get(name, self.stage_timeout)
+            try:
+                results[name] = future.result(None if timeout is None else max(0.0, started + timeout - monotonic()))
+            except StageTimeout:
+                # Threads cannot be interrupted; a queued stage is dropped, a running one finishes unobserved
+                future.cancel()
+                results[name] = None
+                results.setdefault('timed_out_stages', []).append(name)
+        return results
+
+    def run(self, subject, sender_email, html_content, text_content="", domain_health=False, rules=None):
+        """Parse the message once and return each stage's results keyed by stage name."""
+        return self.run_cached(self.parse(subject, sender_email, html_content, text_content), domain_health, rules)
+
+    def run_eml(self, source, domain_health=False, rules=None):
+        """Run the stages over a raw .eml message (bytes, path or binary file)."""
+        return self.run_cached(ParsedDocument.from_eml(source), domain_health, rules)
+
+    def run_cached(self, document, domain_health=False, rules=None):
+        if self.cache is None:
+            return self.run_document(document, domain_health, rules)
+
+        version = self.ruleset_version
+        if rules is not None:
+            version += f":{rules.version}"
+        key = self.cache.make_key(
+            document.subject, document.sender_email, document.html_content, document.text_content, version
+        )
+        results = self.cache.get(key)
+        if results is not None:
+            results['cached'] = True
+            if domain_health and self.deliverability_analyzer is not None:
+                results['domain_health'] = self.deliverability_analyzer.analyze_document(document)
+            return results
+
+        # On a miss, domain health runs alongside the content stages; content
+        # results with a timed-out or budget-truncated stage are returned but not cached
+        results = self.run_document(document, domain_health, rules)
+        if self._cacheable(results):
+            self.cache.set(key, self._cache_payload(results))
+        results['cached'] = False
+        return results
+
+    @staticmethod
+    def _cacheable(results):
+        if not set(results.get('timed_out_stages', ())) <= {'domain_health'}:
+            return False
+        return not any(
+            isinstance(value, dict) and value.get('partial')
+            for name, value in results.items() if name != 'domain_health'
+        )
+
+    @staticmethod
+    def _cache_payload(results):
+        # Per-run timings describe the run that produced them, not a later hit
+        payload = {}
+        for name, value in results.items():
+            if name in ('domain_health', 'timed_out_stages'):
+                continue
+            if isinstance(value, dict) and 'instrumentation' in value:
+                value = {key: item for key, item in value.items() if key != 'instrumentation'}
+            payload[name] = value
+        return payload
@@ -0,0 +1,141 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+
+def ruleset_fingerprint(*rules):
+    """Short stable hash of rule definitions, used as the rule-set version."""
+    payload = json.dumps(rules, sort_keys=True, default=str).encode('utf-8')
+    return hashlib.sha256(payload).hexdigest()[:16]
+
+
+class ResultCache:
+    """Two-tier memo of analysis results keyed by a content hash.
+
+    Entries live in an in-process LRU bounded by ``max_size`` and ``ttl``
+    seconds. An optional ``backend`` (see :class:`DatabaseCacheBackend`) is
+    consulted on a local miss so results are shared between workers and
+    survive cold starts. Values are stored as JSON, so every hit returns a
+    fresh copy that callers are free to mutate.
+    """
+
+    def __init__(self, max_size=1024, ttl=3600, backend=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.backend = backend
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.backend_hits = 0
+
+    @staticmethod
+    def make_key(subject, sender_email, html_content, text_content, ruleset_version):
+        digest = hashlib.sha256()
+        for part in (subject, sender_email, html_content, text_content, ruleset_version):
+            data = (part or '').encode('utf-8')
+            # Length-prefix each field so ('ab', 'c') and ('a', 'bc') differ
+            digest.update(str(len(data)).encode('ascii') + b':' + data)
+        return digest.hexdigest()
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, payload = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return json.loads(payload)
+                del self._entries[key]
+
+        payload = self.backend.get(key) if self.backend is not None else None
+        with self._lock:
+            if payload is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.backend_hits += 1
+            self._store(key, payload, now)
+        return json.loads(payload)
+
+    def set(self, key, value):
+        payload = json.dumps(value, default=str)
+        with self._lock:
+            self._store(key, payload, time.monotonic())
+        if self.backend is not None:
+            self.backend.set(key, payload, self.ttl)
+
+    def get_or_compute(self, key, compute):
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            self.set(key, value)
+        return value
+
+    def _store(self, key, payload, now):
+        self._entries[key] = (now + self.ttl, payload)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'backend_hits': self.backend_hits,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'size': len(self._entries),
+                'max_size': self.max_size
+            }
+
+
+class DatabaseCacheBackend:
+    """Persists cache payloads in a SQLAlchemy table such as ``models.AnalysisCache``.
+
+    Backend failures are logged and treated as misses so a database outage
+    never fails an analysis.
+    """
+
+    def __init__(self, db, model):
+        self.db = db
+        self.model = model
+
+    def get(self, key):
+        try:
+            entry = self.db.session.get(self.model, key)
+            if entry is None:
+                return None
+            if entry.expires_at <= datetime.utcnow():
+                self.db.session.delete(entry)
+                self.db.session.commit()
+                return None
+            return entry.result
+        except Exception as e:
+            self.db.session.rollback()
+            print(f"Analysis cache read error: {str(e)}")
+            return None
+
+    def set(self, key, payload, ttl):
+        try:
+            now = datetime.utcnow()
+            self.db.session.merge(self.model(
+                key=key,
+                result=payload,
+                created_at=now,
+                expires_at=now + timedelta(seconds=ttl)
+            ))
+            self.db.session.commit()
+        except Exception as e:
+            self.db.session.rollback()
+            print(f"Analysis cache write error: {str(e)}")
@@ -0,0 +1,212 @@
+import copy
+import json
+import os
+import re
+import threading
+from functools import lru_cache
+from time import monotonic
+
+from utils.matchers import KeywordMatcher, PatternSet
+from utils.normalizer import NORMALIZER_VERSION, normalize
+from utils.result_cache import ruleset_fingerprint
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+DEFAULT_RULE_PACK = os.path.join(os.path.dirname(__file__), 'rules', 'default.json')
+
+# Score for a keyword tier that has no weight in the pack
+DEFAULT_KEYWORD_WEIGHT = 3
+
+# Escapes (\s, \d, ...) don't make a pattern case-sensitive
+ESCAPE_PATTERN = re.compile(r'\\.')
+GLOBAL_FLAGS_PATTERN = re.compile(r'\(\?[aiLmsux]+\)')
+# A pattern without regex metacharacters is a literal phrase
+METACHARACTERS = frozenset('.^$*+?{}[]\\|()')
+
+
+def canonical_pattern(pattern):
+    """Make ``pattern`` match the canonical text.
+
+    Literal phrases are normalized like the text is. Patterns without
+    lower-case letters already match it and stay case-sensitive, which keeps
+    the regex engine's literal fast paths; the rest match case-insensitively.
+    """
+    if not METACHARACTERS.intersection(pattern):
+        return re.escape(normalize(pattern).text)
+    unescaped = ESCAPE_PATTERN.sub('', pattern)
+    if unescaped == unescaped.upper():
+        return pattern
+    if GLOBAL_FLAGS_PATTERN.match(pattern):
+        return '(?i)' + pattern
+    return f'(?i:{pattern})'
+
+
+def read_rule_pack(path):
+    """Read a rule pack file; .yaml/.yml needs PyYAML, anything else is JSON."""
+    with open(path, encoding='utf-8') as handle:
+        if path.endswith(('.yaml', '.yml')):
+            if yaml is None:
+                raise ValueError(f"PyYAML is required to read {path}")
+            try:
+                data = yaml.safe_load(handle)
+            except yaml.YAMLError as e:
+                raise ValueError(f"Invalid YAML in {path}: {str(e)}")
+        else:
+            data = json.load(handle)
+    if not isinstance(data, dict):
+        raise ValueError(f"{path} does not contain a rule pack")
+    return data
+
+
+class RulePack:
+    """Spam rules from a rule pack, compiled into one keyword matcher and one pattern set.
+
+    A pack is immutable once built. ``version`` hashes the rule definitions
+    (and the normalizer version) and is used as the cache key component for
+    memoized results.
+    """
+
+    def __init__(self, data, source=None):
+        checker_rules = data.get('spam_checker', {})
+        tester_rules = data.get('email_tester', {})
+        self.name = data.get('name', 'unnamed')
+        self.source = source
+        self.data = data
+
+        self.spam_keywords = {
+            risk_level: [keyword.upper() for keyword in keywords]
+            for risk_level, keywords in checker_rules.get('keywords', {}).items()
+        }
+        self.keyword_weights = dict(checker_rules.get('keyword_weights', {}))
+        self.suspicious_patterns = [
+            rule['pattern'] if isinstance(rule, dict) else rule for rule in checker_rules.get('patterns', [])
+        ]
+        self.pattern_weight = checker_rules.get('pattern_weight', 5)
+        self.spam_words = [word.upper() for word in tester_rules.get('spam_words', [])]
+
+        # Keywords are matched in the normalized form the text is in ('WIN10'
+        # reads 'WINIO' there); reports still name them as written
+        self.keyword_forms = {}
+        for keywords in self.spam_keywords.values():
+            for keyword in keywords:
+                form = normalize(keyword).text
+                if form:
+                    self.keyword_forms[keyword] = form
+        # One matcher for all tiers, so duplicate keywords are matched once per check
+        self.keyword_matcher = KeywordMatcher(self.keyword_forms.values())
+        # Matcher index of each keyword in keyword_forms
+        slots = {form: index for index, form in enumerate(self.keyword_matcher.keywords)}
+        self.keyword_slots = [slots[form] for form in self.keyword_forms.values()]
+        try:
+            self.pattern_set = PatternSet(canonical_pattern(pattern) for pattern in self.suspicious_patterns)
+        except re.error as e:
+            raise ValueError(f"Invalid pattern in rule pack {self.name}: {str(e)}")
+
+        # Score each matcher keyword contributes when present, summed over tiers
+        tier_weights = {keyword: 0 for keyword in self.keyword_matcher.keywords}
+        for risk_level, keywords in self.spam_keywords.items():
+            for form in {self.keyword_forms[keyword] for keyword in keywords if keyword in self.keyword_forms}:
+                tier_weights[form] += self.keyword_weights.get(risk_level, DEFAULT_KEYWORD_WEIGHT)
+        self.keyword_scores = [tier_weights[keyword] for keyword in self.keyword_matcher.keywords]
+
+        self.version = ruleset_fingerprint(data, NORMALIZER_VERSION)
+
+    @classmethod
+    def load(cls, path):
+        return cls(read_rule_pack(path), source=path)
+
+    def with_keywords(self, keywords, name=None):
+        """Return a new pack with ``keywords`` ({risk tier: [phrases]}) added to the existing tiers."""
+        data = copy.deepcopy(self.data)
+        tiers = data.setdefault('spam_checker', {}).setdefault('keywords', {})
+        for risk_level, phrases in keywords.items():
+            if risk_level not in tiers:
+                raise ValueError(f"Unknown keyword tier {risk_level}")
+            tiers[risk_level].extend(phrases)
+        if name:
+            data['name'] = name
+        return RulePack(data, source=self.source)
+
+    @property
+    def current(self):
+        # Lets a fixed pack stand in wherever a RulePackManager is accepted
+        return self
+
+
+@lru_cache(maxsize=None)
+def default_rule_pack():
+    """The bundled rule pack, compiled once per process."""
+    return RulePack.load(DEFAULT_RULE_PACK)
+
+
+class RulePackManager:
+    """Serves the compiled pack for a file and recompiles it when the file changes.
+
+    The file is checked at most every ``check_interval`` seconds. A new pack
+    is compiled off to the side and then swapped in with a single reference
+    assignment; checks take ``current`` once and keep that pack to the end,
+    so in-flight requests finish on the rules they started with. A pack that
+    fails to load is reported and the previous one stays in service.
+
+    ``pack`` seeds the manager with an already compiled pack for the same
+    file (e.g. from :mod:`utils.snapshot`) instead of compiling it again.
+    """
+
+    def __init__(self, path=None, check_interval=2.0, pack=None):
+        self.path = path or DEFAULT_RULE_PACK
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._stamp = self._file_stamp()
+        self._pack = pack or RulePack.load(self.path)
+        self._next_check = monotonic() + check_interval
+
+    @property
+    def current(self):
+        if monotonic() >= self._next_check:
+            self.reload_if_changed()
+        return self._pack
+
+    @property
+    def version(self):
+        return self.current.version
+
+    def _file_stamp(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def reload_if_changed(self):
+        """Recompile the pack if its file changed; returns True when a new pack was swapped in."""
+        # Only one thread reloads; the others keep serving the current pack
+        if not self._lock.acquire(blocking=False):
+            return False
+        try:
+            self._next_check = monotonic() + self.check_interval
+            stamp = self._file_stamp()
+            if stamp is None or stamp == self._stamp:
+                return False
+            self._stamp = stamp
+            try:
+                pack = RulePack.load(self.path)
+            except Exception as e:
+                print(f"Rule pack reload error: {str(e)}")
+                return False
+            self._pack = pack
+            return True
+        finally:
+            self._lock.release()
+
+    def __getstate__(self):
+        # Process pool workers get their own lock and keep watching the file
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
@@ -0,0 +1,214 @@
+"""
+Precompiled analyzer state for fast cold starts.
+
+    python -m utils.snapshot build --output analysis.snapshot
+    python -m utils.snapshot bench --snapshot analysis.snapshot
+
+``build`` compiles the rule pack (and SpamAssassin rules, if configured)
+and pickles the result. At startup :func:`load_or_build` maps the file and
+unpickles it in one step; if the snapshot is missing, from another Python
+version, built by different compiling code (see ``CODE_MODULES``) or older
+than the rule files it was built from, the rules are compiled from source
+instead. ``bench`` times fresh interpreters from
+import to the first spam check, with and without the snapshot.
+"""
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import pickle
+import struct
+import subprocess
+import sys
+from functools import lru_cache
+from time import perf_counter
+
+import utils.matchers
+import utils.normalizer
+import utils.rule_pack
+import utils.spamassassin
+from utils.normalizer import NORMALIZER_VERSION
+from utils.rule_pack import DEFAULT_RULE_PACK, RulePack
+from utils.spamassassin import SpamAssassinRules
+
+MAGIC = b'EDPSNAP1'
+# Bump when the snapshot layout changes; changes to the compiling code are
+# picked up from CODE_MODULES
+SNAPSHOT_FORMAT = 1
+# Modules whose classes are pickled or whose code shapes the compiled rules
+CODE_MODULES = (utils.matchers, utils.normalizer, utils.rule_pack, utils.spamassassin)
+# Layout: MAGIC, key length, JSON key, pickled state. The key is checked
+# before the (much larger) state is unpickled.
+KEY_LENGTH = struct.Struct('<I')
+
+
+def _source_files(path):
+    if path is None:
+        return []
+    if os.path.isdir(path):
+        return [os.path.join(path, name) for name in sorted(os.listdir(path)) if name.endswith('.cf')]
+    return [path]
+
+
+def source_fingerprint(*paths):
+    """Hash of the rule files a snapshot was built from; a mismatch marks it stale."""
+    digest = hashlib.sha256()
+    for path in paths:
+        for file_path in _source_files(path):
+            # Names, not full paths: the snapshot is built in one directory and deployed to another
+            digest.update(os.path.basename(file_path).encode('utf-8'))
+            with open(file_path, 'rb') as handle:
+                digest.update(handle.read())
+    return digest.hexdigest()
+
+
+@lru_cache(maxsize=None)
+def code_fingerprint(modules=CODE_MODULES):
+    """Hash of the source of ``modules``; a snapshot built by other code is stale."""
+    digest = hashlib.sha256()
+    for module in modules:
+        with open(module.__file__, 'rb') as handle:
+            digest.update(handle.read())
+    return digest.hexdigest()
+
+
+def _snapshot_key(rule_pack_path, spamassassin_path):
+    return {
+        'format': SNAPSHOT_FORMAT,
+        'python': list(sys.version_info[:2]),
+        'normalizer': NORMALIZER_VERSION,
+        'code': code_fingerprint(),
+        'sources': source_fingerprint(rule_pack_path, spamassassin_path)
+    }
+
+
+def compile_rules(rule_pack_path=None, spamassassin_path=None):
+    spamassassin = None
+    if spamassassin_path:
+        try:
+            spamassassin = SpamAssassinRules.load(spamassassin_path)
+        except OSError as e:
+            print(f"Error loading SpamAssassin rules: {str(e)}")
+    return {
+        'rule_pack': RulePack.load(rule_pack_path or DEFAULT_RULE_PACK),
+        'spamassassin': spamassassin
+    }
+
+
+def build_snapshot(output, rule_pack_path=None, spamassassin_path=None):
+    """Compile the rules and write them to ``output``; returns the snapshot key."""
+    rule_pack_path = rule_pack_path or DEFAULT_RULE_PACK
+    key = _snapshot_key(rule_pack_path, spamassassin_path)
+    state = compile_rules(rule_pack_path, spamassassin_path)
+
+    # Write next to the target and rename, so readers never see a partial file
+    temporary = f"{output}.tmp"
+    try:
+        with open(temporary, 'wb') as handle:
+            encoded_key = json.dumps(key, sort_keys=True).encode('utf-8')
+            handle.write(MAGIC)
+            handle.write(KEY_LENGTH.pack(len(encoded_key)))
+            handle.write(encoded_key)
+            pickle.dump(state, handle, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary, output)
+    except BaseException:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise
+    return key
+
+
+def load_snapshot(path, rule_pack_path=None, spamassassin_path=None):
+    """Return the compiled state from ``path``, or None if it is missing or stale."""
+    rule_pack_path = rule_pack_path or DEFAULT_RULE_PACK
+    try:
+        current = _snapshot_key(rule_pack_path, spamassassin_path)
+        with open(path, 'rb') as handle:
+            with mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                if mapped[:len(MAGIC)] != MAGIC:
+                    return None
+                start = len(MAGIC) + KEY_LENGTH.size
+                end = start + KEY_LENGTH.unpack_from(mapped, len(MAGIC))[0]
+                if json.loads(mapped[start:end]) != json.loads(json.dumps(current)):
+                    return None
+                with memoryview(mapped) as view, view[end:] as payload:
+                    return pickle.loads(payload)
+    except (OSError, ValueError, EOFError, struct.error, pickle.UnpicklingError, AttributeError, ImportError) as e:
+        if not isinstance(e, FileNotFoundError):
+            print(f"Snapshot load error: {str(e)}")
+        return None
+
+
+def load_or_build(path, rule_pack_path=None, spamassassin_path=None):
+    """
+    Load compiled rules from the snapshot, rebuilding from source if needed.
+
+    Returns ``(state, info)`` where ``info`` says where the state came from
+    and how long loading took.
+    """
+    started = perf_counter()
+    state = load_snapshot(path, rule_pack_path, spamassassin_path) if path else None
+    source = 'snapshot'
+    if state is None:
+        state = compile_rules(rule_pack_path, spamassassin_path)
+        source = 'rebuilt'
+    return state, {'source': source, 'load_ms': round((perf_counter() - started) * 1000, 3)}
+
+
+# Run in a fresh interpreter by ``bench``: import, load rules, then one spam check
+COLD_START_SCRIPT = """
+import sys
+from functools import lru_cache
+from time import perf_counter
+started = perf_counter()
+from utils.snapshot import load_or_build
+from utils.spam_checker import SpamChecker
+state, info = load_or_build(sys.argv[1] or None, sys.argv[2] or None, sys.argv[3] or None)
+SpamChecker(rules=state['rule_pack']).check_content('Limited time offer', '<p>Act now, FREE trial</p>')
+print(info['source'], (perf_counter() - started) * 1000)
+"""
+
+
+def measure_cold_start(snapshot_path=None, rule_pack_path=None, spamassassin_path=None, runs=5):
+    """Median milliseconds from interpreter start to the first spam check."""
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    timings = []
+    source = None
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, '-c', COLD_START_SCRIPT, snapshot_path or '', rule_pack_path or '',
+             spamassassin_path or ''],
+            cwd=root, capture_output=True, text=True, check=True
+        ).stdout.split()
+        source = output[-2]
+        timings.append(float(output[-1]))
+    timings.sort()
+    return {'source': source, 'median_ms': round(timings[len(timings) // 2], 3), 'runs': runs}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Build or benchmark the analyzer snapshot')
+    parser.add_argument('command', choices=('build', 'bench'))
+    parser.add_argument('--output', '--snapshot', dest='snapshot', default='analysis.snapshot')
+    parser.add_argument('--rule-pack', default=os.environ.get('RULE_PACK_PATH'))
+    parser.add_argument('--spamassassin', default=os.environ.get('SPAMASSASSIN_RULES'))
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    if args.command == 'build':
+        started = perf_counter()
+        build_snapshot(args.snapshot, args.rule_pack, args.spamassassin)
+        print(f"Wrote {args.snapshot} ({os.path.getsize(args.snapshot)} bytes) "
+              f"in {(perf_counter() - started) * 1000:.1f} ms")
+        return
+
+    rebuilt = measure_cold_start(None, args.rule_pack, args.spamassassin, args.runs)
+    loaded = measure_cold_start(args.snapshot, args.rule_pack, args.spamassassin, args.runs)
+    print(f"cold start to first spam check (median of {args.runs}):")
+    print(f"  rebuild from source: {rebuilt['median_ms']:.1f} ms")
+    print(f"  {loaded['source'] + ':':<20} {loaded['median_ms']:.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
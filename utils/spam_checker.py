@@ -1,146 +1,408 @@
-import re
 import random
+from array import array
+
+from utils.budget import TimeBudget, UNLIMITED
+from utils.html_scanner import HTMLScanner
+from utils.instrumentation import NULL_RECORDER, RuleRecorder
+from utils.normalizer import NormalizerStream
+from utils.pipeline import ParsedDocument
+from utils.rule_pack import DEFAULT_KEYWORD_WEIGHT, default_rule_pack
+from utils.streaming import CHUNK_SIZE, iter_text_chunks
+
+RISK_LEVELS = ('low', 'medium', 'high')
+# Scores above this are 'high' risk
+HIGH_RISK_SCORE = 50
+
+# Order check_document runs the rules in, and the cheapest-first order used
+# when short-circuiting
+RULE_ORDER = ('keywords', 'patterns', 'html', 'subject')
+COST_ORDER = ('subject', 'keywords', 'patterns', 'html')
 
 class SpamChecker:
-    def __init__(self):
-        self.spam_keywords = {
-            'high_risk': ['FREE', 'URGENT', 'ACT NOW', 'LIMITED TIME', 'GUARANTEED', 'WINNER', 'CONGRATULATIONS'],
-            'medium_risk': ['DEAL', 'SAVE', 'DISCOUNT', 'SPECIAL', 'OFFER', 'BUY NOW', 'CLICK HERE'],
-            'low_risk': ['SALE', 'NEW', 'AVAILABLE', 'NEWSLETTER', 'UPDATE']
+    def __init__(self, time_budget=None, instrument=False, short_circuit=False, rules=None):
+        # Default per-message CPU seconds before expensive rules are skipped
+        self.time_budget = time_budget
+        # Record per-rule timings and hits in results and in METRICS
+        self.instrument = instrument
+        # Stop checking once a message is certain to be high risk
+        self.short_circuit = short_circuit
+
+        # RulePack or RulePackManager; checks read ``rules`` once and use that pack throughout
+        self.rule_source = rules or default_rule_pack()
+
+    @property
+    def rules(self):
+        return self.rule_source.current
+
+    @property
+    def spam_keywords(self):
+        return self.rules.spam_keywords
+
+    @property
+    def keyword_weights(self):
+        return self.rules.keyword_weights
+
+    @property
+    def suspicious_patterns(self):
+        return self.rules.suspicious_patterns
+
+    @property
+    def keyword_matcher(self):
+        return self.rules.keyword_matcher
+
+    @property
+    def pattern_set(self):
+        return self.rules.pattern_set
+
+    @property
+    def ruleset_version(self):
+        return self.rules.version
+
+    def check_content(self, subject, html_content, text_content="", time_budget=None, instrument=None,
+                      short_circuit=None, rules=None):
+        return self.check_document(
+            ParsedDocument(subject, html_content, text_content), time_budget, instrument, short_circuit, rules
+        )
+
+    def check_document(self, document, time_budget=None, instrument=None, short_circuit=None, rules=None):
+        """
+        Run every rule over a ParsedDocument.
+
+        With ``short_circuit``, evaluation stops as soon as the risk level is
+        settled at 'high'; the score is then a lower bound, the remaining
+        rules are listed in ``skipped_rules`` and their issues are missing.
+        ``rules`` pins a RulePack; by default the checker's current pack is used.
+        """
+        budget = TimeBudget(self.time_budget if time_budget is None else time_budget)
+        instrument = self.instrument if instrument is None else instrument
+        short_circuit = self.short_circuit if short_circuit is None else short_circuit
+        rules = rules or self.rules
+        recorder = RuleRecorder('spam_checker') if instrument else NULL_RECORDER
+        results = {
+            'spam_score': 0,
+            'risk_level': 'low',
+            'issues': [],
+            'keyword_analysis': {},
+            'pattern_analysis': {},
+            'recommendations': [],
+            'partial': False,
+            'skipped_rules': [],
+            'short_circuited': False
         }
 
-        self.suspicious_patterns = [
-            r'(\$\d+)',          # Dollar amounts
-            r'(\d+%\s*off)',     # Percentage discounts
-            r'(free\s*trial)',    # Free trials
-            r'(no\s*cost)',       # No cost
-            r'(risk\s*free)',     # Risk free
-        ]
+        # Short-circuit mode runs rules cheapest first and stops once the
+        # score is past HIGH_RISK_SCORE; rules only ever add to the score, so
+        # the risk level can no longer change
+        for rule in COST_ORDER if short_circuit else RULE_ORDER:
+            if short_circuit and results['spam_score'] > HIGH_RISK_SCORE:
+                results['short_circuited'] = True
+                results['skipped_rules'].append(rule)
+                continue
+            # The subject rule is cheap and always runs
+            if rule != 'subject' and not self._within_budget(rule, budget, results):
+                continue
+            started = recorder.start()
+            hits = getattr(self, f'_apply_{rule}')(rules, document, budget, results)
+            recorder.stop(rule, started, hits)
+
+        # Determine risk level
+        results['risk_level'] = RISK_LEVELS[self._risk_code(results['spam_score'])]
+
+        # Generate recommendations
+        results['recommendations'] = self._generate_spam_recommendations(results)
+
+        if recorder.enabled:
+            results['instrumentation'] = recorder.report()
 
-    def check_content(self, subject, html_content, text_content=""):
+        return results
+
+    def check_stream(self, subject, html_source=None, text_source=None, chunk_size=CHUNK_SIZE,
+                     time_budget=None, encoding='utf-8'):
+        """
+        Check a message whose bodies arrive as streams, in bounded memory.
+
+        html_source and text_source may be str, bytes, file objects or
+        iterables of chunks (see iter_text_chunks). Every chunk is normalized
+        on its own and fed to the keyword matcher, the pattern sweep and the
+        HTML scanner, so peak memory depends on chunk_size rather than on the
+        message size. Scores match check_content for matches shorter than the
+        pattern overlap window; offsets are into the canonical stream and,
+        like matched strings, are capped per rule.
+        """
+        budget = TimeBudget(self.time_budget if time_budget is None else time_budget)
         results = {
             'spam_score': 0,
             'risk_level': 'low',
             'issues': [],
             'keyword_analysis': {},
             'pattern_analysis': {},
-            'recommendations': []
+            'recommendations': [],
+            'partial': False,
+            'skipped_rules': [],
+            'characters_scanned': 0
         }
 
-        full_content = f"{subject} {html_content} {text_content}".upper()
+        rules = self.rules
+        keywords = rules.keyword_matcher.stream()
+        patterns = rules.pattern_set.stream()
+        html = None
+        html_length = 0
+
+        normalizer = NormalizerStream()
+
+        def scan(canonical):
+            keywords.feed(canonical, budget)
+            patterns.feed(canonical, budget)
+
+        def feed(chunk):
+            scan(normalizer.feed(chunk, budget))
+            results['characters_scanned'] += len(chunk)
+
+        # Same layout as ParsedDocument.normalized: subject, html and text joined by spaces
+        feed(f"{subject} ")
+        for chunk in iter_text_chunks(html_source, chunk_size, encoding):
+            if budget.exhausted():
+                results['partial'] = True
+                break
+            if html is None:
+                html = HTMLScanner(max_items=100)
+            feed(chunk)
+            html.feed(chunk)
+            html_length += len(chunk)
+        feed(" ")
+        for chunk in iter_text_chunks(text_source, chunk_size, encoding):
+            if budget.exhausted():
+                results['partial'] = True
+                break
+            feed(chunk)
+        scan(normalizer.close(budget))
+        patterns.close(budget)
 
-        # Check spam keywords
-        keyword_results = self._check_keywords(full_content)
+        keyword_results = self._keyword_report(
+            rules, keywords.offsets, keywords.counts, normalizer.truncated or keywords.truncated
+        )
         results['keyword_analysis'] = keyword_results
         results['spam_score'] += keyword_results['score']
+        results['partial'] = results['partial'] or keyword_results['truncated']
 
-        # Check suspicious patterns
-        pattern_results = self._check_patterns(full_content)
+        pattern_results = self._pattern_report(rules, patterns.matches, patterns.counts, patterns.truncated)
         results['pattern_analysis'] = pattern_results
         results['spam_score'] += pattern_results['score']
+        results['partial'] = results['partial'] or pattern_results['truncated']
 
-        # Check HTML structure
-        html_results = self._analyze_html(html_content)
-        results['spam_score'] += html_results['score']
-        results['issues'].extend(html_results['issues'])
+        if html is not None:
+            html.close()
+            html_results = self._html_report(html, html_length)
+            results['spam_score'] += html_results['score']
+            results['issues'].extend(html_results['issues'])
 
-        # Check subject line
         subject_results = self._analyze_subject(subject)
         results['spam_score'] += subject_results['score']
         results['issues'].extend(subject_results['issues'])
 
-        # Determine risk level
-        if results['spam_score'] <= 20:
-            results['risk_level'] = 'low'
-        elif results['spam_score'] <= 50:
-            results['risk_level'] = 'medium'
-        else:
-            results['risk_level'] = 'high'
-
-        # Generate recommendations
+        results['risk_level'] = RISK_LEVELS[self._risk_code(results['spam_score'])]
         results['recommendations'] = self._generate_spam_recommendations(results)
 
         return results
 
-    def _check_keywords(self, content):
-        found_keywords = {'high_risk': [], 'medium_risk': [], 'low_risk': []}
+    def check_many(self, messages, details=False, short_circuit=False):
+        """
+        Score an iterable of messages and return columnar results.
+
+        Messages may be ParsedDocuments, dicts of form fields or tuples (see
+        ParsedDocument.from_message). ``risk_level`` holds indexes into
+        ``risk_levels``; per-message result dicts are only built with ``details``.
+        With ``short_circuit`` (see check_document), obvious spam skips the
+        remaining rules and their hit counts are reported as zero.
+        """
+        rules = self.rules
+        results = {
+            'count': 0,
+            'spam_score': array('i'),
+            'risk_level': array('b'),
+            'risk_levels': RISK_LEVELS,
+            'keyword_hits': {keyword: array('i') for keyword in rules.keyword_forms},
+            'pattern_hits': {pattern: array('i') for pattern in rules.suspicious_patterns},
+            'details': [] if details else None
+        }
+        keyword_columns = list(results['keyword_hits'].values())
+        pattern_columns = [results['pattern_hits'][pattern] for pattern in rules.suspicious_patterns]
+
+        for message in messages:
+            document = ParsedDocument.from_message(message)
+            if details:
+                message_results = self.check_document(document, short_circuit=short_circuit, rules=rules)
+                hit_counts = message_results['keyword_analysis'].get('hit_counts', {})
+                keyword_counts = [hit_counts.get(keyword, 0) for keyword in rules.keyword_forms]
+                rule_hits = message_results['pattern_analysis'].get('rule_hits', {})
+                pattern_counts = [rule_hits.get(pattern, 0) for pattern in rules.suspicious_patterns]
+                spam_score = message_results['spam_score']
+                results['details'].append(message_results)
+            else:
+                spam_score, keyword_counts, pattern_counts = self._score_document(rules, document, short_circuit)
+                keyword_counts = [keyword_counts[slot] for slot in rules.keyword_slots]
+
+            results['spam_score'].append(spam_score)
+            results['risk_level'].append(self._risk_code(spam_score))
+            for column, count in zip(keyword_columns, keyword_counts):
+                column.append(count)
+            for column, count in zip(pattern_columns, pattern_counts):
+                column.append(count)
+            results['count'] += 1
+
+        return results
+
+    def _score_document(self, rules, document, short_circuit=False):
+        # Same score as check_document, without building the per-message report
+        keyword_counts = [0] * len(rules.keyword_scores)
+        pattern_counts = [0] * len(rules.suspicious_patterns)
+
+        spam_score = self._analyze_subject(document.subject)['score']
+        if not short_circuit or spam_score <= HIGH_RISK_SCORE:
+            keyword_counts = rules.keyword_matcher.count(document.normalized)
+            spam_score += sum(score for score, count in zip(rules.keyword_scores, keyword_counts) if count)
+        if not short_circuit or spam_score <= HIGH_RISK_SCORE:
+            pattern_counts = [len(matches) for matches in rules.pattern_set.sweep(document.normalized)]
+            spam_score += sum(pattern_counts) * rules.pattern_weight
+        if not short_circuit or spam_score <= HIGH_RISK_SCORE:
+            spam_score += self._analyze_html(document)['score']
+        return spam_score, keyword_counts, pattern_counts
+
+    def _apply_keywords(self, rules, document, budget, results):
+        keyword_results = self._check_keywords(rules, document.canonicalize(budget), budget)
+        results['keyword_analysis'] = keyword_results
+        results['spam_score'] += keyword_results['score']
+        results['partial'] = results['partial'] or keyword_results['truncated']
+        return sum(keyword_results['hit_counts'].values())
+
+    def _apply_patterns(self, rules, document, budget, results):
+        pattern_results = self._check_patterns(rules, document.canonicalize(budget), budget)
+        results['pattern_analysis'] = pattern_results
+        results['spam_score'] += pattern_results['score']
+        results['partial'] = results['partial'] or pattern_results['truncated']
+        return len(pattern_results['found_patterns'])
+
+    def _apply_html(self, rules, document, budget, results):
+        html_results = self._analyze_html(document, budget)
+        results['spam_score'] += html_results['score']
+        results['issues'].extend(html_results['issues'])
+        results['partial'] = results['partial'] or html_results.get('truncated', False)
+        return len(html_results['issues'])
+
+    def _apply_subject(self, rules, document, budget, results):
+        subject_results = self._analyze_subject(document.subject)
+        results['spam_score'] += subject_results['score']
+        results['issues'].extend(subject_results['issues'])
+        return len(subject_results['issues'])
+
+    def _within_budget(self, rule, budget, results):
+        # Expensive rules are skipped, not failed, once the budget is spent
+        if budget.exhausted():
+            results['partial'] = True
+            results['skipped_rules'].append(rule)
+            return False
+        return True
+
+    def _risk_code(self, spam_score):
+        if spam_score <= 20:
+            return 0
+        elif spam_score <= HIGH_RISK_SCORE:
+            return 1
+        return 2
+
+    def _check_keywords(self, rules, canonical, budget=UNLIMITED):
+        # Match on the canonical text but report offsets into the original content;
+        # counts are exact, offsets capped per keyword as in check_stream
+        keywords = rules.keyword_matcher.stream()
+        keywords.feed(canonical.text, budget)
+        offsets = {
+            form: [canonical.original_offset(offset) for offset in hits]
+            for form, hits in keywords.offsets.items()
+        }
+        return self._keyword_report(rules, offsets, keywords.counts, canonical.truncated or keywords.truncated)
+
+    def _keyword_report(self, rules, offsets, counts, truncated=False):
+        # offsets and counts are per matcher keyword (the normalized forms);
+        # the report names keywords as the pack writes them. Tiers come from
+        # the pack, which may define its own beyond high/medium/low
+        found_keywords = {risk_level: [] for risk_level in rules.spam_keywords}
         score = 0
 
-        for risk_level, keywords in self.spam_keywords.items():
+        for risk_level, keywords in rules.spam_keywords.items():
             for keyword in keywords:
-                if keyword in content:
+                if rules.keyword_forms.get(keyword) in offsets:
                     found_keywords[risk_level].append(keyword)
-                    if risk_level == 'high_risk':
-                        score += 15
-                    elif risk_level == 'medium_risk':
-                        score += 8
-                    else:
-                        score += 3
+                    score += rules.keyword_weights.get(risk_level, DEFAULT_KEYWORD_WEIGHT)
 
         return {
             'found_keywords': found_keywords,
-            'score': score
+            'hit_counts': {
+                keyword: counts[slot] for keyword, slot in zip(rules.keyword_forms, rules.keyword_slots) if counts[slot]
+            },
+            'offsets': {keyword: offsets[form] for keyword, form in rules.keyword_forms.items() if form in offsets},
+            'score': score,
+            'truncated': truncated
         }
 
-    def _check_patterns(self, content):
+    def _check_patterns(self, rules, canonical, budget=UNLIMITED):
+        # A stream reports whether the sweep stopped early, and caps the matched strings kept
+        patterns = rules.pattern_set.stream()
+        patterns.feed(canonical.text, budget)
+        patterns.close(budget)
+        return self._pattern_report(
+            rules, patterns.matches, patterns.counts, canonical.truncated or patterns.truncated
+        )
+
+    def _pattern_report(self, rules, rule_matches, rule_counts, truncated):
         found_patterns = []
         score = 0
 
-        for pattern in self.suspicious_patterns:
-            matches = re.findall(pattern, content, re.IGNORECASE)
-            if matches:
+        for matches, count in zip(rule_matches, rule_counts):
+            if count:
                 found_patterns.extend(matches)
-                score += len(matches) * 5
+                score += count * rules.pattern_weight
 
         return {
             'found_patterns': found_patterns,
-            'score': score
+            'rule_hits': dict(zip(rules.suspicious_patterns, rule_counts)),
+            'score': score,
+            'truncated': truncated
         }
 
-    def _analyze_html(self, html_content):
+    def _analyze_html(self, document, budget=UNLIMITED):
+        html = document.scan_html(budget)
+        if html is None:
+            return {'score': 0, 'issues': []}
+        return self._html_report(html, len(document.html_content))
+
+    def _html_report(self, html, html_length):
         issues = []
         score = 0
 
-        if not html_content:
-            return {'score': 0, 'issues': []}
-
         # Check for excessive links
-        links = re.findall(r'<a[^>]*href', html_content, re.IGNORECASE)
-        if len(links) > 10:
-            issues.append(f"Too many links detected ({len(links)})")
+        if html.link_count > 10:
+            issues.append(f"Too many links detected ({html.link_count})")
             score += 10
 
-        # Check for hidden text patterns
-        hidden_text_patterns = [
-            r'color:\s*white[^;]*background:\s*white',
-            r'color:\s*#ffffff[^;]*background:\s*#ffffff',
-            r'font-size:\s*0',
-            r'display:\s*none'
-        ]
-
-        for pattern in hidden_text_patterns:
-            if re.search(pattern, html_content, re.IGNORECASE):
-                issues.append("Potential hidden text detected")
-                score += 20
-                break
+        # Check for hidden text in inline styles
+        if html.hidden_text:
+            issues.append("Potential hidden text detected")
+            score += 20
 
         # Check for excessive capitalization
-        if html_content.upper() == html_content and len(html_content) > 100:
+        if html.caps_ratio > 0.9 and html_length > 100:
             issues.append("Excessive use of capital letters")
             score += 15
 
         # Check image to text ratio
-        img_count = len(re.findall(r'<img', html_content, re.IGNORECASE))
-        text_content = re.sub(r'<[^>]+>', '', html_content)
-        text_length = len(text_content.strip())
-
-        if img_count > 0 and text_length < 100:
+        if html.image_count > 0 and html.text_length < 100:
             issues.append("Image-heavy content with little text")
             score += 12
 
         return {
             'score': score,
-            'issues': issues
+            'issues': issues,
+            'truncated': html.truncated
         }
 
     def _analyze_subject(self, subject):
@@ -156,7 +418,7 @@ class SpamChecker:
             score += 5
 
         # Check for excessive punctuation
-        punctuation_count = len(re.findall(r'[!?]', subject))
+        punctuation_count = subject.count('!') + subject.count('?')
         if punctuation_count > 2:
             issues.append("Excessive punctuation in subject")
             score += 10
@@ -167,7 +429,7 @@ class SpamChecker:
             score += 15
 
         # Check for numbers at start
-        if re.match(r'^\d+', subject):
+        if subject[:1].isdecimal():
             issues.append("Subject starts with numbers")
             score += 5
 
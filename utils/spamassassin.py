@@ -0,0 +1,485 @@
+"""
+Evaluate SpamAssassin ``.cf`` rule files against a ParsedDocument.
+
+Supported directives are header, body, rawbody, uri, meta, score, describe
+and required_score. Rules that need Perl plugins (``eval:`` tests) or use
+regex syntax Python cannot compile are counted in ``unsupported`` and never
+hit. Conditional blocks (``if``/``ifplugin``) are read as if true.
+"""
+import hashlib
+import os
+import re
+from email.utils import parseaddr
+
+from utils.budget import TimeBudget
+from utils.matchers import PatternSet
+
+DEFAULT_REQUIRED_SCORE = 5.0
+# Score of a rule that has no ``score`` line, as in SpamAssassin
+DEFAULT_RULE_SCORE = 1.0
+
+RULE_TYPES = ('header', 'body', 'rawbody', 'uri', 'meta')
+
+URL_PATTERN = re.compile(r'\bhttps?://[^\s<>"\']+', re.IGNORECASE)
+IF_UNSET_PATTERN = re.compile(r'\s*\[if-unset:\s*([^\]]*)\]\s*$')
+HEADER_TEST_PATTERN = re.compile(r'^(\S+?)\s*(=~|!~)\s*(.+)$')
+# Perl escapes and named groups that need rewriting for Python's re
+PERL_SYNTAX_PATTERN = re.compile(r'\\(?:x\{([0-9a-fA-F]+)\}|k<(\w+)>|(.))|\(\?<(?=[A-Za-z_])', re.DOTALL)
+META_TOKEN_PATTERN = re.compile(r'\s*(?:(\d+(?:\.\d+)?)|(\w+)|(&&|\|\||[<>=!]=|[-+*/()<>!]))')
+
+
+def _convert_perl_syntax(match):
+    code, group_name, escaped = match.groups()
+    if code is not None:
+        return f'\\U{int(code, 16):08x}'
+    if group_name is not None:
+        return f'(?P={group_name})'
+    if escaped is None:
+        return '(?P<'
+    if escaped == 'z':
+        return r'\Z'
+    if escaped == 'Z':
+        return r'(?=\n?\Z)'
+    return match.group()
+
+
+def parse_regex(literal):
+    """Split a Perl ``/pattern/flags`` or ``m{pattern}flags`` literal into ``(pattern, flags)``."""
+    literal = literal.strip()
+    if literal.startswith('m') and len(literal) > 1 and not literal[1].isalnum():
+        literal = literal[1:]
+    if not literal:
+        return None
+    opening = literal[0]
+    closing = {'{': '}', '(': ')', '[': ']', '<': '>'}.get(opening, opening)
+    end = literal.rfind(closing)
+    if end <= 0:
+        return None
+    flags = literal[end + 1:].strip()
+    if any(flag not in 'imsxo' for flag in flags):
+        return None
+    pattern = PERL_SYNTAX_PATTERN.sub(_convert_perl_syntax, literal[1:end])
+    # /o (compile once) has no meaning here
+    return pattern, flags.replace('o', '')
+
+
+def scoped_pattern(pattern, flags):
+    """Apply Perl ``flags`` (and any leading inline flags) to ``pattern`` as one scoped group."""
+    leading = re.match(r'\(\?([imsx]+)\)', pattern)
+    if leading:
+        flags += leading.group(1)
+        pattern = pattern[leading.end():]
+    flags = ''.join(sorted(set(flags)))
+    return f'(?{flags}:{pattern})' if flags else f'(?:{pattern})'
+
+
+class MetaExpression:
+    """Recursive-descent parser for meta rule expressions.
+
+    The expression is compiled into nested closures taking a ``value(name)``
+    function. ``&&`` and ``||`` short-circuit, so sub-rules that cannot
+    change the outcome are never evaluated.
+    """
+
+    def __init__(self, text):
+        self.text = text
+        self.dependencies = set()
+        self._tokens = self._tokenize(text)
+        self._pos = 0
+        self.evaluate = self._or()
+        if self._pos != len(self._tokens):
+            raise ValueError(f"Unexpected '{self._tokens[self._pos][1]}' in meta expression")
+
+    @staticmethod
+    def _tokenize(text):
+        tokens = []
+        pos = 0
+        text = text.rstrip()
+        while pos < len(text):
+            match = META_TOKEN_PATTERN.match(text, pos)
+            if not match or match.end() == pos:
+                raise ValueError(f"Cannot parse meta expression near '{text[pos:pos + 10]}'")
+            number, name, operator = match.groups()
+            if number is not None:
+                tokens.append(('number', float(number)))
+            elif name is not None:
+                tokens.append(('name', name))
+            else:
+                tokens.append(('op', operator))
+            pos = match.end()
+        return tokens
+
+    def __getstate__(self):
+        # Closures cannot be pickled; re-parsing the text is cheap
+        return {'text': self.text}
+
+    def __setstate__(self, state):
+        self.__init__(state['text'])
+
+    def _peek(self):
+        return self._tokens[self._pos] if self._pos < len(self._tokens) else (None, None)
+
+    def _accept(self, *operators):
+        kind, value = self._peek()
+        if kind == 'op' and value in operators:
+            self._pos += 1
+            return value
+        return None
+
+    def _binary(self, operand, operators, apply):
+        left = operand()
+        while True:
+            operator = self._accept(*operators)
+            if operator is None:
+                return left
+            left = apply(operator, left, operand())
+
+    def _or(self):
+        return self._binary(self._and, ('||',), lambda op, a, b: lambda value: 1.0 if a(value) or b(value) else 0.0)
+
+    def _and(self):
+        return self._binary(self._compare, ('&&',),
+                            lambda op, a, b: lambda value: 1.0 if a(value) and b(value) else 0.0)
+
+    def _compare(self):
+        comparisons = {
+            '>': lambda x, y: x > y, '>=': lambda x, y: x >= y, '<': lambda x, y: x < y,
+            '<=': lambda x, y: x <= y, '==': lambda x, y: x == y, '!=': lambda x, y: x != y,
+        }
+        return self._binary(
+            self._sum, tuple(comparisons),
+            lambda op, a, b: lambda value: 1.0 if comparisons[op](a(value), b(value)) else 0.0
+        )
+
+    def _sum(self):
+        return self._binary(
+            self._product, ('+', '-'),
+            lambda op, a, b: (lambda value: a(value) + b(value)) if op == '+' else (lambda value: a(value) - b(value))
+        )
+
+    def _product(self):
+        def apply(op, a, b):
+            if op == '*':
+                return lambda value: a(value) * b(value)
+            return lambda value: a(value) / b(value) if b(value) else 0.0
+        return self._binary(self._unary, ('*', '/'), apply)
+
+    def _unary(self):
+        if self._accept('!'):
+            operand = self._unary()
+            return lambda value: 0.0 if operand(value) else 1.0
+        if self._accept('-'):
+            operand = self._unary()
+            return lambda value: -operand(value)
+        return self._primary()
+
+    def _primary(self):
+        kind, token = self._peek()
+        if kind is None:
+            raise ValueError("Meta expression ends unexpectedly")
+        self._pos += 1
+        if kind == 'number':
+            return lambda value: token
+        if kind == 'name':
+            self.dependencies.add(token)
+            return lambda value: value(token)
+        if token == '(':
+            inner = self._or()
+            if not self._accept(')'):
+                raise ValueError("Missing ')' in meta expression")
+            return inner
+        raise ValueError(f"Unexpected '{token}' in meta expression")
+
+
+class SpamAssassinRule:
+    def __init__(self, name, rule_type, definition):
+        self.name = name
+        self.rule_type = rule_type
+        self.definition = definition
+        self.score = 0.0 if name.startswith('__') else DEFAULT_RULE_SCORE
+        self.description = ''
+        self.regex = None
+        self.pattern = None
+        self.flags = ''
+        self.header_names = None
+        self.header_modifier = None
+        self.negate = False
+        self.exists = False
+        self.if_unset = None
+        self.meta = None
+
+
+class SpamAssassinRules:
+    """A compiled SpamAssassin rule set.
+
+    Body, rawbody and uri rules are compiled into one :class:`PatternSet`
+    per type, so the first time a message needs one of them every rule of
+    that type is searched in a single pass over its text, which ends once
+    all of them have hit. Header and meta rules are evaluated lazily and
+    memoized per message. Meta rules form a dependency DAG (rules on or
+    depending on a cycle are rejected at load time), so each sub-rule runs
+    at most once.
+    """
+
+    def __init__(self, lines, version=None):
+        self.rules = {}
+        self.required_score = DEFAULT_REQUIRED_SCORE
+        self.unsupported = []
+        self.version = version
+
+        scores = {}
+        descriptions = {}
+        for line in lines:
+            self._parse_line(line, scores, descriptions)
+        for name, score in scores.items():
+            if name in self.rules:
+                self.rules[name].score = score
+        for name, description in descriptions.items():
+            if name in self.rules:
+                self.rules[name].description = description
+
+        self._reject_meta_cycles()
+
+        self.batches = {}
+        for rule_type in ('body', 'rawbody', 'uri'):
+            rules = [rule for rule in self.rules.values() if rule.rule_type == rule_type]
+            # Rules the PatternSet cannot fuse are searched one by one in the same sweep
+            self.batches[rule_type] = ([rule.name for rule in rules], PatternSet(rule.regex.pattern for rule in rules))
+
+        self.scored_rules = [
+            name for name, rule in self.rules.items() if rule.score and not name.startswith('__')
+        ]
+
+    @classmethod
+    def load(cls, path):
+        """Load a .cf file, or every .cf file in a directory in name order."""
+        if os.path.isdir(path):
+            paths = [os.path.join(path, name) for name in sorted(os.listdir(path)) if name.endswith('.cf')]
+        else:
+            paths = [path]
+
+        digest = hashlib.sha256()
+        lines = []
+        for file_path in paths:
+            with open(file_path, 'rb') as handle:
+                data = handle.read()
+            digest.update(data)
+            lines.extend(data.decode('utf-8', errors='replace').splitlines())
+        return cls(lines, version=digest.hexdigest()[:16])
+
+    def _parse_line(self, line, scores, descriptions):
+        line = line.strip()
+        if not line or line.startswith('#'):
+            return
+        # Unescaped '#' starts a comment
+        line = re.sub(r'(?<!\\)#.*$', '', line).strip()
+        parts = line.split(None, 2)
+        directive = parts[0].lower()
+
+        if directive == 'required_score' and len(parts) > 1:
+            try:
+                self.required_score = float(parts[1])
+            except ValueError:
+                pass
+        elif directive == 'score' and len(parts) > 2:
+            try:
+                # Score set 0: no Bayes, no network tests
+                scores[parts[1]] = float(parts[2].split()[0])
+            except ValueError:
+                pass
+        elif directive == 'describe' and len(parts) > 2:
+            descriptions[parts[1]] = parts[2]
+        elif directive in RULE_TYPES and len(parts) > 2:
+            rule = SpamAssassinRule(parts[1], directive, parts[2])
+            try:
+                getattr(self, f'_compile_{directive}')(rule)
+            except (ValueError, re.error) as e:
+                self.unsupported.append({'rule': rule.name, 'reason': str(e)})
+                self.rules.pop(rule.name, None)
+                return
+            self.rules[rule.name] = rule
+
+    def _compile_regex(self, rule, literal, extra_flags=''):
+        if literal.startswith('eval:'):
+            raise ValueError("eval: tests need SpamAssassin plugins")
+        parsed = parse_regex(literal)
+        if parsed is None:
+            raise ValueError(f"Cannot parse regex {literal}")
+        rule.pattern, rule.flags = parsed
+        rule.regex = re.compile(scoped_pattern(rule.pattern, rule.flags + extra_flags))
+
+    def _compile_body(self, rule):
+        self._compile_regex(rule, rule.definition)
+
+    _compile_rawbody = _compile_body
+
+    def _compile_uri(self, rule):
+        # uri rules see one URI per line, so anchors apply per URI
+        self._compile_regex(rule, rule.definition, 'm')
+
+    def _compile_header(self, rule):
+        definition = rule.definition
+        if definition.startswith('exists:'):
+            rule.exists = True
+            rule.header_names = [definition[len('exists:'):].strip()]
+            return
+        if definition.startswith('eval:'):
+            raise ValueError("eval: tests need SpamAssassin plugins")
+
+        unset = IF_UNSET_PATTERN.search(definition)
+        if unset:
+            rule.if_unset = unset.group(1)
+            definition = definition[:unset.start()]
+        test = HEADER_TEST_PATTERN.match(definition)
+        if test is None:
+            raise ValueError(f"Cannot parse header test {definition}")
+        header, operator, literal = test.groups()
+        name, _, rule.header_modifier = header.partition(':')
+        rule.header_names = ['To', 'Cc'] if name == 'ToCc' else [name]
+        rule.negate = operator == '!~'
+        self._compile_regex(rule, literal)
+
+    def _compile_meta(self, rule):
+        rule.meta = MetaExpression(rule.definition)
+
+    def _reject_meta_cycles(self):
+        # Every rule on a cycle, or depending on one, ends up 'cyclic'; all of
+        # them are rejected once the whole graph has been visited
+        state = {}
+
+        def visit(name):
+            rule = self.rules.get(name)
+            if rule is None or rule.meta is None:
+                return True
+            if name in state:
+                # Still 'visiting' means the rule is on the current path: a cycle
+                return state[name] == 'done'
+            state[name] = 'visiting'
+            acyclic = all(visit(dependency) for dependency in rule.meta.dependencies)
+            state[name] = 'done' if acyclic else 'cyclic'
+            return acyclic
+
+        for name in list(self.rules):
+            visit(name)
+        for name, result in state.items():
+            if result == 'cyclic':
+                self.unsupported.append({'rule': name, 'reason': 'meta rule dependency cycle'})
+                self.rules.pop(name)
+
+    def check_document(self, document, time_budget=None):
+        return SpamAssassinCheck(self, document, TimeBudget(time_budget)).run()
+
+
+class SpamAssassinCheck:
+    """Evaluation state for one message: memoized rule values and lazily built texts."""
+
+    def __init__(self, rules, document, budget):
+        self.rules = rules
+        self.document = document
+        self.budget = budget
+        self.values = {}
+        self._texts = {}
+        self._hits = {}
+        self.partial = False
+
+    def run(self):
+        hits = []
+        total = 0.0
+        for name in self.rules.scored_rules:
+            if self.value(name):
+                rule = self.rules.rules[name]
+                total += rule.score
+                hits.append({'rule': name, 'score': rule.score, 'description': rule.description})
+        hits.sort(key=lambda hit: -hit['score'])
+        return {
+            'score': round(total, 3),
+            'required_score': self.rules.required_score,
+            'is_spam': total >= self.rules.required_score,
+            'hits': hits,
+            'rules_evaluated': len(self.values),
+            'partial': self.partial,
+            'version': self.rules.version
+        }
+
+    def value(self, name):
+        if name in self.values:
+            return self.values[name]
+        rule = self.rules.rules.get(name)
+        if rule is None:
+            # Undefined rules count as not hit, as in SpamAssassin
+            result = 0.0
+        elif rule.rule_type == 'meta':
+            result = rule.meta.evaluate(self.value)
+        elif rule.rule_type == 'header':
+            result = self._header_value(rule)
+        else:
+            result = self._pattern_value(rule)
+        self.values[name] = result
+        return result
+
+    def _text(self, rule_type):
+        # The HTML is scanned within the budget; text from a scan cut short is
+        # searched as it is and the result is partial
+        if rule_type not in self._texts:
+            document = self.document
+            truncated = False
+            if rule_type == 'body':
+                text, truncated = document.extract_text(self.budget)
+            elif rule_type == 'rawbody':
+                text = f"{document.html_content}\n{document.text_content}"
+            else:
+                html = document.scan_html(self.budget)
+                links = []
+                if html is not None:
+                    links, truncated = html.links, html.truncated
+                text = '\n'.join(links + URL_PATTERN.findall(document.text_content))
+            self.partial = self.partial or truncated
+            self._texts[rule_type] = text
+        return self._texts[rule_type]
+
+    def _pattern_value(self, rule):
+        if rule.rule_type not in self._hits:
+            self._sweep(rule.rule_type)
+        return 1.0 if self._hits[rule.rule_type].get(rule.name) else 0.0
+
+    def _sweep(self, rule_type):
+        # Once the budget is spent the remaining rules count as not hit and
+        # the result is partial
+        names, pattern_set = self.rules.batches[rule_type]
+        hits, truncated = [], True
+        if not self.budget.exhausted():
+            text = self._text(rule_type)
+            if not self.budget.exhausted():
+                hits, truncated = pattern_set.hits(text, self.budget)
+        self.partial = self.partial or truncated
+        self._hits[rule_type] = dict(zip(names, hits))
+
+    def _header_values(self, name):
+        headers = self.document.headers
+        if headers is not None:
+            if name == 'ALL':
+                return [''.join(f"{key}: {value}\n" for key, value in headers.items())]
+            return [str(value) for value in headers.get_all(name, [])]
+        fallback = {'subject': self.document.subject, 'from': self.document.sender_email}
+        if name == 'ALL':
+            return [''.join(f"{key.title()}: {value}\n" for key, value in fallback.items() if value)]
+        value = fallback.get(name.lower())
+        return [value] if value else []
+
+    def _header_value(self, rule):
+        values = []
+        for name in rule.header_names:
+            values.extend(self._header_values(name))
+        if rule.exists:
+            return 1.0 if values else 0.0
+
+        if rule.header_modifier == 'addr':
+            values = [parseaddr(value)[1] for value in values]
+        elif rule.header_modifier == 'name':
+            values = [parseaddr(value)[0] for value in values]
+        if values:
+            text = '\n'.join(values)
+        else:
+            text = rule.if_unset if rule.if_unset is not None else ''
+        matched = rule.regex.search(text) is not None
+        return 1.0 if matched != rule.negate else 0.0
@@ -0,0 +1,423 @@
+"""
+SPF record parsing and include-graph resolution (RFC 7208).
+
+:class:`SPFAnalyzer` follows a domain's ``include:`` and ``redirect=``
+terms and counts the DNS-querying terms against the 10-lookup limit.
+Resolved records are memoized for their TTL and shared by every domain
+that includes them, so a common subtree like ``_spf.google.com`` is walked
+once per TTL rather than once per customer domain.
+"""
+import asyncio
+import ipaddress
+import re
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+# DNS-querying terms allowed in one SPF evaluation (RFC 7208 section 4.6.4)
+MAX_DNS_LOOKUPS = 10
+# Include chains deeper than this already exceed the lookup limit
+MAX_DEPTH = MAX_DNS_LOOKUPS + 1
+
+MECHANISMS = frozenset(('all', 'include', 'a', 'mx', 'ptr', 'ip4', 'ip6', 'exists'))
+LOOKUP_MECHANISMS = frozenset(('include', 'a', 'mx', 'ptr', 'exists'))
+QUALIFIERS = {'+': 'pass', '-': 'fail', '~': 'softfail', '?': 'neutral'}
+
+SPF_VERSION = re.compile(r'v=spf1(\s|$)', re.IGNORECASE)
+MECHANISM_PATTERN = re.compile(r'(?P<kind>[A-Za-z][\w.-]*)(?::(?P<value>[^/]+))?(?:/(?P<cidr4>\d+))?(?://(?P<cidr6>\d+))?')
+MODIFIER_PATTERN = re.compile(r'(?P<name>[A-Za-z][\w.-]*)=(?P<value>.*)')
+
+# ``value`` is the domain-spec or network; ``cidr4``/``cidr6`` are prefix lengths or None
+Mechanism = namedtuple('Mechanism', ['qualifier', 'kind', 'value', 'cidr4', 'cidr6'])
+
+
+class SPFError(ValueError):
+    """An SPF record that does not parse (a permanent error)."""
+
+
+def _check_prefix(prefix, limit, term):
+    if prefix is not None and prefix > limit:
+        raise SPFError(f"Invalid prefix length in '{term}'")
+
+
+def parse_record(record):
+    """Split an SPF record into a list of :data:`Mechanism` and a dict of modifiers."""
+    mechanisms = []
+    modifiers = {}
+    for term in record.split()[1:]:
+        modifier = MODIFIER_PATTERN.fullmatch(term)
+        if modifier:
+            name = modifier.group('name').lower()
+            if name in modifiers and name in ('redirect', 'exp'):
+                raise SPFError(f"Duplicate {name}= modifier")
+            modifiers[name] = modifier.group('value')
+            continue
+
+        qualifier = '+'
+        if term[:1] in QUALIFIERS:
+            qualifier, term = term[0], term[1:]
+        match = MECHANISM_PATTERN.fullmatch(term)
+        kind = match.group('kind').lower() if match else None
+        if kind not in MECHANISMS:
+            raise SPFError(f"Unknown mechanism '{term}'")
+
+        value = match.group('value')
+        cidr4 = int(match.group('cidr4')) if match.group('cidr4') else None
+        cidr6 = int(match.group('cidr6')) if match.group('cidr6') else None
+        if kind in ('ip4', 'ip6'):
+            if value is None or cidr6 is not None:
+                raise SPFError(f"Invalid network in '{term}'")
+            try:
+                network = ipaddress.ip_network(value if cidr4 is None else f"{value}/{cidr4}", strict=False)
+            except ValueError:
+                raise SPFError(f"Invalid network in '{term}'")
+            if network.version != int(kind[-1]):
+                raise SPFError(f"Invalid network in '{term}'")
+            value = str(network.network_address)
+            cidr4, cidr6 = (network.prefixlen, None) if network.version == 4 else (None, network.prefixlen)
+        elif kind in ('include', 'exists') and not value:
+            raise SPFError(f"'{kind}' needs a domain")
+        elif kind == 'all' and (value or cidr4 is not None or cidr6 is not None):
+            raise SPFError(f"Invalid mechanism '{term}'")
+        else:
+            _check_prefix(cidr4, 32, term)
+            _check_prefix(cidr6, 128, term)
+        mechanisms.append(Mechanism(qualifier, kind, value.lower() if value else None, cidr4, cidr6))
+    return mechanisms, modifiers
+
+
+def redirect_target(mechanisms, modifiers):
+    """The redirect= domain, or None; redirect= is ignored when the record has an 'all' mechanism."""
+    if any(mechanism.kind == 'all' for mechanism in mechanisms):
+        return None
+    redirect = modifiers.get('redirect')
+    return redirect.lower() if redirect else None
+
+
+def _followable(domain_spec):
+    # Domain-specs with macros depend on the message being checked
+    return domain_spec is not None and '%' not in domain_spec
+
+
+class SPFNode:
+    """
+    One domain's SPF record with the records it includes or redirects to.
+
+    ``status`` covers the whole subtree: 'ok', 'none' (no SPF record),
+    'permerror' or 'temperror', with the reason in ``error``. ``lookups``
+    is the number of DNS-querying terms an evaluation starting here costs.
+    """
+
+    def __init__(self, domain, status, record=None, mechanisms=(), modifiers=None, children=None, error=None,
+                 expires_at=0.0, cyclic=False):
+        self.domain = domain
+        self.status = status
+        self.record = record
+        self.mechanisms = list(mechanisms)
+        self.modifiers = modifiers or {}
+        self.children = children or {}
+        self.error = error
+        self.expires_at = expires_at
+        # Part of an include loop; such nodes depend on the path and are never memoized
+        self.cyclic = cyclic
+
+        self.lookups = 0
+        for mechanism in self.mechanisms:
+            if mechanism.kind in LOOKUP_MECHANISMS:
+                child = self.children.get(mechanism.value) if mechanism.kind == 'include' else None
+                self.lookups += 1 + (child.lookups if child else 0)
+        if self.redirect:
+            child = self.children.get(self.redirect)
+            self.lookups += 1 + (child.lookups if child else 0)
+        if self.status == 'ok':
+            self._check_subtree()
+
+    @property
+    def redirect(self):
+        return redirect_target(self.mechanisms, self.modifiers)
+
+    @property
+    def all_qualifier(self):
+        """Qualifier of the 'all' that ends evaluation, following redirect=; None if there is none."""
+        for mechanism in self.mechanisms:
+            if mechanism.kind == 'all':
+                return mechanism.qualifier
+        child = self.children.get(self.redirect) if self.redirect else None
+        return child.all_qualifier if child else None
+
+    def _check_subtree(self):
+        for target, child in self.children.items():
+            if child.status == 'none':
+                # An include or redirect target without SPF is a permanent error (RFC 7208 5.2, 6.1)
+                self.status, self.error = 'permerror', f"{target} has no SPF record"
+                return
+            if child.status != 'ok':
+                self.status, self.error = child.status, child.error
+                return
+        if self.lookups > MAX_DNS_LOOKUPS:
+            self.status = 'permerror'
+            self.error = f"{self.lookups} DNS lookups needed, receivers stop at {MAX_DNS_LOOKUPS}"
+
+    def as_dict(self):
+        return {
+            'domain': self.domain,
+            'status': self.status,
+            'record': self.record,
+            'lookups': self.lookups,
+            'error': self.error,
+            'includes': [child.as_dict() for child in self.children.values()]
+        }
+
+
+class SPFAuthorizer:
+    """
+    A domain's flattened SPF networks in a binary prefix trie per address family.
+
+    Every ``ip4``/``ip6``/``a``/``mx``/``all`` term, including those reached
+    through ``include:`` and ``redirect=``, becomes a network tagged with its
+    position in evaluation order (a tuple of mechanism indexes, one per
+    include level) and the qualifiers along that path. :meth:`check` walks
+    the trie once per address, collects the matching terms and applies
+    ``check_host`` first-match semantics to them, so a batch of IPs costs
+    O(address bits) each instead of a full walk of the record.
+
+    Terms that depend on the connection (``ptr``, ``exists``, macros) are
+    listed in ``unresolved`` and treated as not matching.
+    """
+
+    def __init__(self, domain, status='ok', error=None, expires_at=0.0):
+        self.domain = domain
+        self.status = status
+        self.error = error
+        self.expires_at = expires_at
+        self.unresolved = []
+        # Trie nodes are [child for bit 0, child for bit 1, matching terms]
+        self._tries = {4: [None, None, []], 6: [None, None, []]}
+
+    def add(self, network, key, qualifiers):
+        node = self._tries[network.version]
+        bits = network.max_prefixlen
+        address = int(network.network_address)
+        for depth in range(network.prefixlen):
+            bit = (address >> (bits - 1 - depth)) & 1
+            if node[bit] is None:
+                node[bit] = [None, None, []]
+            node = node[bit]
+        node[2].append((key, qualifiers))
+
+    def fail_lookup(self, query):
+        self.status = 'temperror'
+        self.error = f"DNS lookup failed: {query}"
+
+    def check(self, ip):
+        """The SPF result for ``ip``: 'pass', 'fail', 'softfail', 'neutral' or the record's error status."""
+        if self.status != 'ok':
+            return self.status
+        address = ipaddress.ip_address(ip)
+        node = self._tries[address.version]
+        bits = address.max_prefixlen
+        value = int(address)
+        matches = list(node[2])
+        for depth in range(bits):
+            node = node[(value >> (bits - 1 - depth)) & 1]
+            if node is None:
+                break
+            matches.extend(node[2])
+        return _first_match(matches)
+
+    def check_many(self, ips):
+        return {str(ip): self.check(ip) for ip in ips}
+
+
+def _first_match(matches):
+    # Outer key is the evaluation order; an include whose inner result is
+    # not 'pass' does not match, so the rest of its terms are skipped
+    closed = set()
+    for key, qualifiers in sorted(matches):
+        if any(key[:length] in closed for length in range(1, len(key))):
+            continue
+        result = QUALIFIERS[qualifiers[-1]]
+        for level in range(len(key) - 2, -1, -1):
+            if qualifiers[level] is None:
+                # redirect=: the target's result is the record's result
+                continue
+            if result != 'pass':
+                closed.add(key[:level + 1])
+                break
+            result = QUALIFIERS[qualifiers[level]]
+        else:
+            return result
+    return 'neutral'
+
+
+class SPFAnalyzer:
+    """Resolves SPF include graphs through an :class:`~utils.dns_resolver.AsyncDNSResolver`.
+
+    Nodes are memoized per domain until the shortest TTL in their subtree
+    expires. Lookup failures (temperror) and include loops are not memoized.
+    """
+
+    def __init__(self, resolver, max_size=10000):
+        self.resolver = resolver
+        self.max_size = max_size
+        self._nodes = OrderedDict()
+        # Compiled SPFAuthorizer tries, keyed by domain like the nodes
+        self._authorizers = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    async def resolve(self, domain):
+        """Return the :class:`SPFNode` for ``domain``."""
+        return await self._resolve(domain.rstrip('.').lower(), ())
+
+    def _cached(self, table, domain):
+        now = time.monotonic()
+        with self._lock:
+            entry = table.get(domain)
+            if entry is not None:
+                if entry.expires_at > now:
+                    table.move_to_end(domain)
+                    self.hits += 1
+                    return entry
+                del table[domain]
+            self.misses += 1
+            return None
+
+    def _store(self, table, entry):
+        with self._lock:
+            table[entry.domain] = entry
+            table.move_to_end(entry.domain)
+            while len(table) > self.max_size:
+                table.popitem(last=False)
+
+    async def _resolve(self, domain, path):
+        if domain in path:
+            return SPFNode(domain, 'permerror', error=f"include loop through {domain}", cyclic=True)
+        node = self._cached(self._nodes, domain)
+        if node is not None:
+            return node
+        if len(path) >= MAX_DEPTH:
+            return SPFNode(domain, 'permerror', error='includes nested too deeply', cyclic=True)
+
+        answer = await self.resolver.query(domain, 'TXT')
+        if answer.status == 'error':
+            return SPFNode(domain, 'temperror', error=f"DNS lookup for {domain} failed")
+
+        expires_at = time.monotonic() + answer.ttl
+        records = [record for record in answer.records if SPF_VERSION.match(record)]
+        if not records:
+            node = SPFNode(domain, 'none', expires_at=expires_at)
+        elif len(records) > 1:
+            node = SPFNode(domain, 'permerror', records[0], error='multiple SPF records', expires_at=expires_at)
+        else:
+            node = await self._resolve_record(domain, records[0], path, expires_at)
+
+        if not node.cyclic and node.status != 'temperror':
+            self._store(self._nodes, node)
+        return node
+
+    async def _resolve_record(self, domain, record, path, expires_at):
+        try:
+            mechanisms, modifiers = parse_record(record)
+        except SPFError as e:
+            return SPFNode(domain, 'permerror', record, error=str(e), expires_at=expires_at)
+
+        targets = [mechanism.value for mechanism in mechanisms
+                   if mechanism.kind == 'include' and _followable(mechanism.value)]
+        redirect = redirect_target(mechanisms, modifiers)
+        if _followable(redirect):
+            targets.append(redirect)
+        targets = list(dict.fromkeys(targets))
+
+        path = path + (domain,)
+        resolved = await asyncio.gather(*(self._resolve(target, path) for target in targets))
+        children = dict(zip(targets, resolved))
+        return SPFNode(
+            domain, 'ok', record, mechanisms, modifiers, children,
+            expires_at=min([expires_at] + [child.expires_at for child in resolved]),
+            cyclic=any(child.cyclic for child in resolved)
+        )
+
+    async def compile(self, domain):
+        """Return the :class:`SPFAuthorizer` for ``domain``, resolving its a/mx terms to networks."""
+        domain = domain.rstrip('.').lower()
+        authorizer = self._cached(self._authorizers, domain)
+        if authorizer is not None:
+            return authorizer
+
+        node = await self.resolve(domain)
+        authorizer = SPFAuthorizer(domain, node.status, node.error, node.expires_at)
+        if node.status == 'ok':
+            await self._compile_node(node, (), (), authorizer)
+        if authorizer.status != 'temperror' and not node.cyclic:
+            self._store(self._authorizers, authorizer)
+        return authorizer
+
+    async def authorize_many(self, domain, ips):
+        """Map each of ``ips`` to its SPF result for ``domain`` ('pass', 'fail', ...)."""
+        authorizer = await self.compile(domain)
+        return authorizer.check_many(ips)
+
+    async def _compile_node(self, node, key, qualifiers, authorizer):
+        lookups = []
+        for index, mechanism in enumerate(node.mechanisms):
+            entry_key = key + (index,)
+            entry_qualifiers = qualifiers + (mechanism.qualifier,)
+            if mechanism.kind in ('ip4', 'ip6'):
+                prefix = mechanism.cidr4 if mechanism.kind == 'ip4' else mechanism.cidr6
+                authorizer.add(ipaddress.ip_network(f"{mechanism.value}/{prefix}"), entry_key, entry_qualifiers)
+            elif mechanism.kind == 'all':
+                authorizer.add(ipaddress.ip_network('0.0.0.0/0'), entry_key, entry_qualifiers)
+                authorizer.add(ipaddress.ip_network('::/0'), entry_key, entry_qualifiers)
+            elif mechanism.kind in ('a', 'mx') and _followable(mechanism.value or node.domain):
+                lookups.append(self._compile_hosts(
+                    mechanism, mechanism.value or node.domain, entry_key, entry_qualifiers, authorizer
+                ))
+            elif mechanism.kind == 'include' and mechanism.value in node.children:
+                lookups.append(self._compile_node(
+                    node.children[mechanism.value], entry_key, entry_qualifiers, authorizer
+                ))
+            else:
+                # ptr, exists and macro domain-specs depend on the connection being checked
+                authorizer.unresolved.append(f"{mechanism.qualifier}{mechanism.kind}:{mechanism.value or node.domain}")
+        if node.redirect in node.children:
+            # Evaluated after every mechanism, and its result is the record's result
+            lookups.append(self._compile_node(
+                node.children[node.redirect], key + (len(node.mechanisms),), qualifiers + (None,), authorizer
+            ))
+        await asyncio.gather(*lookups)
+
+    async def _compile_hosts(self, mechanism, domain, key, qualifiers, authorizer):
+        hosts = [domain]
+        if mechanism.kind == 'mx':
+            answer = await self.resolver.query(domain, 'MX')
+            if answer.status == 'error':
+                authorizer.fail_lookup(f"MX {domain}")
+                return
+            # Only the first 10 MX hosts are looked up (RFC 7208 section 4.6.4)
+            hosts = [exchange for _, exchange in sorted(answer.records)][:MAX_DNS_LOOKUPS]
+
+        queries = [(host, rdtype) for host in hosts for rdtype in ('A', 'AAAA')]
+        answers = await asyncio.gather(*(self.resolver.query(host, rdtype) for host, rdtype in queries))
+        for (host, rdtype), answer in zip(queries, answers):
+            if answer.status == 'error':
+                authorizer.fail_lookup(f"{rdtype} {host}")
+                continue
+            prefix = mechanism.cidr4 if rdtype == 'A' else mechanism.cidr6
+            for address in answer.records:
+                network = ipaddress.ip_network(address if prefix is None else f"{address}/{prefix}", strict=False)
+                authorizer.add(network, key, qualifiers)
+            if answer.records:
+                authorizer.expires_at = min(authorizer.expires_at, time.monotonic() + answer.ttl)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'size': len(self._nodes),
+                'compiled': len(self._authorizers)
+            }
@@ -0,0 +1,62 @@
+import codecs
+
+CHUNK_SIZE = 64 * 1024
+
+
+def iter_text_chunks(source, chunk_size=CHUNK_SIZE, encoding='utf-8'):
+    """Yield ``source`` as text chunks of at most ``chunk_size`` characters.
+
+    ``source`` may be ``None``, a str, bytes-like data, a binary or text file
+    object, or an iterable of str/bytes chunks. Binary input is read into one
+    reused buffer and decoded incrementally, so a multi-byte character split
+    across reads is handled and no full-size copy of the input is made.
+    """
+    if source is None:
+        return
+
+    if isinstance(source, str):
+        for start in range(0, len(source), chunk_size):
+            yield source[start:start + chunk_size]
+        return
+
+    decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        view = memoryview(source).cast('B')
+        for start in range(0, len(view), chunk_size):
+            text = decoder.decode(view[start:start + chunk_size])
+            if text:
+                yield text
+    elif hasattr(source, 'readinto'):
+        buffer = bytearray(chunk_size)
+        view = memoryview(buffer)
+        while True:
+            size = source.readinto(buffer)
+            if not size:
+                break
+            text = decoder.decode(view[:size])
+            if text:
+                yield text
+    elif hasattr(source, 'read'):
+        while True:
+            chunk = source.read(chunk_size)
+            if not chunk:
+                break
+            if isinstance(chunk, str):
+                yield chunk
+            else:
+                text = decoder.decode(chunk)
+                if text:
+                    yield text
+    else:
+        for chunk in source:
+            if isinstance(chunk, str):
+                yield chunk
+            else:
+                text = decoder.decode(chunk)
+                if text:
+                    yield text
+
+    tail = decoder.decode(b'', final=True)
+    if tail:
+        yield tail
@@ -0,0 +1,92 @@
+import threading
+from collections import OrderedDict
+
+
+class TenantRulePacks:
+    """Rule packs with per-tenant keyword overlays merged in, compiled once and cached.
+
+    ``base`` is a RulePack or RulePackManager. Entries are keyed by tenant,
+    base pack version and overlay versions, so editing an overlay (which
+    bumps its version) or reloading the base pack moves the tenant onto a
+    fresh entry; stale entries age out of the LRU or are dropped with
+    :meth:`invalidate`. Merged packs get their own version hash, so cached
+    analysis results never mix tenants.
+    """
+
+    def __init__(self, base, overlay_model=None, max_size=256):
+        self.base = base
+        self.overlay_model = overlay_model
+        self.max_size = max_size
+        self._packs = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, tenant, overlays):
+        """
+        Return the base pack merged with ``overlays``.
+
+        ``overlays`` is a list of ``(version_key, keywords)`` pairs applied in
+        order, where ``keywords`` maps risk tiers to extra phrases.
+        """
+        base = self.base.current
+        overlays = [(version_key, keywords) for version_key, keywords in overlays if keywords]
+        if not overlays:
+            return base
+
+        key = (tenant, base.version, tuple(version_key for version_key, _ in overlays))
+        with self._lock:
+            pack = self._packs.get(key)
+            if pack is not None:
+                self._packs.move_to_end(key)
+                self.hits += 1
+                return pack
+            self.misses += 1
+
+        # Compile outside the lock; two threads may race to build the same
+        # pack, which is harmless since the results are identical
+        merged = {}
+        for _, keywords in overlays:
+            for risk_level, phrases in keywords.items():
+                merged.setdefault(risk_level, []).extend(phrases)
+        pack = base.with_keywords(merged, name=f"{base.name}+{tenant}")
+
+        with self._lock:
+            self._packs[key] = pack
+            self._packs.move_to_end(key)
+            while len(self._packs) > self.max_size:
+                self._packs.popitem(last=False)
+        return pack
+
+    def for_user(self, user):
+        """The pack for ``user``: base rules plus their plan's overlay and their own."""
+        if self.overlay_model is None:
+            return self.base.current
+        model = self.overlay_model
+        try:
+            rows = model.query.filter((model.plan == user.plan) | (model.user_id == user.id)).all()
+        except Exception as e:
+            # E.g. the overlay table is missing; the base rules still apply
+            model.query.session.rollback()
+            print(f"Keyword overlay read error: {str(e)}")
+            return self.base.current
+        # Plan overlay first, then the user's own
+        rows.sort(key=lambda row: row.user_id is not None)
+        overlays = [((row.id, row.version), row.get_keywords()) for row in rows]
+        return self.get(user.id, overlays)
+
+    def invalidate(self, tenant=None):
+        """Drop cached packs for ``tenant``, or for everyone."""
+        with self._lock:
+            for key in [key for key in self._packs if tenant is None or key[0] == tenant]:
+                del self._packs[key]
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 4) if total else 0.0,
+                'size': len(self._packs)
+            }